@@ -1,10 +1,84 @@
 import argparse
-from gymie.server import start
+from gymie.server import start, BACKENDS
+from gymie.codec import codecs
+from gymie.outbox import POLICIES
 
-if __name__ == '__main__':
+def main(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('-l', '--host', default='0.0.0.0')
     parser.add_argument('-p', '--port', default=5000, type=int)
-    args = parser.parse_args()
+    parser.add_argument('-b', '--backend', default='eventlet', choices=BACKENDS)
+    parser.add_argument('--env-workers', action='store_true', 
+                        help='run each environment in its own subprocess')
+    parser.add_argument('--pool-size', default=0, type=int,
+                        help='number of ready environments kept per env id')
+    parser.add_argument('--prewarm', action='append', metavar='ENV_ID',
+                        help='fill the pool of this env id at startup')
+    parser.add_argument('--max-instances', type=int,
+                        help='maximum number of instances alive at the same time')
+    parser.add_argument('--idle-ttl', type=float, metavar='SECONDS',
+                        help='close instances unused for longer than this')
+    parser.add_argument('--max-rollout', type=int, default=10000, metavar='STEPS',
+                        help='maximum number of steps of a single rollout request (default: 10000)')
+    parser.add_argument('--profile', action='store_true',
+                        help='time the phases of every request and report them periodically')
+    parser.add_argument('--profile-interval', default=10, type=float, metavar='SECONDS',
+                        help='seconds between profile reports')
+    parser.add_argument('--profile-trace', metavar='PATH',
+                        help='write the profile to this file in Chrome trace-event format')
+    parser.add_argument('--json-codec', default='json', choices=list(codecs),
+                        help='codec of JSON messages; orjson is faster but needs the orjson package')
+    parser.add_argument('--shard', action='append', metavar='HOST:PORT',
+                        help='run as a gateway spreading instances across these Gymie servers')
+    parser.add_argument('--shard-strategy', default='least-loaded', choices=['least-loaded', 'hash'],
+                        help='how the gateway chooses the server of a new instance')
+    parser.add_argument('--workers', default=1, type=int, metavar='N',
+                        help='number of server processes sharing the port, restarted if they crash')
+    parser.add_argument('--snapshot-capacity', default=1024, type=int, metavar='N',
+                        help='snapshots taken by clone_state kept in memory, least recently used out')
+    parser.add_argument('--snapshot-spill', metavar='DIR',
+                        help='directory where snapshots evicted from memory are written')
+    parser.add_argument('--record-dir', default='recordings', metavar='DIR',
+                        help='directory where instances made with `record` are recorded')
+    parser.add_argument('--record-chunk', default=1024, type=int, metavar='ROWS',
+                        help='rows preallocated in each shard of a recording')
+    parser.add_argument('--send-queue', type=int, metavar='BYTES',
+                        help='bytes each connection can have waiting to be sent to the client')
+    parser.add_argument('--send-policy', default='block', choices=POLICIES,
+                        help='what happens when a send queue is full: block the sender, '
+                             'drop render frames or disconnect the client')
+    parser.add_argument('--env-backend', default='gym', metavar='NAME',
+                        help='backend of the environments made without one: gym, retro, unity '
+                             'or any installed through the gymie.backends entry point')
+    parser.add_argument('--slots', type=int, default=None, metavar='N',
+                        help='requests of all the clients served at the same time, '
+                             'shared fairly by priority (default: unlimited)')
+    args = parser.parse_args(argv)
+
+    start(args.host, 
+          args.port, 
+          env_workers=args.env_workers, 
+          pool_size=args.pool_size, 
+          prewarm=args.prewarm,
+          max_instances=args.max_instances,
+          idle_ttl=args.idle_ttl,
+          backend=args.backend,
+          profile=args.profile,
+          profile_interval=args.profile_interval,
+          profile_trace=args.profile_trace,
+          json_codec=args.json_codec,
+          shards=args.shard,
+          shard_strategy=args.shard_strategy,
+          server_workers=args.workers,
+          snapshot_capacity=args.snapshot_capacity,
+          snapshot_spill=args.snapshot_spill,
+          record_dir=args.record_dir,
+          record_chunk=args.record_chunk,
+          send_queue=args.send_queue,
+          send_policy=args.send_policy,
+          env_backend=args.env_backend,
+          scheduler_slots=args.slots,
+          max_rollout=args.max_rollout)
 
-    start(args.host, args.port)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+import os
+import asyncio
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from gymie import api, metrics, profiler, rfc6455, scheduler
+from gymie.api import disconnect
+from gymie.outbox import Outbox
+from gymie.protocol import lane_key, decode, call
+
+
+#########################################
+# asyncio WebSocket Server and Handlers #
+#########################################
+
+# Executor where API methods run, so blocking env calls
+# don't stop the event loop. None means asyncio's default
+executor = None
+
+
+class AsyncSocket():
+    """WebSocket connection served by asyncio. API methods run in the
+    executor, so `send` and `close` are thread-safe and, from there,
+    wait until the frame has been handed over to the transport
+
+    Args:
+        reader (StreamReader): stream to read from
+        writer (StreamWriter): stream to write to
+        loop (AbstractEventLoop): loop serving the connection
+    """
+
+    def __init__(self, reader, writer, loop):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.closed = False
+
+    async def wait(self):
+        """Waits for the next message of the client, answering pings
+
+        Returns:
+            Message (str for text, bytes for binary), or None
+            if the connection is closed
+        """
+        fragments = []
+        message_opcode = None
+
+        while not self.closed:
+            try:
+                header = await self.reader.readexactly(2)
+                fin, opcode, masked, length = rfc6455.parse_header(header)
+
+                if length == 126:
+                    (length,) = struct.unpack('!H', await self.reader.readexactly(2))
+                elif length == 127:
+                    (length,) = struct.unpack('!Q', await self.reader.readexactly(8))
+
+                if length > rfc6455.MAX_MESSAGE_LENGTH:
+                    await self.write_close((1009, 'Message too big'))
+                    return None
+
+                key = await self.reader.readexactly(4) if masked else None
+                payload = await self.reader.readexactly(length)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.closed = True
+                return None
+
+            if key:
+                payload = rfc6455.mask(payload, key)
+
+            if opcode == rfc6455.CLOSE:
+                await self.write_close(rfc6455.parse_close(payload))
+                return None
+            elif opcode == rfc6455.PING:
+                await self.write(rfc6455.pack_frame(payload, rfc6455.PONG))
+                continue
+            elif opcode == rfc6455.PONG:
+                continue
+
+            if opcode != rfc6455.CONTINUATION:
+                message_opcode = opcode
+            fragments.append(payload)
+
+            if fin:
+                message = b''.join(fragments)
+                if message_opcode == rfc6455.TEXT:
+                    return message.decode('utf-8')
+                return message
+
+        return None
+
+    async def write(self, frame):
+        """Writes a frame, waiting if the transport buffer is full
+
+        Args:
+            frame (bytes): frame to write
+        """
+        if not self.closed:
+            self.writer.write(frame)
+            await self.writer.drain()
+
+    async def write_close(self, close_data=None):
+        """Sends a close frame and closes the transport
+
+        Args:
+            close_data (tuple(int, str)): optional; status code and reason
+        """
+        if self.closed:
+            return
+
+        payload = rfc6455.pack_close(close_data)
+        self.writer.write(rfc6455.pack_frame(payload, rfc6455.CLOSE))
+        self.closed = True
+
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.writer.close()
+
+    def run(self, coroutine):
+        """Runs a coroutine in the loop of the connection. From the executor
+        it waits until it's done, from the loop itself it's just scheduled
+
+        Args:
+            coroutine: coroutine to run
+        """
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is self.loop:
+            asyncio.ensure_future(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def send(self, message):
+        """Sends a message to the client
+
+        Args:
+            message (str|bytes): text or binary message
+        """
+        self.run(self.write(rfc6455.pack_frame(message)))
+
+    def close(self, close_data=None):
+        """Closes the connection
+
+        Args:
+            close_data (tuple(int, str)): optional; status code and reason
+        """
+        self.run(self.write_close(close_data))
+
+
+class Lanes():
+    """Runs the requests of a connection concurrently, see `lane_key`.
+    Each lane is served in order by its own task, which waits for its
+    turn in `gymie.scheduler`, runs the API methods in the executor
+    and exits once the lane is empty
+
+    Args:
+        ws (AsyncSocket): socket for communication with the client
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.queues = {}
+        self.tasks = set()
+
+    def submit(self, data):
+        """Queues a request in its lane
+
+        Args:
+            data (dict): decoded request
+        """
+        key = lane_key(data)
+
+        if key in self.queues:
+            self.queues[key].append(data)
+        else:
+            self.queues[key] = deque([data])
+            task = asyncio.ensure_future(self.drain(key))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def drain(self, key):
+        """Serves the requests of a lane until it's empty
+
+        Args:
+            key (str): lane key, the instance id or None
+        """
+        queue = self.queues[key]
+        loop = asyncio.get_event_loop()
+
+        while queue:
+            current = await scheduler.async_turn(self.ws)
+            try:
+                await loop.run_in_executor(executor, call, self.ws, queue.popleft())
+            finally:
+                if current is not None:
+                    current.release()
+        del self.queues[key]
+
+    async def wait(self):
+        """Waits until all the lanes are empty"""
+        if self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+
+async def gym_handle(ws):
+    """This function handles socket communication
+
+    Args:
+        ws (AsyncSocket): socket for communication with the client
+    """
+    outbox = Outbox(ws)
+    lanes = Lanes(outbox)
+    loop = asyncio.get_event_loop()
+
+    try:
+        while True:
+            message = await ws.wait()
+            if message is None:
+                break
+
+            # Decoding errors close the socket from the event loop,
+            # which must never wait for room in the send queue
+            data = decode(ws, message)
+            if data is not None:
+                lanes.submit(data)
+    finally:
+        await lanes.wait()
+        await loop.run_in_executor(executor, disconnect, outbox)
+        outbox.finish()
+
+async def read_request(reader):
+    """Reads the request line and headers of an HTTP request
+
+    Args:
+        reader (StreamReader): stream to read from
+
+    Returns:
+        Tuple with the path and a dictionary of lowercase headers
+    """
+    request_line = (await reader.readline()).decode('latin-1').split()
+    headers = {}
+
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    path = request_line[1] if len(request_line) > 1 else '/'
+    return path.split('?')[0], headers
+
+def respond(writer, status, body, content_type='text/plain'):
+    """Writes a plain HTTP response
+
+    Args:
+        writer (StreamWriter): stream to write to
+        status (str): status line, e.g. `200 OK`
+        body (str): response body
+        content_type (str): optional; content type of the body
+    """
+    body = body.encode('utf-8')
+    writer.write('HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+                 .format(status, content_type, len(body)).encode('latin-1') + body)
+
+async def dispatch(reader, writer):
+    """asyncio server callback, the equivalent of the WSGI application
+
+    Args:
+        reader (StreamReader): stream to read from
+        writer (StreamWriter): stream to write to
+    """
+    try:
+        path, headers = await read_request(reader)
+    except (ConnectionError, UnicodeDecodeError):
+        writer.close()
+        return
+
+    is_upgrade = headers.get('upgrade', '').lower() == 'websocket'
+
+    if path == '/gym' and is_upgrade and 'sec-websocket-key' in headers:
+        accept = rfc6455.accept_key(headers['sec-websocket-key'])
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\n'
+                      'Upgrade: websocket\r\n'
+                      'Connection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: {}\r\n\r\n').format(accept).encode('latin-1'))
+
+        ws = AsyncSocket(reader, writer, asyncio.get_event_loop())
+        try:
+            await gym_handle(ws)
+        finally:
+            await ws.write_close()
+    else:
+        if path == '/metrics':
+            respond(writer, '200 OK', metrics.render(), metrics.CONTENT_TYPE)
+        else:
+            respond(writer, '200 OK', 'Gymie is running...')
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+async def reap(interval):
+    """Periodically closes the instances that have been idle for too long
+
+    Args:
+        interval (float): seconds between checks
+    """
+    loop = asyncio.get_event_loop()
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(executor, api.evict_idle)
+        except Exception as err:
+            print(f'Error evicting idle instances: {err}')
+
+async def report(interval):
+    """Periodically prints the profile of the requests, if any
+
+    Args:
+        interval (float): seconds between reports
+    """
+    loop = asyncio.get_event_loop()
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(executor, profiler.report)
+        except Exception as err:
+            print(f'Error reporting profile: {err}')
+
+async def serve(host, port, reap_interval=None, profile_interval=None, reuse_port=False):
+    """Serves the API until cancelled
+
+    Args:
+        host (str): host to listen on
+        port (int): port to listen on
+        reap_interval (float): optional; seconds between idle instance checks
+        profile_interval (float): optional; seconds between profile reports
+        reuse_port (bool): optional; whether the port is shared with other workers
+    """
+    server = await asyncio.start_server(dispatch, host, port, reuse_port=reuse_port or None)
+    print(f'({os.getpid()}) asyncio starting up on http://{host}:{port}')
+
+    if reap_interval:
+        asyncio.ensure_future(reap(reap_interval))
+
+    if profile_interval:
+        asyncio.ensure_future(report(profile_interval))
+
+    async with server:
+        await server.serve_forever()
+
+def start(host='0.0.0.0', port=5000, reap_interval=None, threads=None, profile_interval=None, reuse_port=False):
+    """Starts the asyncio server
+
+    Args:
+        host (str): default value '0.0.0.0'
+        port (int): default value 5000
+        reap_interval (float): optional; seconds between idle instance checks
+        threads (int): optional; number of threads running API methods
+        profile_interval (float): optional; seconds between profile reports
+        reuse_port (bool): optional; whether the port is shared with other workers
+    """
+    global executor
+    executor = ThreadPoolExecutor(max_workers=threads)
+
+    try:
+        asyncio.run(serve(host, port, reap_interval, profile_interval, reuse_port))
+    except OSError as err:
+        print(f'Address http://{host}:{port} already in use')
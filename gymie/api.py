@@ -1,12 +1,45 @@
-import gym
-import json
+import time
 import uuid
 import numpy as np
+from collections import OrderedDict
+from gymie import autoreset, backends, binary, codec, metrics, pool, preprocessing, profiler, recording, rendering, replay, scheduler, schema, shm, snapshots, workers
 from gymie.exceptions import *
 
 
-# Dictionary containing a list of pairs unique-id/environment
-envs = {}
+# Dictionary containing a list of pairs unique-id/environment,
+# ordered from least to most recently used
+envs = OrderedDict()
+
+# Socket that created each instance, keyed by instance id
+owners = {}
+
+# Last time each instance was used, keyed by instance id
+last_used = {}
+
+# Environment id of each instance, keyed by instance id
+env_ids = {}
+
+# Space schemas of each instance, already in JSON, keyed by instance id
+schemas = {}
+
+# Action decoder of each instance, see `gymie.schema`, keyed by instance id
+decoders = {}
+
+# Per-connection options, such as the wire encoding
+# and the instances it owns, keyed by socket
+connections = {}
+
+# Maximum number of instances alive at the same time. None means no limit
+max_instances = None
+
+# Seconds an instance can stay unused before being closed. None means forever
+idle_ttl = None
+
+# Maximum number of steps of a single rollout, so one request can't hold its lane forever
+max_rollout = 10000
+
+# Encodings a connection can negotiate. JSON is the default one
+ENCODINGS = ['json', 'binary']
 
 # Exposed API accessible via string key
 public = {}
@@ -31,9 +64,11 @@ def override(func_name):
     such as Unity ML-Agents or Gym Retro.
     
     Currently there are two functions to override:
-    1. get_env: instantiates a Gym environment
+    1. get_env: instantiates the environments made without a `backend`
     2. process_step: does some processing of the environment step
 
+    Several backends can also be served side by side, see `gymie.backends`
+
     Args:
         func_name (str): function to override
     
@@ -54,12 +89,14 @@ def override(func_name):
 # API logic #
 #############
 
-def get_env(env_id, seed=None):
-    """Instantiates a Gym environment
+def get_env(env_id, **kwargs):
+    """Instantiates an environment with the default backend, Gym
+    unless the server was started with another one
     
     Args:
         env_id (str): environment id
         seed (int): optional; initial seed for randomnes
+        **kwargs: extra arguments for the backend
     
     Returns:
         Gym environment
@@ -68,17 +105,50 @@ def get_env(env_id, seed=None):
         EnvironmentNotFound: environment env_id does not exist
         EnvironmentMalformed: env_id is not correct
     """
-    try:
-        env = gym.make(env_id)
-    except gym.error.UnregisteredEnv:
-        raise EnvironmentNotFound(env_id)
-    except gym.error.Error:
-        raise EnvironmentMalformed(env_id)
+    return backends.make(backends.default, env_id, **kwargs)
+
+def build_env(env_id, preprocess=None, backend=None, **kwargs):
+    """Instantiates an environment and wraps it
+    with the preprocessing pipeline, if any
+    
+    Args:
+        env_id (str): environment id
+        preprocess (list(dict)): optional; preprocessing stages
+        backend (str): optional; backend that instantiates the environment,
+            see `gymie.backends`. `get_env` is used if not given
+        **kwargs: extra arguments for the backend
+    
+    Returns:
+        Gym environment
+    """
+    if backend is None:
+        env = get_env(env_id, **kwargs)
     else:
-        if seed: 
-            env.seed(seed)
-        
-        return env
+        env = backends.make(backend, env_id, **kwargs)
+
+    if preprocess:
+        try:
+            env = preprocessing.apply(env, preprocess)
+        except:
+            env.close()
+            raise
+    
+    return env
+
+def new_env(env_id, **kwargs):
+    """Builds a new environment, either in this process
+    or in a worker subprocess if env workers are enabled
+    
+    Args:
+        env_id (str): environment id
+        **kwargs: extra arguments for `build_env`
+    
+    Returns:
+        Gym environment
+    """
+    if workers.enabled:
+        return workers.WorkerEnv(env_id, **kwargs)
+    return build_env(env_id, **kwargs)
 
 def process_step(step):
     """Does some processing of the step
@@ -88,10 +158,158 @@ def process_step(step):
             returns by environment.step method
     
     Returns:
-        Processed step
+        Processed step. The observation is converted into a list
+        or sent as raw buffer depending on the connection's encoding
+    """
+    return step
+
+def to_list(value):
+    """Converts numpy arrays and scalars into JSON serializable values
+
+    Args:
+        value (np.array|number|list): value to convert
+
+    Returns:
+        Python list or number
+    """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+def stack(observations):
+    """Stacks observations into a single array when possible
+
+    Args:
+        observations (list): observations coming from different environments
+
+    Returns:
+        np.array with an extra leading dimension if all the observations
+        share shape and dtype, otherwise the list of observations
+    """
+    arrays = [np.asarray(observation) for observation in observations]
+    if len({(array.shape, array.dtype) for array in arrays}) == 1:
+        return np.stack(arrays)
+    return observations
+
+def connection(ws):
+    """Returns the options of a connection, creating them the first time
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+
+    Returns:
+        Dictionary with the options of the connection
+    """
+    if ws not in connections:
+        connections[ws] = {'encoding': 'json', 'instances': set()}
+    return connections[ws]
+
+def is_binary(ws):
+    """Checks whether the connection negotiated the binary encoding
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+
+    Returns:
+        True if arrays must be sent as binary frames
     """
-    observation, reward, done, info = step
-    return observation.tolist(), reward, done, info
+    return ws in connections and connections[ws]['encoding'] == 'binary'
+
+def encode_binary(ws, array, **header):
+    """Packs an array into a binary frame, tagged with the id of the
+    request it answers, if any, so the header is written only once
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        array (np.array|number|list): array to send to the client
+        **header: extra information, see `binary.encode`
+
+    Returns:
+        Binary frame (bytes)
+    """
+    if getattr(ws, 'tagged', False):
+        header['id'] = ws.request_id
+
+    return binary.encode(array, **header)
+
+def disconnect(ws):
+    """Forgets everything about a connection once it's gone, closing
+    the instances it created, its replays and render subscriptions,
+    and dropping its snapshots and scheduling state
+
+    Args:
+        ws (WebSocket): socket that has been closed
+    """
+    options = connections.pop(ws, None)
+    snapshots.store.discard(ws)
+    replay.discard(ws)
+    rendering.unsubscribe(ws)
+
+    if scheduler.scheduler is not None:
+        scheduler.scheduler.discard(ws)
+
+    if options:
+        for instance_id in list(options['instances']):
+            try:
+                remove_instance(instance_id)
+            except Exception as err:
+                print(f'Error closing instance {instance_id}: {err}')
+
+def add_instance(ws, env, env_id, instance_id=None):
+    """Stores a new environment, owned by the connection that created it
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        env (Env): environment to store
+        env_id (str): environment id
+        instance_id (str): optional; instance id, a new one by default
+
+    Returns:
+        Instance id of the environment
+    """
+    instance_id = instance_id or uuid.uuid4().hex
+    envs[instance_id] = env
+    owners[instance_id] = ws
+    last_used[instance_id] = time.monotonic()
+    env_ids[instance_id] = env_id
+    schemas[instance_id] = {'observation_space': codec.dumps(space_info(env.observation_space)),
+                            'action_space': codec.dumps(space_info(env.action_space))}
+    decoders[instance_id] = schema.decoder(env.action_space)
+    connection(ws)['instances'].add(instance_id)
+    return instance_id
+
+def remove_instance(instance_id):
+    """Closes an environment and forgets about it
+
+    Args:
+        instance_id (str): instance id of the env to remove
+    """
+    env = envs.pop(instance_id, None)
+    last_used.pop(instance_id, None)
+    env_ids.pop(instance_id, None)
+    schemas.pop(instance_id, None)
+    decoders.pop(instance_id, None)
+    rendering.unsubscribe(instance_id=instance_id)
+    ws = owners.pop(instance_id, None)
+
+    if ws in connections:
+        connections[ws]['instances'].discard(instance_id)
+
+    if env is not None:
+        env.close()
+
+def evict_idle():
+    """Closes the instances that haven't been used for longer than `idle_ttl`"""
+    if idle_ttl is None:
+        return
+
+    deadline = time.monotonic() - idle_ttl
+
+    # envs is ordered by use, so we can stop at the first recent one
+    for instance_id in list(envs):
+        if last_used.get(instance_id, 0) > deadline:
+            break
+        remove_instance(instance_id)
 
 def lookup_env(instance_id):
     """Looks up an environment based on instance id
@@ -106,22 +324,77 @@ def lookup_env(instance_id):
         InstanceNotFound: instance isn't found in the dictionary
     """
     try:
-        return envs[instance_id]
+        env = envs[instance_id]
     except KeyError:
         raise InstanceNotFound(instance_id)
+    
+    envs.move_to_end(instance_id)
+    last_used[instance_id] = time.monotonic()
+    return env
 
 @public_api
-def make(ws, env_id, **kwargs):
+def make(ws, env_id, shared_memory=0, record=False, auto_reset=False, pre_reset=True, **kwargs):
     """API method. Instantiates an environment
     and sends the instance id to the client
 
+    The instance belongs to the connection and is closed when the
+    connection ends. When pooling is enabled, the environment comes
+    ready from the pool and goes back to it, reset, when closed.
+
     Args:
         ws (WebSocket): socket where to send stuff
         env_id (str): environment id
+        shared_memory (int): optional; number of slots of a shared memory
+            ring buffer where observations are written. Steps and resets
+            then send the slot index instead of the observation
+        record (bool): optional; whether every reset and step is recorded
+            into shards on the server's disk, named after the instance id.
+            See `gymie.recording`
+        auto_reset (bool): optional; whether the environment is reset as soon as
+            an episode ends. The info of the last step has the initial observation
+            of the next episode. See `gymie.autoreset`
+        pre_reset (bool): optional; whether auto-reset keeps a spare environment
+            reset in the background, unless a seed is given. True by default
+        preprocess (list(dict)): optional; stages applied to the observations
+            before sending them, such as `grayscale`, `resize`, `frame_skip`
+            or `frame_stack`. See `gymie.preprocessing`
+        backend (str): optional; backend that instantiates the environment,
+            `gym`, `retro`, `unity` or any other registered. See `gymie.backends`
+    
+    Raises:
+        CapacityReached: there are already `max_instances` instances
+        BackendNotFound: the backend isn't registered or installed
     """
-    env = get_env(env_id, **kwargs)
+    evict_idle()
+
+    if max_instances is not None and len(envs) >= max_instances:
+        raise CapacityReached(max_instances)
+
     instance_id = uuid.uuid4().hex
-    envs[instance_id] = env
+
+    def build():
+        if pool.size:
+            return pool.acquire(env_id, new_env, **kwargs)
+        return new_env(env_id, **kwargs)
+
+    with profiler.phase(ws, 'env'):
+        env = build()
+
+        try:
+            # Seeded instances keep their one environment, so episodes are reproducible
+            if auto_reset and pre_reset and not kwargs.get('seed'):
+                env = autoreset.PreResetEnv(env, build)
+            if record:
+                env = recording.RecordingEnv(env, instance_id, env_id)
+            if shared_memory:
+                env = shm.SharedMemoryObservation(env, shared_memory)
+            if auto_reset:
+                env = autoreset.AutoReset(env)
+        except:
+            env.close()
+            raise
+
+    add_instance(ws, env, env_id, instance_id)
     ws.send(instance_id)
 
 @public_api
@@ -136,19 +409,30 @@ def step(ws, instance_id, action, render=False):
         render (bool): optional; whether or not to render the scene
     
     Raises:
-        WrongAction: there was an issue executing the action
+        WrongAction: the action doesn't fit the action space
     """
     env = lookup_env(instance_id)
+    action = decoders[instance_id](action)
 
-    if render: 
-        env.render()
+    with profiler.phase(ws, 'env'):
+        if render: 
+            env.render()
 
-    try:
         step = env.step(action)
-    except:
-        raise WrongAction(str(action))
-    else:
-        ws.send(json.dumps(process_step(step)))
+
+        if instance_id in rendering.subscriptions:
+            rendering.capture(instance_id, env)
+    
+    observation, reward, done, info = process_step(step)
+    metrics.steps.inc(env_ids[instance_id])
+
+    with profiler.phase(ws, 'serialize'):
+        if is_binary(ws):
+            message = encode_binary(ws, observation, reward=reward, done=done, info=info)
+        else:
+            message = codec.dumps((observation, reward, done, info))
+
+    ws.send(message)
 
 @public_api
 def reset(ws, instance_id):
@@ -158,8 +442,18 @@ def reset(ws, instance_id):
     Args:
         instance_id (str): instance id of the env to reset
     """
-    state = lookup_env(instance_id).reset()
-    ws.send(str(state.tolist()))
+    env = lookup_env(instance_id)
+
+    with profiler.phase(ws, 'env'):
+        state = env.reset()
+
+    with profiler.phase(ws, 'serialize'):
+        if is_binary(ws):
+            message = encode_binary(ws, state)
+        else:
+            message = codec.literal(state)
+
+    ws.send(message)
 
 @public_api
 def close(ws, instance_id):
@@ -169,11 +463,190 @@ def close(ws, instance_id):
     Args:
         instance_id (str): instance id of the env to close
     """
-    lookup_env(instance_id).close()
-    del envs[instance_id]
+    lookup_env(instance_id)
+    remove_instance(instance_id)
 
     is_closed = instance_id not in envs
-    ws.send(json.dumps(is_closed))
+    ws.send(codec.dumps(is_closed))
+
+def lookup_envs(instance_ids):
+    """Looks up a list of environments based on their instance ids
+
+    Args:
+        instance_ids (list(str)): given instance ids
+    
+    Returns:
+        List of Gym environments
+    
+    Raises:
+        InstanceNotFound: one of the instances isn't found
+    """
+    return [lookup_env(instance_id) for instance_id in instance_ids]
+
+@public_api
+def step_batch(ws, instance_ids, actions, render=False):
+    """API method. Performs a step in several environments
+    and sends all the results to the client in a single message
+
+    Observations are stacked into a single array when they all
+    have the same shape and dtype.
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        instance_ids (list(str)): env's instance ids where to execute the steps
+        actions (list): one action per instance id
+        render (bool): optional; whether or not to render the scenes
+    
+    Raises:
+        TypeError: there isn't one action per instance id
+        WrongAction: one of the actions doesn't fit the action space
+    """
+    if len(instance_ids) != len(actions):
+        raise TypeError('Expected one action per instance id')
+
+    batch = lookup_envs(instance_ids)
+    actions = [decoders[instance_id](action) for instance_id, action in zip(instance_ids, actions)]
+    observations, rewards, dones, infos = [], [], [], []
+
+    with profiler.phase(ws, 'env'):
+        for instance_id, env, action in zip(instance_ids, batch, actions):
+            if render: 
+                env.render()
+
+            step = env.step(action)
+
+            if instance_id in rendering.subscriptions:
+                rendering.capture(instance_id, env)
+
+            observation, reward, done, info = process_step(step)
+            observations.append(observation)
+            rewards.append(reward)
+            dones.append(done)
+            infos.append(info)
+    
+    for instance_id in instance_ids:
+        metrics.steps.inc(env_ids[instance_id])
+
+    with profiler.phase(ws, 'serialize'):
+        observations = stack(observations)
+
+        if is_binary(ws) and isinstance(observations, np.ndarray):
+            message = encode_binary(ws, observations, rewards=rewards, dones=dones, infos=infos)
+        else:
+            message = codec.dumps((observations, rewards, dones, infos))
+
+    ws.send(message)
+
+@public_api
+def reset_batch(ws, instance_ids):
+    """API method. Resets several environments
+    and sends all the initial states to the client in a single message
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        instance_ids (list(str)): instance ids of the envs to reset
+    """
+    batch = lookup_envs(instance_ids)
+
+    with profiler.phase(ws, 'env'):
+        states = [env.reset() for env in batch]
+
+    with profiler.phase(ws, 'serialize'):
+        states = stack(states)
+
+        if is_binary(ws) and isinstance(states, np.ndarray):
+            message = encode_binary(ws, states)
+        else:
+            message = codec.dumps(states)
+
+    ws.send(message)
+
+# Policies a rollout can follow when no explicit actions are given
+POLICIES = ['sample', 'repeat']
+
+@public_api
+def rollout(ws, instance_id, actions=None, policy='sample', action=None, max_steps=None):
+    """API method. Performs several steps in the environment, until
+    the episode is done or no steps are left, and sends the whole
+    trajectory to the client in a single message
+
+    Actions are either given explicitly or chosen by a server side policy:
+    `sample` takes random actions from the action space, `repeat` takes
+    the same action over and over.
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        instance_id (str): env's instance id where to execute the steps
+        actions (list): optional; explicit sequence of actions
+        policy (str): optional; `sample` (default) or `repeat`,
+            used when no actions are given
+        action (int|list): optional; action to take with `repeat` policy
+        max_steps (int): optional; maximum number of steps. Required
+            when no actions are given. At most `max_rollout`, as many actions
+    
+    Raises:
+        TypeError: wrong combination of parameters, or too many steps
+        WrongAction: one of the actions doesn't fit the action space
+    """
+    env = lookup_env(instance_id)
+    decode = decoders[instance_id]
+
+    if (max_steps is not None and max_steps > max_rollout) or (actions is not None and len(actions) > max_rollout):
+        raise TypeError('Rollouts take at most {} steps'.format(max_rollout))
+
+    if actions is None:
+        if policy not in POLICIES or max_steps is None:
+            raise TypeError('Rollout needs either actions or policy and max_steps')
+        if policy == 'repeat' and action is None:
+            raise TypeError('Policy `repeat` needs an action')
+        if policy == 'repeat':
+            action = decode(action)
+    else:
+        if max_steps is None or max_steps > len(actions):
+            max_steps = len(actions)
+        actions = [decode(next_action) for next_action in actions[:max_steps]]
+
+    observations, taken, rewards, infos = [], [], [], []
+    done = False
+
+    with profiler.phase(ws, 'env'):
+        for t in range(max_steps):
+            if actions is not None:
+                next_action = actions[t]
+            elif policy == 'sample':
+                next_action = env.action_space.sample()
+            else:
+                next_action = action
+
+            step = env.step(next_action)
+
+            if instance_id in rendering.subscriptions:
+                rendering.capture(instance_id, env)
+
+            observation, reward, done, info = process_step(step)
+            observations.append(observation)
+            taken.append(to_list(next_action))
+            rewards.append(reward)
+            infos.append(info)
+
+            if done:
+                break
+
+    metrics.steps.inc(env_ids[instance_id], amount=len(rewards))
+
+    with profiler.phase(ws, 'serialize'):
+        observations = stack(observations)
+
+        if is_binary(ws) and isinstance(observations, np.ndarray):
+            message = encode_binary(ws, observations, 
+                                    actions=taken, 
+                                    rewards=rewards, 
+                                    done=done, 
+                                    infos=infos)
+        else:
+            message = codec.dumps((observations, taken, rewards, done, infos))
+
+    ws.send(message)
 
 def space_info(space):
     """Returns information about the space in a dictionary
@@ -184,26 +657,9 @@ def space_info(space):
     Returns:
         Dictionary with information about the space such as 
         type of space, shape, low and high values, etc...
+        See `gymie.schema`
     """
-    name = space.__class__.__name__
-    info = { 'name': name }
-
-    if name in 'Discrete':
-        info['n'] = space.n
-    elif name == 'Box':
-        info['shape'] = space.shape
-
-        # I noticed that numpy.float32 isn't JSON serializable but numpy.float64 is.
-        info['low'] = space.low.astype('float64').tolist()
-        info['high'] = space.high.astype('float64').tolist()
-    elif name == 'MultiBinary':
-        info['n'] = space.n
-        info['shape'] = space.shape # TODO: does it make sense to return this?
-    elif name == 'MultiDiscrete':
-        # TODO: finish this one.
-        pass
-
-    return info
+    return schema.schema(space)
 
 @public_api
 def observation_space(ws, instance_id):
@@ -213,9 +669,8 @@ def observation_space(ws, instance_id):
     Args:
         instance_id (str): environment's instance id
     """
-    space = lookup_env(instance_id).observation_space
-    info = space_info(space)
-    ws.send(json.dumps(info))
+    lookup_env(instance_id)
+    ws.send(schemas[instance_id]['observation_space'])
 
 @public_api
 def action_space(ws, instance_id):
@@ -225,9 +680,8 @@ def action_space(ws, instance_id):
     Args:
         instance_id (str): environment's instance id
     """
-    space = lookup_env(instance_id).action_space
-    info = space_info(space)
-    ws.send(json.dumps(info))
+    lookup_env(instance_id)
+    ws.send(schemas[instance_id]['action_space'])
 
 @public_api
 def action_sample(ws, instance_id):
@@ -239,6 +693,244 @@ def action_sample(ws, instance_id):
     """
     env = lookup_env(instance_id)
     action = env.action_space.sample()
-    if hasattr(action, 'tolist'):
-        action = action.tolist()
-    ws.send(str(action))
+
+    if is_binary(ws):
+        ws.send(encode_binary(ws, action))
+    else:
+        ws.send(codec.literal(action))
+
+@public_api
+def shared_memory_info(ws, instance_id):
+    """API method. Sends the information a client on the same host
+    needs to map the shared memory ring buffer of the instance
+
+    Args:
+        instance_id (str): environment's instance id
+    
+    Raises:
+        TypeError: the instance was made without shared memory
+    """
+    env = lookup_env(instance_id)
+
+    if not isinstance(env, shm.SharedMemoryObservation):
+        raise TypeError('Instance {} has no shared memory'.format(instance_id))
+
+    ws.send(codec.dumps(env.ring.info()))
+
+@public_api
+def clone_state(ws, instance_id):
+    """API method. Takes a snapshot of the state of the environment and
+    sends its handle to the client, so planning clients can branch from
+    the same state many times with `restore_state`
+
+    Emulators, such as Gym Retro's, save their own state. Otherwise the
+    unwrapped environment, e.g. classic control physics and the random
+    generator, and its wrappers are copied. Snapshots live in a bounded
+    store, least recently used first out, see `gymie.snapshots`
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        instance_id (str): environment's instance id
+
+    Raises:
+        StateNotSupported: the state of the environment can't be copied
+    """
+    env = lookup_env(instance_id)
+
+    with profiler.phase(ws, 'env'):
+        try:
+            state = snapshots.capture(env)
+        except Exception:
+            raise StateNotSupported(env_ids[instance_id])
+
+    handle = snapshots.store.put(ws, env_ids[instance_id], state)
+    ws.send(handle)
+
+@public_api
+def restore_state(ws, instance_id, handle):
+    """API method. Restores a snapshot taken by `clone_state` into an
+    instance, which can be a different one of the same environment,
+    and sends confirmation
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        instance_id (str): environment's instance id
+        handle (str): handle sent by `clone_state`
+
+    Raises:
+        SnapshotNotFound: the snapshot doesn't exist, was evicted,
+            belongs to another connection or to another environment
+    """
+    env = lookup_env(instance_id)
+    env_id, state = snapshots.store.get(ws, handle)
+
+    if env_id != env_ids[instance_id]:
+        raise SnapshotNotFound(handle)
+
+    with profiler.phase(ws, 'env'):
+        snapshots.restore(env, state)
+
+    ws.send(codec.dumps(True))
+
+@public_api
+def replay_open(ws, recordings=None, batch_size=32, sampling='sequential', seed=None):
+    """API method. Opens a replay of recorded transitions, see `record`
+    in `make`, and sends its handle and number of transitions. Batches
+    are then pulled with `replay_next`
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        recordings (list(str)): optional; names of the recordings, the ids
+            of the instances that made them. All of them by default
+        batch_size (int): optional; transitions per batch
+        sampling (str): optional; `sequential` (default), in the order they
+            were recorded, or `uniform`, at random across all the episodes
+        seed (int): optional; seed of uniform sampling
+
+    Raises:
+        RecordingNotFound: one of the recordings doesn't exist
+        TypeError: wrong parameters or recordings of different environments
+    """
+    handle, size = replay.open_replay(ws, recordings, batch_size=batch_size, sampling=sampling, seed=seed)
+    ws.send(codec.dumps({'handle': handle, 'transitions': size}))
+
+@public_api
+def replay_next(ws, handle):
+    """API method. Sends the next batch of transitions of a replay:
+    observations, actions, rewards, next observations and dones, or
+    `null` once a sequential replay is exhausted
+
+    With `binary` encoding, observations and next observations travel
+    stacked in a single array, shaped `(2, batch, ...)`, and the rest
+    in the header
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        handle (str): handle sent by `replay_open`
+
+    Raises:
+        ReplayNotFound: the replay isn't open
+    """
+    reader = replay.lookup(ws, handle)
+
+    with profiler.phase(ws, 'env'):
+        batch = reader.next()
+
+    if batch is None:
+        ws.send(codec.dumps(None))
+        return
+
+    observations, actions, rewards, dones = batch
+
+    with profiler.phase(ws, 'serialize'):
+        if is_binary(ws):
+            message = encode_binary(ws, observations,
+                                    actions=to_list(actions),
+                                    rewards=to_list(rewards),
+                                    dones=to_list(dones))
+        else:
+            message = codec.dumps((observations[0], actions, rewards, observations[1], dones))
+
+    ws.send(message)
+
+@public_api
+def render_subscribe(ws, instance_id, fps=10, format='png', quality=75):
+    """API method. Subscribes the connection to the frames of an instance,
+    and sends the handle of the subscription. The instance can belong to
+    another connection, so viewers don't get in the way of the client
+    stepping it
+
+    After every step, when it's time for a new frame, `rgb_array` frames
+    are captured and then encoded and sent in the background as binary
+    frames, see `gymie.rendering`. Frames are dropped while the previous
+    one is still on its way, so a slow viewer never slows down the steps
+
+    Args:
+        ws (WebSocket): socket where frames are sent
+        instance_id (str): environment's instance id
+        fps (float): optional; maximum frames per second
+        format (str): optional; `png` (default), `jpeg` or `delta`
+        quality (int): optional; JPEG quality
+
+    Raises:
+        EncodingNotSupported: unknown format, or `jpeg` without Pillow
+        TypeError: wrong frame rate
+    """
+    lookup_env(instance_id)
+    subscription = rendering.subscribe(ws, instance_id, fps=fps, format=format, quality=quality)
+    ws.send(subscription.handle)
+
+@public_api
+def render_unsubscribe(ws, handle):
+    """API method. Cancels a render subscription of the connection
+    and sends whether it existed
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        handle (str): handle sent by `render_subscribe`
+    """
+    ws.send(codec.dumps(rendering.unsubscribe(ws, handle=handle) > 0))
+
+@public_api
+def set_encoding(ws, encoding):
+    """API method. Negotiates the encoding used by the connection
+    to send observations and actions, and sends confirmation
+
+    With `binary` encoding, `step`, `reset` and `action_sample` send
+    binary frames with a small JSON header followed by the raw array.
+    See `gymie.binary` for the layout of the frame.
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        encoding (str): either `json` (default) or `binary`
+
+    Raises:
+        EncodingNotSupported: unknown encoding
+    """
+    if encoding not in ENCODINGS:
+        raise EncodingNotSupported(encoding)
+
+    connection(ws)['encoding'] = encoding
+    ws.send(codec.dumps(True))
+
+@public_api
+def set_profiling(ws, enabled):
+    """API method. Turns the phase profiler on or off at runtime,
+    and sends confirmation. Timings are reported periodically by
+    the server, see `gymie.profiler`
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        enabled (bool): whether requests are profiled
+    """
+    if enabled:
+        profiler.enable()
+    else:
+        profiler.disable()
+
+    ws.send(codec.dumps(profiler.enabled))
+
+@public_api
+def set_priority(ws, priority=1, rate=None, burst=None):
+    """API method. Sets the priority and rate limit of the requests of
+    the connection, and sends whether the server schedules requests.
+    When it does, see `gymie.scheduler`, busy connections share the
+    server in proportion to their priority, and a rate limit holds a
+    connection back even when the server is idle
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        priority (int): optional; weight of the connection, from 1 (default) to 100
+        rate (float): optional; requests per second the connection can start
+        burst (int): optional; requests the connection can start at once
+            within its rate limit, `rate` or 1 by default
+
+    Raises:
+        TypeError: wrong priority, rate or burst
+    """
+    current = scheduler.scheduler
+
+    if current is not None:
+        current.configure(ws, priority, rate, burst)
+
+    ws.send(codec.dumps(current is not None))
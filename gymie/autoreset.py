@@ -0,0 +1,122 @@
+import gym
+import threading
+from gymie import metrics
+
+
+#################################
+# Auto-reset at the episode end #
+#################################
+
+# Key of the info of the last step of an episode
+# with the initial observation of the next one
+RESET_KEY = 'reset_observation'
+
+resets = metrics.Counter('gymie_pre_resets_total',
+                         'Resets of instances with a spare environment, by whether the spare was ready',
+                         ('outcome',))
+
+
+def spawn(fn, *args):
+    """Runs a function in the background, where spare environments are built and reset
+
+    Args:
+        fn: function to run
+        *args: arguments of the function
+    """
+    threading.Thread(target=fn, args=args, daemon=True).start()
+
+
+class AutoReset(gym.Wrapper):
+    """Resets the environment as soon as an episode ends. The last step of
+    the episode is returned as is, with the initial observation of the next
+    one in its info, under `RESET_KEY`, so clients don't need to call `reset`
+    """
+
+    def step(self, action):
+        observation, reward, done, info = self.env.step(action)
+
+        if done:
+            info = dict(info)
+            info[RESET_KEY] = self.env.reset()
+
+        return observation, reward, done, info
+
+
+class Spare():
+    """Environment already reset, along with its initial observation,
+    waiting for the next episode"""
+
+    def __init__(self):
+        self.env = None
+        self.observation = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+
+class PreResetEnv(gym.Wrapper):
+    """Keeps a second environment reset in the background, so `reset` swaps
+    it in instead of waiting for the environment. The environment that just
+    finished is then reset in the background and becomes the spare, so
+    episodes alternate between the two. If the spare can't be built, e.g.
+    emulators that allow one instance per process, `reset` waits as usual
+
+    Args:
+        env (Env): environment to wrap
+        factory (callable): function that builds the spare environment,
+            the same way `env` was built
+    """
+
+    def __init__(self, env, factory):
+        super().__init__(env)
+        self.spare = Spare()
+        spawn(self.prepare, None, factory)
+
+    def prepare(self, env, factory=None):
+        """Resets an environment, building it first if needed,
+        and keeps it as the spare. It runs in the background
+
+        Args:
+            env (Env): environment to reset, or None to build one
+            factory (callable): optional; function that builds the environment
+        """
+        try:
+            if env is None:
+                env = factory()
+            observation = env.reset()
+        except Exception as err:
+            print(f'Error preparing the next episode: {err}')
+            if env is not None:
+                env.close()
+            return
+
+        with self.spare.lock:
+            if not self.spare.closed:
+                self.spare.env, self.spare.observation = env, observation
+                return
+
+        env.close()
+
+    def reset(self, **kwargs):
+        with self.spare.lock:
+            env, observation = self.spare.env, self.spare.observation
+            self.spare.env = self.spare.observation = None
+
+        if env is None:
+            resets.inc('waited')
+            return self.env.reset(**kwargs)
+
+        resets.inc('ready')
+        previous, self.env = self.env, env
+        spawn(self.prepare, previous)
+        return observation
+
+    def close(self):
+        with self.spare.lock:
+            self.spare.closed = True
+            env, self.spare.env = self.spare.env, None
+
+        try:
+            self.env.close()
+        finally:
+            if env is not None:
+                env.close()
@@ -0,0 +1,294 @@
+import gym
+import importlib
+import threading
+from gymie.exceptions import BackendNotFound, EnvironmentMalformed, EnvironmentNotFound
+
+
+############################
+# Registry of env backends #
+############################
+
+# Entry point group where packages advertise their own backends, e.g.
+# `entry_points={'gymie.backends': ['custom = my_package.envs:make_env']}`
+GROUP = 'gymie.backends'
+
+# Backends shipped with Gymie. Their package is imported
+# the first time an environment of theirs is made
+BUILTIN = {
+    'gym': 'gymie.backends:gym_env',
+    'retro': 'gymie.backends:retro_env',
+    'unity': 'gymie.backends:unity_env',
+}
+
+# Packages the built-in backends need, imported when they're loaded
+REQUIRES = {
+    'retro': ['retro'],
+    'unity': ['mlagents_envs', 'gym_unity'],
+}
+
+# Backend of `make` when the client doesn't ask for one
+default = 'gym'
+
+# Backends by name: `module:attribute` strings or entry points
+# until they're first used, `Backend` from then on
+registry = dict(BUILTIN)
+
+# Whether the entry points have been added to the registry
+discovered = False
+
+lock = threading.Lock()
+
+
+class Backend():
+    """Way of instantiating environments, such as Gym, Gym Retro or Unity ML-Agents
+
+    Args:
+        get_env (callable): function that takes an environment id and optional
+            keyword arguments and returns a Gym-like environment
+        process_step (callable): optional; function that processes the
+            tuple returned by `step` before it's sent to the client
+    """
+
+    def __init__(self, get_env, process_step=None):
+        self.get_env = get_env
+        self.process_step = process_step
+
+
+class ProcessedStep(gym.Wrapper):
+    """Applies the `process_step` of a backend to every step"""
+
+    def __init__(self, env, process_step):
+        super().__init__(env)
+        self.process_step = process_step
+
+    def step(self, action):
+        return self.process_step(self.env.step(action))
+
+
+def gym_env(env_id, seed=None):
+    """Instantiates a Gym environment
+
+    Args:
+        env_id (str): environment id
+        seed (int): optional; initial seed for randomnes
+
+    Returns:
+        Gym environment
+
+    Raises:
+        EnvironmentNotFound: environment env_id does not exist
+        EnvironmentMalformed: env_id is not correct
+    """
+    try:
+        env = gym.make(env_id)
+    except gym.error.UnregisteredEnv:
+        raise EnvironmentNotFound(env_id)
+    except gym.error.Error:
+        raise EnvironmentMalformed(env_id)
+    else:
+        if seed:
+            env.seed(seed)
+
+        return env
+
+def retro_env(env_id, seed=None, **kwargs):
+    """Instantiates a Gym Retro environment. It needs the `gym-retro` package
+
+    Args:
+        env_id (str): game, e.g. `Airstriker-Genesis`
+        seed (int): optional; initial seed for randomnes
+        **kwargs: extra arguments for `retro.make`, such as `state`
+
+    Returns:
+        Gym Retro environment
+
+    Raises:
+        EnvironmentNotFound: the game isn't integrated or its ROM isn't imported
+    """
+    import retro
+
+    try:
+        env = retro.make(game=env_id, **kwargs)
+    except FileNotFoundError:
+        raise EnvironmentNotFound(env_id)
+    else:
+        if seed:
+            env.seed(seed)
+
+        return env
+
+def unity_env(env_id,
+              seed=None,
+              worker_id=0,
+              no_graphics=False,
+              uint8_visual=False,
+              flatten_branched=False,
+              allow_multiple_obs=False):
+    """Instantiates a Unity ML-Agents environment wrapped by gym-unity.
+    It needs the `mlagents-envs` and `gym-unity` packages
+
+    Args:
+        env_id (str): path of the Unity build
+        seed (int): optional; initial seed for randomnes
+        worker_id (int): optional; offset of the port used to talk to Unity
+        no_graphics (bool): optional; whether Unity runs without rendering
+        uint8_visual, flatten_branched, allow_multiple_obs:
+            optional; see `gym_unity.envs.UnityToGymWrapper`
+
+    Returns:
+        Gym environment
+
+    Raises:
+        EnvironmentNotFound: the build can't be launched
+    """
+    from mlagents_envs.environment import UnityEnvironment, UnityEnvironmentException
+    from gym_unity.envs import UnityToGymWrapper
+
+    try:
+        unity_env = UnityEnvironment(env_id,
+                                     seed=seed or 0,
+                                     worker_id=worker_id,
+                                     no_graphics=no_graphics)
+
+        return UnityToGymWrapper(unity_env,
+                                 uint8_visual=uint8_visual,
+                                 flatten_branched=flatten_branched,
+                                 allow_multiple_obs=allow_multiple_obs)
+    except UnityEnvironmentException:
+        raise EnvironmentNotFound(env_id)
+
+def entry_points():
+    """Finds the backends advertised by installed packages, see `GROUP`
+
+    Returns:
+        Dictionary of entry points, keyed by backend name
+    """
+    try:
+        from importlib.metadata import entry_points as find
+    except ImportError:
+        import pkg_resources
+        return {point.name: point for point in pkg_resources.iter_entry_points(GROUP)}
+
+    points = find()
+    points = points.select(group=GROUP) if hasattr(points, 'select') else points.get(GROUP, ())
+    return {point.name: point for point in points}
+
+def to_backend(target):
+    """Turns whatever a backend was registered with into a `Backend`: a `Backend`,
+    a function that makes environments, or a module or object with a `get_env`
+    function and, optionally, a `process_step` one"""
+    if isinstance(target, Backend):
+        return target
+    if hasattr(target, 'get_env'):
+        return Backend(target.get_env, getattr(target, 'process_step', None))
+    return Backend(target)
+
+def resolve(spec):
+    """Imports a `module:attribute` string or loads an entry point"""
+    if not isinstance(spec, str):
+        return spec.load()
+
+    module, _, attribute = spec.partition(':')
+    target = importlib.import_module(module)
+    return getattr(target, attribute) if attribute else target
+
+def register(name, target, process_step=None):
+    """Registers a backend, replacing any other with the same name
+
+    Args:
+        name (str): name clients ask for in `make`
+        target: function that makes environments, an object with a `get_env`
+            function, or a `module:attribute` string of either, imported on first use
+        process_step (callable): optional; function that processes every step
+    """
+    if not isinstance(target, str):
+        target = to_backend(target)
+        if process_step is not None:
+            target = Backend(target.get_env, process_step)
+
+    with lock:
+        registry[name] = target
+
+def names():
+    """Lists the backends, installed or not
+
+    Returns:
+        Backend names, sorted
+    """
+    discover()
+    return sorted(registry)
+
+def discover():
+    """Adds the backends advertised through entry points to the registry, once.
+    Backends registered in code take precedence"""
+    global discovered
+
+    if discovered:
+        return
+
+    with lock:
+        if not discovered:
+            for name, point in entry_points().items():
+                registry.setdefault(name, point)
+            discovered = True
+
+def load(name):
+    """Looks up a backend, importing it the first time
+
+    Args:
+        name (str): backend name
+
+    Returns:
+        Backend
+
+    Raises:
+        BackendNotFound: the backend isn't registered, or its package isn't installed
+    """
+    target = registry.get(name)
+    if isinstance(target, Backend):
+        return target
+
+    if target is None:
+        discover()
+
+    with lock:
+        if name not in registry:
+            raise BackendNotFound(name)
+
+        target = registry[name]
+        if isinstance(target, Backend):
+            return target
+
+        try:
+            if target == BUILTIN.get(name):
+                for module in REQUIRES.get(name, ()):
+                    importlib.import_module(module)
+            backend = registry[name] = to_backend(resolve(target))
+        except ImportError as err:
+            print(f'Error loading backend {name}: {err}')
+            raise BackendNotFound(name)
+
+    return backend
+
+def make(name, env_id, **kwargs):
+    """Instantiates an environment with a backend
+
+    Args:
+        name (str): backend name
+        env_id (str): environment id
+        **kwargs: extra arguments for the backend
+
+    Returns:
+        Gym environment
+
+    Raises:
+        BackendNotFound: the backend isn't registered, or its package isn't installed
+        Whatever the backend raises
+    """
+    backend = load(name)
+    env = backend.get_env(env_id, **kwargs)
+
+    if backend.process_step is not None:
+        env = ProcessedStep(env, backend.process_step)
+
+    return env
@@ -0,0 +1,385 @@
+import os
+import sys
+import gym
+import json
+import time
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+import numpy as np
+from gym import spaces
+from gymie import binary, server, __version__
+from gymie.client import Client, http_get
+
+
+###################################
+# Synthetic benchmark environment #
+###################################
+
+class ImageEnv(gym.Env):
+    """Environment with large image observations and no logic,
+    so benchmarks measure the server and not the environment.
+    Frames are generated once and cycled through
+
+    Args:
+        height (int): optional; height of the frames
+        width (int): optional; width of the frames
+        episode_length (int): optional; steps before the episode is done
+    """
+
+    def __init__(self, height=210, width=160, episode_length=1000):
+        self.observation_space = spaces.Box(0, 255, (height, width, 3), dtype=np.uint8)
+        self.action_space = spaces.Discrete(4)
+        self.episode_length = episode_length
+        self.frames = np.random.RandomState(0).randint(0, 256, (4, height, width, 3), dtype=np.uint8)
+        self.t = 0
+
+    def reset(self):
+        self.t = 0
+        return self.frames[0]
+
+    def step(self, action):
+        self.t += 1
+        return self.frames[self.t % len(self.frames)], 1.0, self.t >= self.episode_length, {}
+
+# `python -m gymie.bench` runs this module twice, as `__main__` and as
+# `gymie.bench` when the entry point is loaded, so register only once
+if 'GymieBenchImage-v0' not in gym.envs.registry.env_specs:
+    gym.register(id='GymieBenchImage-v0',
+                 entry_point='gymie.bench:ImageEnv')
+
+    gym.register(id='GymieBenchImageLarge-v0',
+                 entry_point='gymie.bench:ImageEnv',
+                 kwargs={'height': 480, 'width': 640})
+
+
+##########
+# Server #
+##########
+
+def free_port():
+    """Asks the OS for a free port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_server(host, port, timeout=30):
+    """Waits until the server accepts connections
+
+    Raises:
+        TimeoutError: the server didn't come up in time
+    """
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), 1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+
+    raise TimeoutError('Server on {}:{} did not start'.format(host, port))
+
+def launch(mode, port, backend, server_args):
+    """Starts a server to benchmark, unless one is already running
+
+    Args:
+        mode (str): `subprocess`, `inprocess` or `external`
+        port (int): port to listen on
+        backend (str): server backend
+        server_args (list(str)): extra command line options for the server
+
+    Returns:
+        Subprocess, or None
+    """
+    if mode == 'subprocess':
+        command = [sys.executable, '-m', 'gymie.bench', '--serve',
+                   '--port', str(port), '--backend', backend] + server_args
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if mode == 'inprocess':
+        threading.Thread(target=server.start,
+                         args=('127.0.0.1', port),
+                         kwargs={'backend': backend},
+                         daemon=True).start()
+
+    return None
+
+def serve(argv):
+    """Starts a server with the benchmark environments registered,
+    taking the same options as `python -m gymie`
+
+    Args:
+        argv (list(str)): command line options
+    """
+    from gymie.__main__ import main as start_server
+    start_server(argv)
+
+
+##########
+# Client #
+##########
+
+def sampler(space):
+    """Builds a function that samples random actions on the client,
+    so no extra requests are needed
+
+    Args:
+        space (dict): action space, as sent by `action_space`
+
+    Returns:
+        Function without arguments returning an action
+    """
+    random = np.random.RandomState()
+
+    if space['name'] == 'Discrete':
+        return lambda: int(random.randint(space['n']))
+    elif space['name'] == 'Box':
+        low = np.clip(np.array(space['low']), -1e6, 1e6)
+        high = np.clip(np.array(space['high']), -1e6, 1e6)
+        return lambda: random.uniform(low, high).tolist()
+    elif space['name'] == 'MultiBinary':
+        return lambda: random.randint(2, size=space['n']).tolist()
+
+    raise ValueError('Action space `{}` not supported'.format(space['name']))
+
+def is_done(response):
+    """Tells whether a step response ends the episode"""
+    if isinstance(response, bytes):
+        return binary.split(response)[0]['done']
+    return json.loads(response)[2]
+
+def drive(client, instance_ids, sample, stop, warmup_until, results):
+    """Steps instances in a loop, round robin, until `stop` is set
+
+    Args:
+        client (Client): connection owning the instances
+        instance_ids (list(str)): instances to step
+        sample (callable): returns a random action
+        stop (Event): tells when to stop
+        warmup_until (float): `perf_counter` when measuring starts
+        results (dict): where steps, resets and latencies are stored
+    """
+    latencies = results['latencies']
+    measuring = False
+
+    while not stop.is_set():
+        for instance_id in instance_ids:
+            started = time.perf_counter()
+            response = client.request('step', instance_id=instance_id, action=sample())
+            ended = time.perf_counter()
+
+            if not measuring and started >= warmup_until:
+                measuring = True
+                results['sent'], results['received'] = client.sent, client.received
+
+            if measuring:
+                latencies.append(ended - started)
+
+            if is_done(response):
+                client.request('reset', instance_id=instance_id)
+                results['resets'] += measuring
+
+    if not measuring:
+        results['sent'], results['received'] = client.sent, client.received
+
+    results['sent'] = client.sent - results['sent']
+    results['received'] = client.received - results['received']
+
+def server_cpu(host, port):
+    """Scrapes the CPU time used by the server from `/metrics`
+
+    Returns:
+        Seconds, or None if the server doesn't expose them
+    """
+    try:
+        for line in http_get(host, port, '/metrics', timeout=5).splitlines():
+            if line.startswith('gymie_cpu_seconds '):
+                return float(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def percentiles(latencies):
+    """Summarizes latencies in milliseconds"""
+    if not latencies:
+        return {}
+
+    values = np.array(latencies) * 1000
+    summary = {'p{}'.format(q): float(np.percentile(values, q)) for q in (50, 90, 99, 99.9)}
+    summary.update(mean=float(values.mean()), max=float(values.max()))
+    return summary
+
+def run(host, port, env_id, clients, instances, duration, warmup, encoding, make_params=None):
+    """Benchmarks one environment: N clients step M instances
+    as fast as the server answers for `warmup` + `duration` seconds
+
+    Args:
+        host (str): server host
+        port (int): server port
+        env_id (str): environment id
+        clients (int): number of concurrent connections
+        instances (int): number of instances, shared out among the clients
+        duration (float): seconds measured
+        warmup (float): seconds before measuring starts
+        encoding (str): `json` or `binary`
+        make_params (dict): optional; extra parameters for `make`
+
+    Returns:
+        Dictionary with the results
+    """
+    connections = [Client(host, port) for _ in range(clients)]
+    assigned = [list() for _ in range(clients)]
+
+    for index in range(instances):
+        client = connections[index % clients]
+        instance_id = client.request('make', env_id=env_id, **(make_params or {}))
+        client.request('reset', instance_id=instance_id)
+        assigned[index % clients].append(instance_id)
+
+    for client in connections:
+        client.request('set_encoding', encoding=encoding)
+
+    space = json.loads(connections[0].request('action_space', instance_id=assigned[0][0]))
+    stop = threading.Event()
+    warmup_until = time.perf_counter() + warmup
+    results = [{'latencies': [], 'resets': 0} for _ in range(clients)]
+    threads = [threading.Thread(target=drive,
+                                args=(client, ids, sampler(space), stop, warmup_until, result))
+               for client, ids, result in zip(connections, assigned, results)]
+
+    for thread in threads:
+        thread.start()
+
+    time.sleep(warmup)
+    cpu_start = server_cpu(host, port)
+    wall_start = time.perf_counter()
+    time.sleep(duration)
+    cpu_end = server_cpu(host, port)
+    stop.set()
+
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - wall_start
+
+    for client in connections:
+        client.close()
+
+    latencies = [latency for result in results for latency in result['latencies']]
+    steps = len(latencies)
+    summary = {'env_id': env_id,
+               'clients': clients,
+               'instances': instances,
+               'encoding': encoding,
+               'seconds': elapsed,
+               'steps': steps,
+               'resets': sum(result['resets'] for result in results),
+               'steps_per_sec': steps / elapsed,
+               'latency_ms': percentiles(latencies),
+               'bytes_sent': sum(result['sent'] for result in results),
+               'bytes_received': sum(result['received'] for result in results),
+               'server_cpu_seconds': None,
+               'server_cpu_percent': None}
+
+    summary['bytes_per_step'] = summary['bytes_received'] / steps if steps else 0
+
+    if cpu_start is not None and cpu_end is not None:
+        summary['server_cpu_seconds'] = cpu_end - cpu_start
+        summary['server_cpu_percent'] = 100 * (cpu_end - cpu_start) / duration
+
+    return summary
+
+def format_results(results):
+    """Formats the results as a table"""
+    lines = ['{:<26} {:>7} {:>9} {:>12} {:>9} {:>9} {:>9} {:>12} {:>8}'.format(
+        'env_id', 'clients', 'instances', 'steps/sec', 'p50 ms', 'p99 ms', 'max ms', 'bytes/step', 'cpu %')]
+
+    for result in results:
+        latency = result['latency_ms']
+        cpu = result['server_cpu_percent']
+        lines.append('{:<26} {:>7} {:>9} {:>12.1f} {:>9.3f} {:>9.3f} {:>9.3f} {:>12.0f} {:>8}'.format(
+            result['env_id'][:26], result['clients'], result['instances'], result['steps_per_sec'],
+            latency.get('p50', 0), latency.get('p99', 0), latency.get('max', 0),
+            result['bytes_per_step'], '-' if cpu is None else '{:.1f}'.format(cpu)))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gymie.bench',
+                                     description='Load generator for Gymie')
+    parser.add_argument('-e', '--env', action='append', metavar='ENV_ID',
+                        help='env id to benchmark, as many times as needed. '
+                             'Default: CartPole-v1 and GymieBenchImage-v0')
+    parser.add_argument('-c', '--clients', default=4, type=int,
+                        help='number of concurrent connections')
+    parser.add_argument('-i', '--instances', type=int,
+                        help='number of instances, shared out among the clients. Default: one per client')
+    parser.add_argument('-d', '--duration', default=10, type=float, metavar='SECONDS',
+                        help='seconds measured per env id')
+    parser.add_argument('-w', '--warmup', default=2, type=float, metavar='SECONDS',
+                        help='seconds before measuring starts')
+    parser.add_argument('--encoding', default='json', choices=['json', 'binary'])
+    parser.add_argument('--server', default='subprocess', choices=['subprocess', 'inprocess', 'external'],
+                        help='where the server runs. `inprocess` shares the CPU with the clients')
+    parser.add_argument('-b', '--backend', default='eventlet', choices=server.BACKENDS)
+    parser.add_argument('-l', '--host', default='127.0.0.1', help='host of an external server')
+    parser.add_argument('-p', '--port', type=int, help='port of an external server')
+    parser.add_argument('--server-arg', action='append', default=[], metavar='ARG',
+                        help='extra option for a subprocess server, e.g. --server-arg=--env-workers')
+    parser.add_argument('--json', metavar='PATH',
+                        help='write the results as JSON to this file, `-` for stdout')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args, extra = parser.parse_known_args(argv)
+
+    if args.serve:
+        serve([arg for arg in (argv or sys.argv[1:]) if arg != '--serve'])
+        return
+
+    if extra:
+        parser.error('unrecognized arguments: {}'.format(' '.join(extra)))
+
+    instances = args.instances or args.clients
+    if instances < args.clients:
+        parser.error('there must be at least one instance per client')
+
+    host = args.host if args.server == 'external' else '127.0.0.1'
+    port = args.port or (5000 if args.server == 'external' else free_port())
+    process = launch(args.server, port, args.backend, args.server_arg)
+
+    try:
+        wait_for_server(host, port)
+        results = []
+
+        for env_id in args.env or ['CartPole-v1', 'GymieBenchImage-v0']:
+            result = run(host, port, env_id, args.clients, instances,
+                         args.duration, args.warmup, args.encoding)
+            results.append(result)
+            print(format_results([result]).splitlines()[-1] if len(results) > 1
+                  else format_results([result]), file=sys.stderr, flush=True)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {'version': __version__,
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpus': os.cpu_count(),
+              'server': args.server,
+              'backend': args.backend,
+              'server_args': args.server_arg,
+              'results': results}
+
+    if args.json == '-':
+        print(json.dumps(report, indent=2))
+    elif args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+    return report
+
+if __name__ == '__main__':
+    main()
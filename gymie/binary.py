@@ -0,0 +1,105 @@
+import json
+import struct
+import numpy as np
+from gymie.codec import builtin
+
+
+##############################
+# Binary ndarray wire format #
+##############################
+
+# A binary frame has the following layout:
+#
+#   | header length | header                  | padding | array buffer |
+#   | uint32 (LE)   | UTF-8 JSON (dtype, ...) | spaces  | raw bytes    |
+#
+# The header length includes the padding, which keeps the array buffer
+# aligned so clients can map it without copying (e.g. np.frombuffer or
+# a JavaScript TypedArray).
+HEADER_LENGTH = struct.Struct('<I')
+ALIGNMENT = 8
+
+def encode(array, **header):
+    """Packs an array and some extra information into a binary frame
+
+    Args:
+        array (np.array|number|list): array to send to the client
+        **header: extra JSON serializable information such as reward,
+            done or info that travels along with the array
+
+    Returns:
+        Binary frame (bytes)
+    """
+    array = np.asarray(array)
+    if not array.flags.c_contiguous:
+        array = array.copy(order='C')
+
+    header['dtype'] = array.dtype.str
+    header['shape'] = array.shape
+
+    # memoryview gives us access to the array's buffer without copying it
+    buffer = memoryview(array.reshape(-1).view(np.uint8))
+
+    return pack(header, buffer)
+
+def pack(header, buffer):
+    """Joins header, padding and buffer into a binary frame
+
+    Args:
+        header (dict): JSON serializable header
+        buffer (bytes-like): raw array buffer
+
+    Returns:
+        Binary frame (bytes)
+    """
+    header = json.dumps(header, default=builtin).encode('utf-8')
+    header += b' ' * (-(HEADER_LENGTH.size + len(header)) % ALIGNMENT)
+
+    return b''.join((HEADER_LENGTH.pack(len(header)), header, buffer))
+
+def split(frame):
+    """Splits a binary frame into its header and raw buffer
+
+    Args:
+        frame (bytes): binary frame generated by `encode`
+
+    Returns:
+        Tuple with the header (dict) and the buffer (memoryview)
+    """
+    (length,) = HEADER_LENGTH.unpack_from(frame)
+    offset = HEADER_LENGTH.size + length
+    header = json.loads(bytes(frame[HEADER_LENGTH.size:offset]))
+
+    return header, memoryview(frame)[offset:]
+
+def update_header(frame, **extra):
+    """Adds information to the header of an already encoded frame
+
+    Args:
+        frame (bytes): binary frame generated by `encode`
+        **extra: JSON serializable information to add
+
+    Returns:
+        New binary frame (bytes)
+    """
+    header, buffer = split(frame)
+    header.update(extra)
+    return pack(header, buffer)
+
+def decode(frame):
+    """Unpacks a binary frame. Useful for Python clients and testing
+
+    Args:
+        frame (bytes): binary frame generated by `encode`
+
+    Returns:
+        Tuple with the header (dict) and the array (np.array),
+        which is a read-only view on the frame
+    """
+    header, buffer = split(frame)
+
+    dtype = np.dtype(header['dtype'])
+    count = int(np.prod(header['shape']))
+    array = np.frombuffer(buffer, dtype=dtype, count=count)
+
+    return header, array.reshape(header['shape'])
@@ -0,0 +1,177 @@
+import json
+import socket
+import struct
+from gymie import rfc6455
+from gymie.exceptions import ConnectionClosed
+
+
+############################
+# Minimal WebSocket client #
+############################
+
+class Client():
+    """Blocking WebSocket client for Gymie. It keeps count of the
+    bytes going each way, so it can be used to measure payloads
+
+    Args:
+        host (str): optional; server host
+        port (int): optional; server port
+        path (str): optional; WebSocket path
+        timeout (float): optional; seconds to wait for the server
+
+    Raises:
+        ConnectionError: the server didn't accept the WebSocket handshake
+    """
+
+    def __init__(self, host='localhost', port=5000, path='/gym', timeout=None):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile('rb')
+        self.sent = 0
+        self.received = 0
+
+        key = rfc6455.new_key()
+        self.sock.sendall(('GET {} HTTP/1.1\r\n'
+                           'Host: {}:{}\r\n'
+                           'Upgrade: websocket\r\n'
+                           'Connection: Upgrade\r\n'
+                           'Sec-WebSocket-Key: {}\r\n'
+                           'Sec-WebSocket-Version: 13\r\n\r\n').format(path, host, port, key).encode('latin-1'))
+
+        status = self.file.readline().decode('latin-1')
+        headers = read_headers(self.file)
+
+        if ' 101 ' not in status or headers.get('sec-websocket-accept') != rfc6455.accept_key(key):
+            self.close()
+            raise ConnectionError('WebSocket handshake failed: {}'.format(status.strip()))
+
+    def send(self, message):
+        """Sends a message to the server
+
+        Args:
+            message (str|bytes): text or binary message
+        """
+        frame = rfc6455.pack_frame(message, masked=True)
+        self.sent += len(frame)
+        self.sock.sendall(frame)
+
+    def receive(self):
+        """Waits for the next message of the server, answering pings
+
+        Returns:
+            Message, str for text and bytes for binary
+
+        Raises:
+            ConnectionClosed: the server closed the connection
+        """
+        fragments = []
+        message_opcode = None
+
+        while True:
+            header = self.read(2)
+            fin, opcode, masked, length = rfc6455.parse_header(header)
+
+            if length == 126:
+                (length,) = struct.unpack('!H', self.read(2))
+            elif length == 127:
+                (length,) = struct.unpack('!Q', self.read(8))
+
+            key = self.read(4) if masked else None
+            payload = self.read(length)
+
+            if key:
+                payload = rfc6455.mask(payload, key)
+
+            if opcode == rfc6455.CLOSE:
+                raise ConnectionClosed(*(rfc6455.parse_close(payload) or (1005, '')))
+            elif opcode == rfc6455.PING:
+                self.sock.sendall(rfc6455.pack_frame(payload, rfc6455.PONG, masked=True))
+                continue
+            elif opcode == rfc6455.PONG:
+                continue
+
+            if opcode != rfc6455.CONTINUATION:
+                message_opcode = opcode
+            fragments.append(payload)
+
+            if fin:
+                message = b''.join(fragments)
+                self.received += len(message)
+                return message.decode('utf-8') if message_opcode == rfc6455.TEXT else message
+
+    def read(self, size):
+        """Reads exactly `size` bytes
+
+        Raises:
+            ConnectionClosed: the connection was closed halfway
+        """
+        data = self.file.read(size)
+        if len(data) < size:
+            raise ConnectionClosed(1006, 'Connection lost')
+        return data
+
+    def request(self, method, **params):
+        """Calls an API method and waits for the response
+
+        Args:
+            method (str): API method
+            **params: parameters of the method
+
+        Returns:
+            Response, str for text and bytes for binary
+        """
+        self.send(json.dumps({'method': method, 'params': params}))
+        return self.receive()
+
+    def close(self):
+        """Closes the connection"""
+        try:
+            self.sock.sendall(rfc6455.pack_frame(rfc6455.pack_close((1000, '')), rfc6455.CLOSE, masked=True))
+        except OSError:
+            pass
+        finally:
+            self.file.close()
+            self.sock.close()
+
+
+def read_headers(file):
+    """Reads HTTP headers until the empty line
+
+    Args:
+        file: file-like object to read from
+
+    Returns:
+        Dictionary of lowercase headers
+    """
+    headers = {}
+
+    while True:
+        line = file.readline().decode('latin-1').strip()
+        if not line:
+            return headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+def http_get(host, port, path, timeout=None):
+    """Makes a plain HTTP GET request, e.g. to scrape `/metrics`
+
+    Args:
+        host (str): server host
+        port (int): server port
+        path (str): path to request
+        timeout (float): optional; seconds to wait for the server
+
+    Returns:
+        Body of the response (str)
+    """
+    with socket.create_connection((host, port), timeout) as sock:
+        sock.sendall('GET {} HTTP/1.0\r\nHost: {}:{}\r\n\r\n'
+                     .format(path, host, port).encode('latin-1'))
+
+        with sock.makefile('rb') as file:
+            file.readline()
+            headers = read_headers(file)
+
+            if 'content-length' in headers:
+                return file.read(int(headers['content-length'])).decode('utf-8')
+            return file.read().decode('utf-8')
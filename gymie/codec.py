@@ -0,0 +1,117 @@
+import json
+import numpy as np
+
+
+###########################
+# JSON codecs for the API #
+###########################
+
+# Codecs that can be selected with `use`, keyed by name
+codecs = {}
+
+def codec(cls):
+    """Decorator that registers a codec under its name"""
+    codecs[cls.name] = cls
+    return cls
+
+def builtin(value):
+    """Converts numpy arrays and scalars into Python values.
+    Used by the encoders for values they can't serialize natively
+
+    Args:
+        value: value the encoder doesn't know
+
+    Returns:
+        Python list, number or bool
+
+    Raises:
+        TypeError: the value isn't a numpy array or scalar
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+@codec
+class JsonCodec():
+    """Standard library codec, the default one. Its output is
+    byte-identical to what Gymie has always sent"""
+
+    name = 'json'
+
+    def dumps(self, value):
+        """Serializes a value, which can contain numpy arrays and scalars
+
+        Args:
+            value: value to serialize
+
+        Returns:
+            JSON string
+        """
+        return json.dumps(value, default=builtin)
+
+    def literal(self, value):
+        """Serializes a single observation or action the way `reset`
+        and `action_sample` have always done it, as a Python literal
+
+        Args:
+            value: value to serialize
+
+        Returns:
+            String
+        """
+        return str(value.tolist() if hasattr(value, 'tolist') else value)
+
+
+@codec
+class OrjsonCodec():
+    """Fast codec built on orjson, which serializes numpy arrays and
+    scalars natively, without building lists of Python floats first.
+    Its output is compact, e.g. `[1,2]` instead of `[1, 2]`, and `NaN`
+    and `Infinity` become `null`. It needs the `orjson` package
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, value):
+        return self.orjson.dumps(value, default=builtin, option=self.option).decode('utf-8')
+
+    def literal(self, value):
+        return self.dumps(value)
+
+
+# Codec used by the API methods
+current = JsonCodec()
+
+def use(name):
+    """Selects the codec used by the API methods. If the codec
+    can't be loaded, the standard library one is used instead
+
+    Args:
+        name (str): codec name, see `codecs`
+
+    Returns:
+        Name of the codec in use
+    """
+    global current
+
+    try:
+        current = codecs[name]()
+    except ImportError as err:
+        print(f'Codec `{name}` not available ({err}), using `json`')
+        current = JsonCodec()
+
+    return current.name
+
+def dumps(value):
+    """Serializes a value with the current codec, see `JsonCodec.dumps`"""
+    return current.dumps(value)
+
+def literal(value):
+    """Serializes an observation or action with the current codec, see `JsonCodec.literal`"""
+    return current.literal(value)
@@ -17,3 +17,35 @@ class EnvironmentNotFound(Exception):
 class WrongAction(Exception):
     """There was a problem executing the action on the environment"""
     pass
+
+class EncodingNotSupported(Exception):
+    """The encoding requested by the client is not supported"""
+    pass
+
+class CapacityReached(Exception):
+    """Maximum number of instances alive at the same time has been reached"""
+    pass
+
+class ConnectionClosed(Exception):
+    """The server closed the connection, with a status code and a reason"""
+    pass
+
+class SnapshotNotFound(Exception):
+    """Snapshot is not found in the store, it was evicted or belongs to another connection"""
+    pass
+
+class StateNotSupported(Exception):
+    """The state of the environment can't be cloned"""
+    pass
+
+class RecordingNotFound(Exception):
+    """Recording is not found in the recording directory"""
+    pass
+
+class ReplayNotFound(Exception):
+    """Replay is not open or belongs to another connection"""
+    pass
+
+class BackendNotFound(Exception):
+    """Env backend is not registered or its package is not installed"""
+    pass
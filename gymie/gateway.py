@@ -0,0 +1,475 @@
+import json
+import bisect
+import hashlib
+import eventlet
+import numpy as np
+from time import perf_counter
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from eventlet import wsgi, websocket
+from gymie import binary, metrics
+from gymie.api import ENCODINGS
+from gymie.outbox import Outbox
+from gymie.protocol import Reply, decode, record
+from gymie.server import Lanes
+from gymie.exceptions import *
+
+# Client with green sockets, so waiting for a shard doesn't block the hub
+client = eventlet.import_patched('gymie.client')
+
+
+###################################
+# Gateway sharding across servers #
+###################################
+
+# Ways of choosing the shard where `make` creates an instance
+STRATEGIES = ['least-loaded', 'hash']
+
+# Gymie servers behind the gateway
+shards = []
+
+# Consistent hash ring, used with the `hash` strategy
+ring = None
+
+strategy = 'least-loaded'
+
+# Idle connections kept per shard and encoding
+max_idle = 16
+
+# State of each client connection, keyed by socket
+sessions = {}
+
+# Responses of batch methods carry these per instance lists,
+# besides the observations, and can be merged across shards
+BATCH_FIELDS = {
+    'step_batch': ('rewards', 'dones', 'infos'),
+    'reset_batch': (),
+}
+
+
+class Shard():
+    """Gymie server behind the gateway. It keeps a pool of persistent
+    connections, per encoding, used to forward requests for its instances
+
+    Args:
+        index (int): position of the shard, encoded in the instance ids
+        address (str): `host:port` of the server
+    """
+
+    def __init__(self, index, address):
+        host, _, port = address.rpartition(':')
+        self.index = index
+        self.address = address
+        self.host = host or 'localhost'
+        self.port = int(port)
+        self.instances = 0
+        self.idle = {encoding: deque() for encoding in ENCODINGS}
+
+    def connect(self, encoding='json'):
+        """Opens a new connection to the shard
+
+        Args:
+            encoding (str): optional; encoding negotiated for the connection
+
+        Returns:
+            Client
+        """
+        conn = client.Client(self.host, self.port)
+        if encoding != 'json':
+            conn.request('set_encoding', encoding=encoding)
+        conn.encoding = encoding
+        return conn
+
+    @contextmanager
+    def connection(self, encoding):
+        """Lends a pooled connection. It goes back to the pool
+        afterwards, unless something went wrong with it
+
+        Args:
+            encoding (str): encoding of the connection
+        """
+        idle = self.idle[encoding]
+        conn = idle.pop() if idle else self.connect(encoding)
+
+        try:
+            yield conn
+        except:
+            conn.close()
+            raise
+
+        if len(idle) < max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def request(self, encoding, method, **params):
+        """Forwards a request through a pooled connection
+
+        Args:
+            encoding (str): encoding of the connection
+            method (str): API method
+            **params: parameters of the method
+
+        Returns:
+            Response of the shard
+        """
+        with self.connection(encoding) as conn:
+            return conn.request(method, **params)
+
+
+class Ring():
+    """Consistent hash ring. Each shard is placed at several points
+    of the ring, so keys spread evenly and only a few move when
+    the list of shards changes
+
+    Args:
+        shards (list(Shard)): shards to place in the ring
+        replicas (int): optional; points per shard
+    """
+
+    def __init__(self, shards, replicas=64):
+        points = sorted(((key_hash('{}#{}'.format(shard.address, i)), shard)
+                         for shard in shards for i in range(replicas)),
+                        key=lambda point: point[0])
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def lookup(self, key):
+        """Finds the shard a key belongs to"""
+        index = bisect.bisect(self.hashes, key_hash(key)) % len(self.hashes)
+        return self.shards[index]
+
+def key_hash(key):
+    """Hashes a string into a 32 bits integer, stable across processes"""
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16)
+
+
+class Session():
+    """Gateway side state of a client connection. Instances are made
+    through connections owned by the session, one per shard, so they're
+    closed by the shards when the session ends
+    """
+
+    def __init__(self):
+        self.encoding = 'json'
+        self.owners = {}
+        self.instances = set()
+
+    def owner(self, shard):
+        """Returns the connection of the session to a shard, opening it if needed"""
+        if shard.index not in self.owners:
+            self.owners[shard.index] = shard.connect()
+        return self.owners[shard.index]
+
+
+def session(ws):
+    """Returns the session of a connection, creating it if needed"""
+    if ws not in sessions:
+        sessions[ws] = Session()
+    return sessions[ws]
+
+def choose(env_id):
+    """Chooses the shard where a new instance goes
+
+    Args:
+        env_id (str): environment id
+
+    Returns:
+        Shard
+    """
+    if strategy == 'hash':
+        return ring.lookup(env_id)
+    return min(shards, key=lambda shard: shard.instances)
+
+def locate(instance_id):
+    """Finds the shard of an instance, encoded in its id as `shard-id`
+
+    Args:
+        instance_id (str): instance id handed out by the gateway
+
+    Returns:
+        Tuple with the shard and the instance id in that shard
+
+    Raises:
+        InstanceNotFound: the id doesn't belong to any shard
+    """
+    index, _, shard_instance_id = str(instance_id).partition('-')
+
+    if not index.isdigit() or int(index) >= len(shards) or not shard_instance_id:
+        raise InstanceNotFound(instance_id)
+
+    return shards[int(index)], shard_instance_id
+
+
+##########
+# Routes #
+##########
+
+def make(ws, session, env_id, **params):
+    """Makes an instance in the shard chosen by the strategy"""
+    shard = choose(env_id)
+    shard_instance_id = session.owner(shard).request('make', env_id=env_id, **params)
+
+    instance_id = '{}-{}'.format(shard.index, shard_instance_id)
+    shard.instances += 1
+    session.instances.add(instance_id)
+    ws.send(instance_id)
+
+def set_encoding(ws, session, encoding):
+    """Negotiates the encoding of the session. Requests are
+    then forwarded through connections with the same encoding"""
+    if encoding not in ENCODINGS:
+        raise EncodingNotSupported(encoding)
+
+    session.encoding = encoding
+    ws.send(json.dumps(True))
+
+def set_profiling(ws, session, enabled):
+    """Turns the profiler of every shard on or off"""
+    for shard in shards:
+        shard.request('json', 'set_profiling', enabled=enabled)
+    ws.send(json.dumps(bool(enabled)))
+
+routes = {
+    'make': make,
+    'set_encoding': set_encoding,
+    'set_profiling': set_profiling,
+}
+
+def forward_instance(ws, session, method, instance_id, **params):
+    """Forwards a request for a single instance to its shard"""
+    shard, shard_instance_id = locate(instance_id)
+    response = shard.request(session.encoding, method, instance_id=shard_instance_id, **params)
+
+    if method == 'close' and instance_id in session.instances:
+        session.instances.discard(instance_id)
+        shard.instances -= 1
+
+    relay(ws, response)
+
+def forward_batch(ws, session, method, instance_ids, actions=None, **params):
+    """Forwards a request for several instances. Instances are grouped
+    by shard, shards are called concurrently and their responses merged"""
+    if actions is not None:
+        if len(actions) != len(instance_ids):
+            raise TypeError('Expected one action per instance id')
+        params['actions'] = actions
+
+    groups = OrderedDict()
+    for position, instance_id in enumerate(instance_ids):
+        shard, shard_instance_id = locate(instance_id)
+        positions, shard_instance_ids = groups.setdefault(shard, ([], []))
+        positions.append(position)
+        shard_instance_ids.append(shard_instance_id)
+
+    if len(groups) > 1 and method not in BATCH_FIELDS:
+        raise TypeError('Method `{}` can not span several shards'.format(method))
+
+    pile = eventlet.GreenPile()
+    for shard, (positions, shard_instance_ids) in groups.items():
+        shard_params = dict(params, instance_ids=shard_instance_ids)
+        if actions is not None:
+            shard_params['actions'] = [actions[position] for position in positions]
+        pile.spawn(shard.request, session.encoding, method, **shard_params)
+
+    responses = list(pile)
+
+    if len(responses) == 1:
+        relay(ws, responses[0])
+    else:
+        positions = [positions for positions, _ in groups.values()]
+        tag = {'id': ws.request_id} if ws.tagged else {}
+        ws.send(merge(BATCH_FIELDS[method], responses, positions, len(instance_ids), **tag))
+
+def relay(ws, response):
+    """Sends the response of a shard to the client. Shards don't know the
+    id of the request, so binary frames get it in their header here
+
+    Args:
+        ws (Reply): proxy of the socket answering the request
+        response (str|bytes): response of the shard
+    """
+    if ws.tagged and isinstance(response, bytes):
+        response = binary.update_header(response, id=ws.request_id)
+    ws.send(response)
+
+def merge(fields, responses, positions, count, **header):
+    """Merges the responses of several shards to a batch method,
+    putting every result back in the position it was requested
+
+    Args:
+        fields (tuple(str)): per instance lists besides the observations
+        responses (list(str|bytes)): responses of the shards
+        positions (list(list(int))): positions of the results of each shard
+        count (int): total number of results
+        **header: extra information for the binary frame, such as the request id
+
+    Returns:
+        Binary frame if all the shards answered with one, otherwise JSON
+    """
+    observations = [None] * count
+    merged = {field: [None] * count for field in fields}
+
+    for response, shard_positions in zip(responses, positions):
+        if isinstance(response, bytes):
+            header, array = binary.decode(response)
+            values = [header[field] for field in fields]
+        else:
+            decoded = json.loads(response)
+            array, values = (decoded[0], decoded[1:]) if fields else (decoded, [])
+
+        for i, position in enumerate(shard_positions):
+            observations[position] = array[i]
+            for field, value in zip(fields, values):
+                merged[field][position] = value[i]
+
+    if all(isinstance(response, bytes) for response in responses):
+        return binary.encode(np.stack(observations), **merged, **header)
+
+    observations = [np.asarray(observation).tolist() for observation in observations]
+    if not fields:
+        return json.dumps(observations)
+    return json.dumps([observations] + [merged[field] for field in fields])
+
+def forward(ws, data):
+    """Serves a request of a client by forwarding it to the right shard.
+    Errors closing the connection to a shard are relayed to the client
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        data (dict): decoded message with `method`, `params` and optional `id`
+    """
+    method = data['method']
+    params = data['params']
+    reply = Reply(ws, data)
+    started = perf_counter()
+
+    if method in routes:
+        route = routes[method]
+    elif isinstance(params, dict) and 'instance_id' in params:
+        route = lambda ws, session, **params: forward_instance(ws, session, method, **params)
+    elif isinstance(params, dict) and 'instance_ids' in params:
+        route = lambda ws, session, **params: forward_batch(ws, session, method, **params)
+    else:
+        route = None
+
+    try:
+        if route is None:
+            reply.close((1007, 'Method `{}` not found'.format(method)))
+        else:
+            route(reply, session(ws), **params)
+    except TypeError:
+        reply.close((1007, 'Parameters `{}` are wrong'.format(params)))
+    except InstanceNotFound as instance_id:
+        reply.close((1007, 'Instance `{}` not found'.format(instance_id)))
+    except EncodingNotSupported as encoding:
+        reply.close((1007, 'Encoding `{}` not supported'.format(encoding)))
+    except ConnectionClosed as err:
+        reply.close(err.args)
+    except OSError as err:
+        reply.close((1011, 'Shard unavailable: {}'.format(err)))
+    except Exception as err:
+        reply.close((1007, 'Unknonwn error: {}'.format(err)))
+    finally:
+        record(reply, method if route is not None else 'unknown', '', perf_counter() - started)
+
+def disconnect(ws):
+    """Ends the session of a connection. Closing its connections
+    to the shards makes them close the instances it made
+
+    Args:
+        ws (WebSocket): socket of the connection
+    """
+    state = sessions.pop(ws, None)
+    if state is None:
+        return
+
+    for instance_id in state.instances:
+        locate(instance_id)[0].instances -= 1
+
+    for conn in state.owners.values():
+        conn.close()
+
+
+#####################
+# WebSocket gateway #
+#####################
+
+@websocket.WebSocketWSGI
+def gateway_handle(ws):
+    """This function handles socket communication
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+    """
+    outbox = Outbox(ws)
+    lanes = Lanes(outbox, forward)
+
+    try:
+        while True:
+            message = ws.wait()
+            if message is None:
+                break
+
+            data = decode(outbox, message)
+            if data is not None:
+                lanes.submit(data)
+    finally:
+        lanes.wait()
+        disconnect(outbox)
+        outbox.finish()
+
+def dispatch(environ, start_response):
+    """WSGI application function of the gateway"""
+    if environ['PATH_INFO'] == '/gym':
+        return gateway_handle(environ, start_response)
+    elif environ['PATH_INFO'] == '/metrics':
+        start_response('200 OK', [('Content-Type', metrics.CONTENT_TYPE)])
+        return [metrics.render().encode('utf-8')]
+    else:
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return ['Gymie gateway is running...']
+
+def shard_instances():
+    """Counts the instances made through the gateway per shard"""
+    return {(shard.address,): shard.instances for shard in shards}
+
+metrics.Gauge('gymie_gateway_instances',
+              'Instances made through the gateway, by shard',
+              ('shard',),
+              shard_instances)
+
+def configure(addresses, shard_strategy='least-loaded'):
+    """Sets up the shards behind the gateway
+
+    Args:
+        addresses (list(str)): `host:port` of each Gymie server
+        shard_strategy (str): optional; `least-loaded` or `hash`
+    """
+    global ring, strategy
+
+    assert shard_strategy in STRATEGIES, \
+        'Strategy `{}` not available. Strategies: {}'.format(shard_strategy, STRATEGIES)
+
+    shards[:] = [Shard(index, address) for index, address in enumerate(addresses)]
+    ring = Ring(shards)
+    strategy = shard_strategy
+
+def start(host, port, addresses, shard_strategy='least-loaded', reuse_port=False):
+    """Starts the gateway
+
+    Args:
+        host (str): host to listen on
+        port (int): port to listen on
+        addresses (list(str)): `host:port` of each Gymie server
+        shard_strategy (str): optional; `least-loaded` or `hash`
+        reuse_port (bool): optional; whether the port is shared with other workers
+    """
+    configure(addresses, shard_strategy)
+
+    try:
+        listener = eventlet.listen((host, port), reuse_port=reuse_port)
+    except OSError as err:
+        print(f'Address http://{host}:{port} already in use')
+    else:
+        wsgi.server(listener, dispatch)
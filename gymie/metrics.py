@@ -0,0 +1,226 @@
+import time
+import bisect
+import threading
+from collections import Counter as Tally
+
+
+##############################
+# Prometheus text exposition #
+##############################
+
+# Metrics rendered by `/metrics`, in order of creation
+registry = []
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape(value):
+    """Escapes a label value for the text exposition format
+
+    Args:
+        value: label value
+
+    Returns:
+        Escaped string
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=''):
+    """Formats a set of labels, e.g. `{method="step",env_id="CartPole-v1"}`
+
+    Args:
+        names (tuple(str)): label names
+        values (tuple): label values
+        extra (str): optional; already formatted label to append
+
+    Returns:
+        Formatted labels, or an empty string if there are none
+    """
+    labels = ['{}="{}"'.format(name, escape(value)) for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Metric():
+    """Base class of the metrics. Values are kept per combination
+    of label values and updated under a lock, since the asyncio
+    backend runs API methods in several threads
+
+    Args:
+        name (str): metric name
+        help (str): description of the metric
+        labels (tuple(str)): optional; label names
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def samples(self):
+        """Generates the lines with the values of the metric"""
+        return []
+
+    def render(self):
+        """Renders the metric in Prometheus text format
+
+        Returns:
+            List of lines
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        return lines + list(self.samples())
+
+
+class Counter(Metric):
+    """Value that only goes up"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = Tally()
+
+    def inc(self, *label_values, amount=1):
+        """Increments the counter
+
+        Args:
+            *label_values: one value per label
+            amount (number): optional; how much to increment
+        """
+        with self.lock:
+            self.values[label_values] += amount
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+
+        for label_values, value in values:
+            yield '{}{} {}'.format(self.name, format_labels(self.labels, label_values), value)
+
+
+class Gauge(Metric):
+    """Value computed when the metrics are scraped, so it costs
+    nothing while serving requests
+
+    Args:
+        collect (callable): function returning a dictionary
+            of label values (tuple) to value
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=dict):
+        super().__init__(name, help, labels)
+        self.collect = collect
+
+    def samples(self):
+        for label_values, value in self.collect().items():
+            yield '{}{} {}'.format(self.name, format_labels(self.labels, label_values), value)
+
+
+class Histogram(Metric):
+    """Distribution of observed values, such as latencies
+
+    Args:
+        buckets (list(float)): upper bounds of the buckets
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=()):
+        super().__init__(name, help, labels)
+        self.buckets = sorted(buckets)
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        """Observes a value
+
+        Args:
+            value (float): observed value
+            *label_values: one value per label
+        """
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self.lock:
+            if label_values not in self.values:
+                self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts, _ = entry = self.values[label_values]
+            counts[index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self.lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self.values.items()]
+
+        for label_values, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += count
+                labels = format_labels(self.labels, label_values, 'le="{}"'.format(bound))
+                yield '{}_bucket{} {}'.format(self.name, labels, cumulative)
+
+            labels = format_labels(self.labels, label_values)
+            yield '{}_sum{} {}'.format(self.name, labels, total)
+            yield '{}_count{} {}'.format(self.name, labels, cumulative)
+
+
+def render():
+    """Renders all the registered metrics
+
+    Returns:
+        Prometheus text exposition (str)
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+###################
+# Gymie's metrics #
+###################
+
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+requests = Counter('gymie_requests_total',
+                   'Requests served, by API method and environment',
+                   ('method', 'env_id'))
+
+latency = Histogram('gymie_request_duration_seconds',
+                    'Time spent serving a request, by API method and environment',
+                    ('method', 'env_id'),
+                    LATENCY_BUCKETS)
+
+steps = Counter('gymie_steps_total',
+                'Environment steps executed, by environment',
+                ('env_id',))
+
+bytes_sent = Counter('gymie_sent_bytes_total',
+                     'Bytes of responses sent to clients, by API method',
+                     ('method',))
+
+errors = Counter('gymie_errors_total',
+                 'Connections closed because of an error, by close code',
+                 ('code',))
+
+def live_instances():
+    """Counts the instances alive per environment"""
+    from gymie import api
+    return Tally((env_id,) for env_id in list(api.env_ids.values()))
+
+instances = Gauge('gymie_instances',
+                  'Instances alive, by environment',
+                  ('env_id',),
+                  live_instances)
+
+cpu = Gauge('gymie_cpu_seconds',
+            'CPU time used by the server process, user and system',
+            (),
+            lambda: {(): time.process_time()})
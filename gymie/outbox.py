@@ -0,0 +1,148 @@
+import weakref
+import threading
+from gymie import metrics
+
+
+#################################
+# Bounded per-connection output #
+#################################
+
+# What happens to a message that doesn't fit in the send queue of its
+# connection: the sender waits for room (`block`), droppable messages,
+# such as render frames, are dropped while the rest wait (`drop`), or
+# the connection is closed (`disconnect`)
+POLICIES = ['block', 'drop', 'disconnect']
+
+# Bytes a connection can have waiting to be written. None means no limit
+limit = None
+
+# Overflow policy, see `POLICIES`
+policy = 'block'
+
+# Factory of the condition senders wait on. Servers replace it
+# with a cooperative version when senders are green threads
+condition = threading.Condition
+
+# Send queues of the connections alive
+outboxes = weakref.WeakSet()
+
+QUEUE_BUCKETS = [2 ** power for power in range(10, 31, 2)]
+
+queued = metrics.Gauge('gymie_send_queue_bytes',
+                       'Bytes waiting to be written to the clients',
+                       (),
+                       lambda: {(): sum(outbox.queued for outbox in list(outboxes))})
+
+high_water = metrics.Gauge('gymie_send_queue_high_water_bytes',
+                           'Largest send queue of any connection alive',
+                           (),
+                           lambda: {(): max([outbox.high_water for outbox in list(outboxes)], default=0)})
+
+closed_high_water = metrics.Histogram('gymie_send_queue_peak_bytes',
+                                      'Largest send queue of each closed connection',
+                                      (),
+                                      QUEUE_BUCKETS)
+
+overflows = metrics.Counter('gymie_send_queue_overflows_total',
+                            'Messages that found the send queue full, by what happened to them',
+                            ('outcome',))
+
+
+class Outbox():
+    """Socket proxy that bounds the bytes a connection has waiting to be
+    written, see `limit`. Messages are counted from the moment they're
+    sent until the socket has taken them, so a slow or stalled client
+    makes its senders wait, drops their frames or gets disconnected,
+    according to `policy`, instead of making the server buffer without
+    limit. It hashes and compares like the socket
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.limit = limit
+        self.policy = policy
+        self.queued = 0
+        self.high_water = 0
+        self.closed = False
+        self.condition = condition()
+        outboxes.add(self)
+
+    def full(self, size):
+        """Checks whether a message doesn't fit in the queue. A queue
+        that is empty takes any message, however big"""
+        return self.limit is not None and self.queued and self.queued + size > self.limit
+
+    def send(self, message, droppable=False):
+        """Sends a message to the client, or waits for room if the queue is full
+
+        Args:
+            message (str|bytes): text or binary message
+            droppable (bool): optional; whether the message can be dropped
+                when the queue is full, e.g. a render frame
+
+        Returns:
+            True if the message was sent
+        """
+        size = len(message)
+
+        with self.condition:
+            if self.full(size):
+                if self.policy == 'disconnect':
+                    overflows.inc('disconnected')
+                    overflow = True
+                elif self.policy == 'drop' and droppable:
+                    overflows.inc('dropped')
+                    return False
+                else:
+                    overflows.inc('blocked')
+                    overflow = False
+                    while self.full(size) and not self.closed:
+                        self.condition.wait()
+            else:
+                overflow = False
+
+            if self.closed and not overflow:
+                return False
+
+            if not overflow:
+                self.queued += size
+                self.high_water = max(self.high_water, self.queued)
+
+        if overflow:
+            self.close((1008, 'Send queue full'))
+            return False
+
+        try:
+            self.ws.send(message)
+        finally:
+            with self.condition:
+                self.queued -= size
+                self.condition.notify_all()
+
+        return True
+
+    def close(self, close_data=None):
+        """Closes the connection, waking up the senders waiting for room
+
+        Args:
+            close_data (tuple(int, str)): optional; status code and reason
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        self.ws.close(close_data)
+
+    def finish(self):
+        """Records the high-water mark once the connection is gone"""
+        outboxes.discard(self)
+        closed_high_water.observe(self.high_water)
+
+    def __hash__(self):
+        return hash(self.ws)
+
+    def __eq__(self, other):
+        return self.ws == getattr(other, 'ws', other)
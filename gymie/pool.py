@@ -0,0 +1,172 @@
+import gym
+import json
+import threading
+from collections import deque
+
+
+# Number of ready environments kept per env id and arguments.
+# Zero means there is no pool and every `make` builds a new one
+size = 0
+
+# Ready environments keyed by env id and arguments
+pools = {}
+
+# Keys of the pools being refilled at the moment
+refilling = set()
+
+lock = threading.Lock()
+
+
+def spawn(fn, *args):
+    """Runs a function in the background. Building an environment
+    can take seconds, so it happens in a thread, away from the server
+
+    Args:
+        fn: function to run
+        *args: arguments of the function
+    """
+    threading.Thread(target=fn, args=args, daemon=True).start()
+
+def pool_key(env_id, kwargs):
+    """Generates the key of the pool an environment belongs to
+
+    Args:
+        env_id (str): environment id
+        kwargs (dict): extra arguments used to build the environment
+
+    Returns:
+        String key
+    """
+    return json.dumps([env_id, kwargs], sort_keys=True)
+
+def refill(key, env_id, kwargs, factory):
+    """Builds and resets environments until the pool is full
+
+    Args:
+        key (str): key of the pool
+        env_id (str): environment id
+        kwargs (dict): extra arguments for the factory
+        factory (callable): function that builds an environment
+    """
+    try:
+        while len(pools[key]) < size:
+            env = factory(env_id, **kwargs)
+            env.reset()
+
+            with lock:
+                if len(pools[key]) < size:
+                    pools[key].append(env)
+                    continue
+
+            env.close()
+    except Exception as err:
+        print(f'Error refilling pool of {env_id}: {err}')
+    finally:
+        with lock:
+            refilling.discard(key)
+
+def schedule_refill(key, env_id, kwargs, factory):
+    """Refills the pool in the background, unless it's already happening
+
+    Args:
+        key (str): key of the pool
+        env_id (str): environment id
+        kwargs (dict): extra arguments for the factory
+        factory (callable): function that builds an environment
+    """
+    with lock:
+        pools.setdefault(key, deque())
+        if key in refilling:
+            return
+        refilling.add(key)
+
+    spawn(refill, key, env_id, kwargs, factory)
+
+def prewarm(env_id, factory, **kwargs):
+    """Fills the pool of an environment ahead of the first `make`
+
+    Args:
+        env_id (str): environment id
+        factory (callable): function that builds an environment
+        **kwargs: extra arguments for the factory
+    """
+    schedule_refill(pool_key(env_id, kwargs), env_id, kwargs, factory)
+
+def acquire(env_id, factory, **kwargs):
+    """Hands out a ready environment from the pool,
+    or builds a new one if the pool is empty
+
+    Args:
+        env_id (str): environment id
+        factory (callable): function that builds an environment
+        **kwargs: extra arguments for the factory
+
+    Returns:
+        Environment that goes back to the pool when closed
+    """
+    key = pool_key(env_id, kwargs)
+
+    with lock:
+        ready = pools.get(key)
+        env = ready.popleft() if ready else None
+
+    schedule_refill(key, env_id, kwargs, factory)
+
+    if env is None:
+        env = factory(env_id, **kwargs)
+
+    return PooledEnv(env, key)
+
+def release(key, env):
+    """Resets an environment in the background and puts it back
+    into its pool. It's closed instead if the pool is already full
+
+    Args:
+        key (str): key of the pool
+        env (Env): environment to release
+    """
+    def recycle():
+        try:
+            env.reset()
+        except Exception:
+            env.close()
+            return
+
+        with lock:
+            ready = pools.setdefault(key, deque())
+            if len(ready) < size:
+                ready.append(env)
+                return
+
+        env.close()
+
+    spawn(recycle)
+
+def clear():
+    """Closes all the environments waiting in the pools"""
+    with lock:
+        ready = [env for envs in pools.values() for env in envs]
+        pools.clear()
+
+    for env in ready:
+        env.close()
+
+
+class PooledEnv(gym.Wrapper):
+    """Environment handed out by the pool.
+    Closing it puts the environment back into the pool
+
+    Args:
+        env (Env): environment coming from the pool
+        key (str): key of the pool
+    """
+
+    def __init__(self, env, key):
+        super().__init__(env)
+        self.key = key
+        self.released = False
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            release(self.key, self.env)
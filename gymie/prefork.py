@@ -0,0 +1,105 @@
+import os
+import time
+import signal
+
+
+##################################
+# Pre-fork supervisor of servers #
+##################################
+
+# Seconds a worker has to stay up to be restarted right away. Workers
+# dying faster, e.g. because the port is taken, are restarted with backoff
+MIN_UPTIME = 1
+
+# Longest wait before restarting a worker
+MAX_BACKOFF = 30
+
+
+def exit_code(status):
+    """Converts the status returned by `os.wait` into an exit code,
+    negative if the process was killed by a signal"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def fork(serve):
+    """Forks a worker process running `serve`
+
+    Args:
+        serve (callable): function serving requests until the process ends
+
+    Returns:
+        Pid of the worker
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+
+    try:
+        serve()
+    except KeyboardInterrupt:
+        pass
+    except BaseException as err:
+        print(f'({os.getpid()}) worker crashed: {err}')
+        code = 1
+    finally:
+        os._exit(code)
+
+def supervise(count, serve):
+    """Forks `count` workers running `serve` and restarts them when they
+    die, until the supervisor gets SIGTERM or SIGINT, which are passed on.
+    Workers share the listening port with SO_REUSEPORT, so the kernel
+    spreads connections across them, and each has its own instances
+
+    Args:
+        count (int): number of workers
+        serve (callable): function serving requests until the process ends
+    """
+    workers = {}
+    backoff = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(count):
+        workers[fork(serve)] = (slot, time.monotonic())
+
+    print(f'({os.getpid()}) supervising {count} workers: {sorted(workers)}')
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+
+        if pid not in workers:
+            continue
+
+        slot, started = workers.pop(pid)
+        if stopping:
+            continue
+
+        print(f'({os.getpid()}) worker {pid} exited with code {exit_code(status)}, restarting')
+
+        if time.monotonic() - started < MIN_UPTIME:
+            backoff[slot] = min(backoff.get(slot, 0.5) * 2, MAX_BACKOFF)
+            time.sleep(backoff[slot])
+        else:
+            backoff.pop(slot, None)
+
+        if not stopping:
+            workers[fork(serve)] = (slot, time.monotonic())
@@ -0,0 +1,231 @@
+import gym
+import numpy as np
+from collections import deque
+
+
+# Preprocessing stages accessible via string key
+stages = {}
+
+
+def stage(fn):
+    """Decorator that populates the dictionary of preprocessing stages
+
+    Args:
+        fn: function that wraps an environment with the stage
+    """
+    stages[fn.__name__] = fn
+    return fn
+
+def apply(env, pipeline):
+    """Wraps an environment with a pipeline of preprocessing stages
+
+    Args:
+        env (Env): environment to preprocess
+        pipeline (list(dict)): stages to apply in order. Each stage is
+            a dictionary with its `name` and parameters, for instance
+            `{"name": "resize", "width": 84, "height": 84}`
+
+    Returns:
+        Wrapped environment
+
+    Raises:
+        TypeError: unknown stage or wrong parameters
+    """
+    for params in pipeline:
+        params = dict(params)
+        name = params.pop('name', None)
+
+        if name not in stages:
+            raise TypeError('Preprocessing stage `{}` not found'.format(name))
+
+        env = stages[name](env, **params)
+
+    return env
+
+
+class ObservationStage(gym.ObservationWrapper):
+    """Stage that transforms every observation with a vectorized function.
+    Bounds of the observation space go through the same function, so
+    the space reported to the client matches the new observations
+
+    Args:
+        env (Env): environment to wrap
+        transform (callable): function that transforms an observation
+
+    Raises:
+        TypeError: observation space isn't a Box
+    """
+
+    def __init__(self, env, transform):
+        super().__init__(env)
+
+        space = env.observation_space
+        if not isinstance(space, gym.spaces.Box):
+            raise TypeError('Preprocessing needs a Box observation space')
+
+        self.transform = transform
+        self.observation_space = gym.spaces.Box(low=transform(space.low),
+                                                high=transform(space.high),
+                                                dtype=space.dtype)
+
+    def observation(self, observation):
+        return self.transform(observation)
+
+
+def interpolation(size, new_size, method):
+    """Precomputes source indices and weights to resize one axis
+
+    Args:
+        size (int): current size of the axis
+        new_size (int): size after resizing
+        method (str): `nearest` or `bilinear`
+
+    Returns:
+        Tuple with lower indices, upper indices and
+        weights of the upper indices
+    """
+    coords = (np.arange(new_size) + 0.5) * size / new_size - 0.5
+    coords = np.clip(coords, 0, size - 1)
+
+    if method == 'nearest':
+        lower = np.round(coords).astype(np.intp)
+        return lower, lower, np.zeros(new_size, dtype=np.float32)
+
+    lower = np.floor(coords).astype(np.intp)
+    upper = np.minimum(lower + 1, size - 1)
+    return lower, upper, (coords - lower).astype(np.float32)
+
+def cast(array, dtype):
+    """Casts the result of a float operation back to the original dtype
+
+    Args:
+        array (np.array): float array
+        dtype (np.dtype): original dtype
+    """
+    if np.issubdtype(dtype, np.integer):
+        array = np.rint(array)
+    return array.astype(dtype, copy=False)
+
+
+##########
+# Stages #
+##########
+
+@stage
+def grayscale(env, keep_dim=False):
+    """Converts RGB observations (..., 3) into luminance
+
+    Args:
+        env (Env): environment to wrap
+        keep_dim (bool): optional; keeps a channel axis of size 1
+    """
+    weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    dtype = env.observation_space.dtype
+
+    def transform(observation):
+        gray = cast(np.dot(observation, weights), dtype)
+        return gray[..., np.newaxis] if keep_dim else gray
+
+    return ObservationStage(env, transform)
+
+@stage
+def resize(env, width, height, interpolation_method='bilinear'):
+    """Resizes image observations (height, width, ...)
+
+    Args:
+        env (Env): environment to wrap
+        width (int): new width
+        height (int): new height
+        interpolation_method (str): optional; `bilinear` or `nearest`
+    """
+    if interpolation_method not in ['bilinear', 'nearest']:
+        raise TypeError('Interpolation `{}` not supported'.format(interpolation_method))
+
+    shape = env.observation_space.shape
+    dtype = env.observation_space.dtype
+    extra_dims = (np.newaxis,) * (len(shape) - 2)
+
+    rows = interpolation(shape[0], height, interpolation_method)
+    cols = interpolation(shape[1], width, interpolation_method)
+    row_weights = rows[2][(slice(None), np.newaxis) + extra_dims]
+    col_weights = cols[2][(slice(None),) + extra_dims]
+
+    def transform(observation):
+        if interpolation_method == 'nearest':
+            return observation[rows[0]][:, cols[0]]
+
+        observation = observation.astype(np.float32)
+        top, bottom = observation[rows[0]], observation[rows[1]]
+        observation = top + (bottom - top) * row_weights
+
+        left, right = observation[:, cols[0]], observation[:, cols[1]]
+        return cast(left + (right - left) * col_weights, dtype)
+
+    return ObservationStage(env, transform)
+
+@stage
+def frame_stack(env, n=4):
+    """Stacks the last n observations along a new leading axis
+
+    Args:
+        env (Env): environment to wrap
+        n (int): optional; number of observations to stack
+    """
+    return FrameStack(env, n)
+
+@stage
+def frame_skip(env, skip=4, max_pool=True):
+    """Repeats every action several times, adding up the rewards
+
+    Args:
+        env (Env): environment to wrap
+        skip (int): optional; number of times the action is repeated
+        max_pool (bool): optional; returns the maximum of the last
+            two frames, removing the flickering of some games
+    """
+    return FrameSkip(env, skip, max_pool)
+
+
+class FrameStack(ObservationStage):
+    """Stacks the last n observations along a new leading axis"""
+
+    def __init__(self, env, n):
+        super().__init__(env, lambda observation: np.stack([observation] * n))
+        self.frames = deque(maxlen=n)
+
+    def reset(self, **kwargs):
+        observation = self.env.reset(**kwargs)
+        self.frames.extend([observation] * self.frames.maxlen)
+        return np.stack(self.frames)
+
+    def observation(self, observation):
+        self.frames.append(observation)
+        return np.stack(self.frames)
+
+
+class FrameSkip(gym.Wrapper):
+    """Repeats every action several times, adding up the rewards
+    and optionally max-pooling the last two frames"""
+
+    def __init__(self, env, skip, max_pool):
+        super().__init__(env)
+        self.skip = skip
+        self.max_pool = max_pool
+
+    def step(self, action):
+        total_reward = 0.0
+        previous = None
+
+        for i in range(self.skip):
+            observation, reward, done, info = self.env.step(action)
+            total_reward += reward
+
+            if done:
+                break
+            if i == self.skip - 2:
+                previous = observation
+
+        if self.max_pool and previous is not None:
+            observation = np.maximum(previous, observation)
+
+        return observation, total_reward, done, info
@@ -0,0 +1,253 @@
+import os
+import json
+import atexit
+import threading
+from time import perf_counter
+
+
+###########################
+# Hot-path phase profiler #
+###########################
+
+# Whether requests are being profiled. When off, the only cost
+# on the hot path is checking this flag and a few no-op phases
+enabled = False
+
+# Phases of a request, in the order they happen
+PHASES = ['decode', 'dispatch', 'env', 'serialize', 'send']
+
+# Key of the trace in a decoded request. It's not a string,
+# so it can't clash with anything sent by the client
+TRACE = object()
+
+# Timings aggregated since the last report, keyed by method and env id
+stats = {}
+
+# Trace events waiting to be written to the trace file
+events = []
+
+# Trace file in Chrome trace-event format, if any,
+# and number of events written to it
+trace_file = None
+written = 0
+
+# Chrome's trace viewer wants integer thread ids, one per lane
+tids = {}
+
+lock = threading.Lock()
+
+
+class Trace():
+    """Timings of the phases of a single request
+
+    Args:
+        started (float): `perf_counter` when the message arrived
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.phases = []
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def add(self, name, start, end):
+        self.phases.append((name, start, end))
+
+
+class Phase():
+    """Context manager timing a phase of a request"""
+
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.name, self.start, perf_counter())
+
+
+class NoPhase():
+    """Context manager used when the request isn't being profiled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+NO_PHASE = NoPhase()
+
+
+def phase(ws, name):
+    """Times a phase of the request being answered through `ws`
+
+    Args:
+        ws (Reply): socket proxy answering the request
+        name (str): phase name, see `PHASES`
+
+    Returns:
+        Context manager
+    """
+    trace = getattr(ws, 'trace', None)
+    return NO_PHASE if trace is None else trace.phase(name)
+
+def finish(trace, method, env_id, lane):
+    """Aggregates the timings of a request and queues its trace events
+
+    Args:
+        trace (Trace): timings of the request
+        method (str): API method
+        env_id (str): environment the request was about
+        lane (str): lane the request was served in, the instance id or None
+    """
+    ended = perf_counter()
+    durations = {}
+    for name, start, end in trace.phases:
+        durations[name] = durations.get(name, 0.0) + end - start
+    durations['total'] = ended - trace.started
+
+    with lock:
+        entry = stats.setdefault((method, env_id), {'count': 0, 'max': 0.0})
+        entry['count'] += 1
+        entry['max'] = max(entry['max'], durations['total'])
+        for name, duration in durations.items():
+            entry[name] = entry.get(name, 0.0) + duration
+
+        if trace_file is not None:
+            tid = tids.setdefault(lane, len(tids) + 1)
+            args = {'env_id': env_id, 'lane': lane}
+            events.append(event(method, 'request', trace.started, ended, tid, args))
+            for name, start, end in trace.phases:
+                events.append(event(name, 'phase', start, end, tid))
+
+def event(name, category, start, end, tid, args=None):
+    """Builds a complete (`X`) event of the Chrome trace-event format
+
+    Args:
+        name (str): event name
+        category (str): event category
+        start (float): `perf_counter` at the start
+        end (float): `perf_counter` at the end
+        tid (int): thread id, one per lane
+        args (dict): optional; extra information shown by the viewer
+
+    Returns:
+        Event (dict)
+    """
+    return {'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': tid,
+            'args': args or {}}
+
+def enable(trace_path=None):
+    """Starts profiling requests
+
+    Args:
+        trace_path (str): optional; file where trace events are written
+    """
+    global enabled, trace_file, written
+
+    with lock:
+        if trace_path and trace_file is None:
+            trace_file = open(trace_path, 'w')
+            trace_file.write('[\n')
+            written = 0
+        enabled = True
+
+def disable():
+    """Stops profiling requests. Timings and events gathered
+    so far are still reported and written"""
+    global enabled
+    enabled = False
+
+def flush():
+    """Writes the pending trace events to the trace file"""
+    global written
+
+    with lock:
+        pending = events[:]
+        del events[:]
+
+        if trace_file is None:
+            return
+
+        for trace_event in pending:
+            trace_file.write((',\n' if written else '') + json.dumps(trace_event))
+            written += 1
+        trace_file.flush()
+
+def close():
+    """Writes the pending trace events and closes the trace file"""
+    global trace_file
+
+    flush()
+    with lock:
+        if trace_file is not None:
+            trace_file.write('\n]\n')
+            trace_file.close()
+            trace_file = None
+
+atexit.register(close)
+
+def snapshot(reset=False):
+    """Returns the timings aggregated so far
+
+    Args:
+        reset (bool): optional; whether to start a new aggregation window
+
+    Returns:
+        Dictionary keyed by method and env id with the number of requests,
+        the maximum total time and the seconds spent in each phase
+    """
+    global stats
+
+    with lock:
+        current = stats
+        if reset:
+            stats = {}
+        else:
+            current = {key: dict(entry) for key, entry in current.items()}
+    return current
+
+def format_report(window):
+    """Formats aggregated timings as a table of mean milliseconds per phase
+
+    Args:
+        window (dict): timings, as returned by `snapshot`
+
+    Returns:
+        Report (str)
+    """
+    columns = PHASES + ['total']
+    lines = ['{:<16} {:<24} {:>8} '.format('method', 'env_id', 'count') +
+             ' '.join('{:>9}'.format(name) for name in columns) + ' {:>9}'.format('max')]
+
+    for (method, env_id), entry in sorted(window.items()):
+        count = entry['count']
+        means = [entry.get(name, 0.0) * 1000 / count for name in columns]
+        lines.append('{:<16} {:<24} {:>8} '.format(method, env_id[:24], count) +
+                     ' '.join('{:>9.3f}'.format(mean) for mean in means) +
+                     ' {:>9.3f}'.format(entry['max'] * 1000))
+
+    return '\n'.join(lines)
+
+def report():
+    """Prints the timings since the last report, in milliseconds,
+    and writes the pending trace events"""
+    window = snapshot(reset=True)
+    flush()
+
+    if window:
+        print(f'({os.getpid()}) profile, mean ms per request:')
+        print(format_report(window))
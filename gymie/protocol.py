@@ -0,0 +1,246 @@
+import json
+import time
+from gymie import metrics, profiler
+from gymie.api import public, env_ids
+from gymie.exceptions import *
+
+
+#######################################
+# Transport-independent message logic #
+#######################################
+
+class Reply():
+    """Socket proxy used to answer a request. It counts the bytes sent
+    and remembers the close code for the metrics and, if the client
+    tagged the request with an id, tags every response with it, so
+    clients can have several requests in flight on the same socket.
+    
+    Text responses are preceded by a JSON line with the id, `{"id": 7}\\n`,
+    and binary frames get the id in their header when they're encoded, see
+    `api.encode_binary`, so they're sent as they are. It hashes and compares
+    like the socket, so per-connection state is still found.
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        data (dict): decoded request, with an optional `id`
+    """
+
+    def __init__(self, ws, data):
+        self.ws = ws
+        self.tagged = 'id' in data
+        self.request_id = data.get('id')
+        self.sent = 0
+        self.close_code = None
+        self.trace = data.get(profiler.TRACE)
+
+        if self.tagged:
+            self.tag = json.dumps({'id': self.request_id}) + '\n'
+
+    def send(self, message, droppable=False):
+        if self.tagged and isinstance(message, str):
+            message = self.tag + message
+
+        self.sent += len(message)
+
+        if self.trace is None:
+            return self.ws.send(message, droppable=droppable)
+
+        with self.trace.phase('send'):
+            return self.ws.send(message, droppable=droppable)
+
+    def close(self, close_data=None):
+        if close_data is not None:
+            self.close_code = close_data[0]
+        self.ws.close(close_data)
+
+    def __hash__(self):
+        return hash(self.ws)
+
+    def __eq__(self, other):
+        return self.ws == getattr(other, 'ws', other)
+
+
+def lane_key(data):
+    """Returns the lane of a request. Requests tagged with an id and
+    targeting an instance go to the lane of that instance, the rest
+    go to a common lane. Lanes are served in order, concurrently
+    with each other
+
+    Args:
+        data (dict): decoded request
+
+    Returns:
+        Instance id, or None for the common lane
+    """
+    params = data['params']
+
+    if 'id' in data and isinstance(params, dict):
+        return params.get('instance_id')
+    
+    return None
+
+def decode(ws, message):
+    """Decodes the message received by the client
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        message (str): JSON string coming from the client
+    
+    Returns:
+        Dictionary with `method`, `params` and optional `id`,
+        or None if the message is wrong and the socket was closed
+    
+    Raises:
+        json.JSONDecodeError: 
+            there was a problem decoding the JSON string
+        KeyError: 
+            there was a problem with the parameters sent by the client
+    """
+    started = time.perf_counter() if profiler.enabled else None
+
+    try:
+        data = json.loads(message)
+        data['method'], data['params']
+    except json.JSONDecodeError:
+        ws.close((1003, 'Message `{}` is invalid'.format(message)))
+    except KeyError:
+        keys = str(list(data.keys()))
+        ws.close((1003, 'Message keys {} are missing or invalid'.format(keys)))
+    else:
+        if started is not None:
+            trace = data[profiler.TRACE] = profiler.Trace(started)
+            trace.add('decode', started, time.perf_counter())
+        return data
+    
+    metrics.errors.inc(1003)
+
+def call(ws, data):
+    """Executes the API method requested by the client
+
+    Args:
+        ws (WebSocket): socket for communication with the client
+        data (dict): decoded message with `method`, `params` and optional `id`
+    
+    Raises:
+        KeyError: 
+            there was a problem with the parameters sent by the client
+        TypeError: 
+            there was a problem with the parameters sent by the client
+        InstanceNotFound: 
+            instance id is not in the dictionary of envs
+        EnvironmentMalformed:
+            wrong environment's id
+        EnvironmentNotFound:
+            environment's id is not registered
+        BackendNotFound:
+            the env backend is not registered or installed
+        WrongAction:
+            there was a problem executing the action on the environment
+        EncodingNotSupported:
+            the encoding requested by the client is unknown
+        SnapshotNotFound:
+            the snapshot to restore doesn't exist
+        StateNotSupported:
+            the state of the environment can't be cloned
+        RecordingNotFound:
+            the recording to replay doesn't exist
+        ReplayNotFound:
+            the replay isn't open
+        CapacityReached:
+            there are too many instances alive
+        Exception:
+            there was an unknonwn error
+    """
+    method = data['method']
+    params = data['params']
+    env_label = request_env_id(method, params)
+    reply = Reply(ws, data)
+    started = time.perf_counter()
+
+    if reply.trace is not None:
+        reply.trace.add('dispatch', reply.trace.phases[-1][2], started)
+
+    try:
+        public[method](reply, **params)
+    except KeyError:
+        reply.close((1007, 'Method `{}` not found'.format(method)))
+    except TypeError:
+        reply.close((1007, 'Parameters `{}` are wrong'.format(params)))
+    except InstanceNotFound as instance_id:
+        reply.close((1007, 'Instance `{}` not found'.format(instance_id)))
+    except EnvironmentMalformed as env_id:
+        reply.close((1007, 'Environment `{}` is malformed'.format(env_id)))
+    except EnvironmentNotFound as env_id:
+        reply.close((1007, 'Environment `{}` not found'.format(env_id)))
+    except BackendNotFound as backend:
+        reply.close((1007, 'Backend `{}` not found'.format(backend)))
+    except WrongAction as action:
+        reply.close((1007, 'Action `{}` is wrong'.format(action)))
+    except EncodingNotSupported as encoding:
+        reply.close((1007, 'Encoding `{}` not supported'.format(encoding)))
+    except SnapshotNotFound as handle:
+        reply.close((1007, 'Snapshot `{}` not found'.format(handle)))
+    except StateNotSupported as env_id:
+        reply.close((1007, 'Environment `{}` state can\'t be cloned'.format(env_id)))
+    except RecordingNotFound as name:
+        reply.close((1007, 'Recording `{}` not found'.format(name)))
+    except ReplayNotFound as handle:
+        reply.close((1007, 'Replay `{}` not found'.format(handle)))
+    except CapacityReached as max_instances:
+        reply.close((1013, 'Maximum number of instances ({}) reached'.format(max_instances)))
+    except Exception as err:
+        reply.close((1007, 'Unknonwn error: {}'.format(err)))
+    finally:
+        if method not in public:
+            method, env_label = 'unknown', ''
+
+        record(reply, method, env_label, time.perf_counter() - started)
+
+        if reply.trace is not None:
+            profiler.finish(reply.trace, method, env_label, lane_key(data))
+
+            # Replies kept by the API, e.g. by render subscriptions, aren't traced anymore
+            reply.trace = None
+
+def request_env_id(method, params):
+    """Finds out the environment a request is about, for the metrics
+
+    Args:
+        method (str): API method
+        params (dict): parameters of the request
+
+    Returns:
+        Environment id, or an empty string
+    """
+    if not isinstance(params, dict):
+        return ''
+    if method == 'make':
+        return str(params.get('env_id', ''))
+    return env_ids.get(params.get('instance_id'), '')
+
+def record(reply, method, env_id, elapsed):
+    """Updates the metrics once a request has been served
+
+    Args:
+        reply (Reply): proxy used to answer the request
+        method (str): API method
+        env_id (str): environment the request was about
+        elapsed (float): seconds spent serving the request
+    """
+    metrics.requests.inc(method, env_id)
+    metrics.latency.observe(elapsed, method, env_id)
+    metrics.bytes_sent.inc(method, amount=reply.sent)
+
+    if reply.close_code is not None:
+        metrics.errors.inc(reply.close_code)
+
+def message_handle(ws, message):
+    """This function will process the message received by the client
+    
+    Args:
+        ws (WebSocket): socket for communication with the client
+        message (str): JSON string coming from the client
+    """
+    data = decode(ws, message)
+    if data is not None:
+        call(ws, data)
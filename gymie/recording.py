@@ -0,0 +1,289 @@
+import os
+import gym
+import json
+import queue
+import atexit
+import threading
+import numpy as np
+from gymie import codec, metrics
+
+
+##########################################
+# Trajectory recording to on-disk shards #
+##########################################
+
+# Directory where recordings are written, one subdirectory per instance
+directory = 'recordings'
+
+# Rows preallocated in each shard
+chunk_size = 1024
+
+# Columns of a recording besides the info dictionaries. A row is either
+# the observation returned by `reset`, flagged as `first`, with a zero
+# action and reward, or the outcome of a `step`. A transition is a row
+# that isn't `first` along with the observation of the row before it
+COLUMNS = ['observation', 'action', 'reward', 'done', 'first']
+
+# Commands queued for the writer thread in place of a row
+START = 'start'
+FINISH = 'finish'
+
+# Rows waiting to be written, along with their recorder
+pending = queue.SimpleQueue()
+
+writer = None
+
+lock = threading.Lock()
+
+backlog = metrics.Gauge('gymie_recording_backlog',
+                        'Recorded rows waiting to be written to disk',
+                        (),
+                        lambda: {(): pending.qsize()})
+
+
+def shard_path(path, column, shard):
+    """Path of the file of a column in a shard
+
+    Args:
+        path (str): directory of the recording
+        column (str): column name, see `COLUMNS`, or `info`
+        shard (int): index of the shard
+
+    Returns:
+        Path of the `.npy` file, `.jsonl` for the info
+    """
+    extension = 'jsonl' if column == 'info' else 'npy'
+    return os.path.join(path, '{}-{:05d}.{}'.format(column, shard, extension))
+
+def write_json(path, value):
+    """Writes a JSON file atomically, so readers never see it half written"""
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(value, file)
+    os.replace(temporary, path)
+
+def columns(observation_space, action_space):
+    """Shape and dtype of each column of a recording
+
+    Args:
+        observation_space (Space): observation space of the environment
+        action_space (Space): action space of the environment
+
+    Returns:
+        Dictionary with the shape and dtype of each column
+
+    Raises:
+        TypeError: one of the spaces has no fixed shape and dtype
+    """
+    for space in (observation_space, action_space):
+        if space.shape is None or space.dtype is None:
+            raise TypeError('Recording needs spaces with shape and dtype')
+
+    return {
+        'observation': (tuple(observation_space.shape), np.dtype(observation_space.dtype)),
+        'action': (tuple(action_space.shape), np.dtype(action_space.dtype)),
+        'reward': ((), np.dtype('float64')),
+        'done': ((), np.dtype('bool')),
+        'first': ((), np.dtype('bool')),
+    }
+
+
+class Recorder():
+    """Writes the rows of a recording into chunked shards of preallocated,
+    memory-mapped `.npy` files, one per column, plus a JSON lines file
+    with the info dictionaries. `index.json` lists the rows of each shard
+    and whether the recording is complete. It only runs in the writer thread
+
+    Args:
+        path (str): directory of the recording
+        env_id (str): environment id
+        observation_space (Space): observation space of the environment
+        action_space (Space): action space of the environment
+    """
+
+    def __init__(self, path, env_id, observation_space, action_space):
+        self.path = path
+        self.env_id = env_id
+        self.columns = columns(observation_space, action_space)
+        self.shards = []
+        self.arrays = None
+        self.infos = None
+        self.failed = False
+
+        # Set by the environment when its state is restored, so the next
+        # row doesn't make a transition with the one before it
+        self.restored = False
+
+    def start(self):
+        """Creates the directory of the recording and describes its columns"""
+        os.makedirs(self.path, exist_ok=True)
+        write_json(os.path.join(self.path, 'meta.json'), {
+            'env_id': self.env_id,
+            'chunk_size': chunk_size,
+            'columns': {column: {'shape': list(shape), 'dtype': dtype.str}
+                        for column, (shape, dtype) in self.columns.items()},
+        })
+        self.write_index(complete=False)
+
+    def open_shard(self):
+        """Preallocates the files of a new shard"""
+        shard = len(self.shards)
+        self.arrays = {column: np.lib.format.open_memmap(shard_path(self.path, column, shard),
+                                                         mode='w+',
+                                                         dtype=dtype,
+                                                         shape=(chunk_size,) + shape)
+                       for column, (shape, dtype) in self.columns.items()}
+        self.infos = open(shard_path(self.path, 'info', shard), 'w')
+        self.shards.append(0)
+
+    def close_shard(self):
+        """Flushes the current shard to disk"""
+        for array in self.arrays.values():
+            array.flush()
+        self.infos.close()
+        self.arrays = self.infos = None
+
+    def write_index(self, complete):
+        write_json(os.path.join(self.path, 'index.json'), {'shards': self.shards, 'complete': complete})
+
+    def write(self, row):
+        """Appends a row, opening a new shard when the current one is full
+
+        Args:
+            row (tuple): observation, action, reward, done, first and info
+        """
+        if self.arrays is None:
+            self.open_shard()
+
+        index = self.shards[-1]
+        for column, value in zip(COLUMNS, row):
+            self.arrays[column][index] = value
+        self.infos.write(codec.dumps(row[-1]) + '\n')
+        self.shards[-1] += 1
+
+        if self.shards[-1] == chunk_size:
+            self.close_shard()
+            self.write_index(complete=False)
+
+    def finish(self):
+        """Flushes the last shard and marks the recording as complete"""
+        if self.arrays is not None:
+            self.close_shard()
+        self.write_index(complete=True)
+
+
+def work():
+    """Main loop of the writer thread. Disk I/O happens here,
+    so recording never blocks the environments"""
+    while True:
+        recorder, row = pending.get()
+
+        if recorder.failed:
+            continue
+
+        try:
+            if row is START:
+                recorder.start()
+            elif row is FINISH:
+                recorder.finish()
+            else:
+                recorder.write(row)
+        except Exception as err:
+            print(f'Error recording {recorder.path}: {err}')
+            recorder.failed = True
+
+def submit(recorder, row):
+    """Queues a row for the writer thread, starting it the first time
+
+    Args:
+        recorder (Recorder): recording the row belongs to
+        row (tuple|str): row to write, or `START` or `FINISH`
+    """
+    global writer
+
+    if writer is None:
+        with lock:
+            if writer is None:
+                writer = threading.Thread(target=work, daemon=True)
+                writer.start()
+
+    pending.put((recorder, row))
+
+def flush(timeout=None):
+    """Waits until the writer has written every queued row. Meant for tests
+    and shutdown, never for the step path
+
+    Args:
+        timeout (float): optional; seconds to wait
+
+    Returns:
+        True if nothing is left to write
+    """
+    if writer is None:
+        return True
+
+    done = threading.Event()
+    submit(Marker(done), FINISH)
+    return done.wait(timeout)
+
+atexit.register(flush, 10)
+
+
+class Marker():
+    """Fake recorder whose finish signals that the rows before it are written"""
+
+    failed = False
+    path = None
+
+    def __init__(self, event):
+        self.event = event
+
+    def finish(self):
+        self.event.set()
+
+
+class RecordingEnv(gym.Wrapper):
+    """Records the observation of every `reset` and the outcome of every
+    `step`, along with the action, into `directory/<name>`. Observations
+    are copied and handed to the writer thread, so steps never wait for
+    the disk
+
+    Args:
+        env (Env): environment to wrap
+        name (str): name of the recording, the instance id
+        env_id (str): environment id
+
+    Raises:
+        TypeError: the spaces have no fixed shape and dtype
+    """
+
+    def __init__(self, env, name, env_id):
+        super().__init__(env)
+        self.recorder = Recorder(os.path.join(directory, name),
+                                 env_id,
+                                 env.observation_space,
+                                 env.action_space)
+        self.zero_action = np.zeros(*self.recorder.columns['action'])
+        submit(self.recorder, START)
+
+    def reset(self, **kwargs):
+        observation = self.env.reset(**kwargs)
+        submit(self.recorder, (np.array(observation), self.zero_action, 0.0, False, True, {}))
+        return observation
+
+    def step(self, action):
+        observation, reward, done, info = self.env.step(action)
+        first = self.recorder.restored
+        self.recorder.restored = False
+        submit(self.recorder, (np.array(observation), np.array(action), reward, done, first, info))
+        return observation, reward, done, info
+
+    def restored(self):
+        """Called when a snapshot is restored into the environment, see `gymie.snapshots`"""
+        self.recorder.restored = True
+
+    def close(self):
+        try:
+            self.env.close()
+        finally:
+            submit(self.recorder, FINISH)
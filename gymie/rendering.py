@@ -0,0 +1,282 @@
+import io
+import time
+import uuid
+import zlib
+import struct
+import threading
+import numpy as np
+from gymie import binary, metrics
+from gymie.exceptions import EncodingNotSupported
+
+
+#################################
+# Throttled render subscription #
+#################################
+
+# Formats frames can be sent in. `delta` frames are the difference with
+# the previous frame sent, modulo 256, compressed with zlib
+FORMATS = ['png', 'jpeg', 'delta']
+
+# Highest frame rate a client can ask for
+MAX_FPS = 60
+
+# Subscriptions of each instance, keyed by instance id
+subscriptions = {}
+
+frames = metrics.Counter('gymie_render_frames_total',
+                         'Frames captured for render subscriptions, sent or dropped',
+                         ('format', 'outcome'))
+
+
+def spawn(fn, *args):
+    """Runs a function in the background, where frames are encoded and sent.
+    Servers replace it with a cooperative version when needed
+
+    Args:
+        fn: function to run
+        *args: arguments of the function
+    """
+    threading.Thread(target=fn, args=args, daemon=True).start()
+
+def offload(fn, *args):
+    """Runs a CPU bound function, such as an encoder, and returns its result.
+    Servers replace it to keep it away from their event loop
+
+    Args:
+        fn: function to run
+        *args: arguments of the function
+    """
+    return fn(*args)
+
+def chunk(tag, data):
+    """Packs a PNG chunk"""
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+def encode_png(frame, quality=None):
+    """Encodes a frame as PNG, with no dependencies besides zlib
+
+    Args:
+        frame (np.array): uint8 frame, shaped `(height, width)` or `(height, width, channels)`
+        quality: ignored, PNG is lossless
+
+    Returns:
+        PNG file (bytes)
+    """
+    height, width = frame.shape[:2]
+    channels = frame.shape[2] if frame.ndim == 3 else 1
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+
+    # Every row starts with its filter type, 0 means none
+    rows = np.zeros((height, 1 + width * channels), dtype=np.uint8)
+    rows[:, 1:] = frame.reshape(height, -1)
+
+    return b''.join((b'\x89PNG\r\n\x1a\n',
+                     chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)),
+                     chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)),
+                     chunk(b'IEND', b'')))
+
+def encode_jpeg(frame, quality=75):
+    """Encodes a frame as JPEG. It needs the `Pillow` package
+
+    Args:
+        frame (np.array): uint8 frame
+        quality (int): JPEG quality, from 1 to 95
+
+    Returns:
+        JPEG file (bytes)
+    """
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.fromarray(frame).save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+def to_frame(image):
+    """Copies whatever `render('rgb_array')` returned into a uint8 frame,
+    since environments may reuse the array while it's being encoded"""
+    frame = np.array(image)
+    if frame.dtype != np.uint8:
+        frame = np.clip(frame, 0, 255).astype(np.uint8)
+    return frame
+
+
+class Subscription():
+    """Frames of an instance sent to a connection at a capped frame rate.
+    Frames are captured on the step path, when it's time for a new one,
+    and encoded and sent in the background. While a frame is on its way,
+    new ones are dropped instead of captured, so a slow viewer never
+    slows down the steps
+
+    Args:
+        ws (WebSocket): socket where frames are sent
+        instance_id (str): instance whose frames are captured
+        fps (float): maximum frames per second
+        format (str): `png`, `jpeg` or `delta`, see `FORMATS`
+        quality (int): JPEG quality
+
+    Raises:
+        EncodingNotSupported: unknown format or JPEG without Pillow
+        TypeError: wrong frame rate
+    """
+
+    def __init__(self, ws, instance_id, fps=10, format='png', quality=75):
+        if format not in FORMATS:
+            raise EncodingNotSupported(format)
+        if format == 'jpeg':
+            try:
+                import PIL
+            except ImportError:
+                raise EncodingNotSupported(format)
+        if not 0 < fps <= MAX_FPS:
+            raise TypeError('Frame rate must be between 0 and {}'.format(MAX_FPS))
+
+        self.handle = uuid.uuid4().hex
+        self.ws = ws
+        self.instance_id = instance_id
+        self.interval = 1 / fps
+        self.format = format
+        self.quality = quality
+        self.next_capture = 0
+        self.busy = False
+        self.closed = False
+        self.index = 0
+        self.dropped = 0
+        self.previous = None
+
+    def capture(self, env):
+        """Captures a frame if it's time, unless the last one is still on its way.
+        Environments that can't render `rgb_array` frames end the subscription
+
+        Args:
+            env (Env): environment of the instance
+        """
+        now = time.monotonic()
+        if now < self.next_capture or self.closed:
+            return
+
+        self.next_capture = now + self.interval
+
+        if self.busy:
+            self.dropped += 1
+            frames.inc(self.format, 'dropped')
+            return
+
+        try:
+            frame = to_frame(env.render(mode='rgb_array'))
+        except Exception as err:
+            print(f'Error rendering {self.instance_id}: {err}')
+            self.closed = True
+            return
+
+        self.busy = True
+        spawn(self.deliver, frame)
+
+    def encode(self, frame):
+        """Encodes a frame in the format of the subscription
+
+        Args:
+            frame (np.array): uint8 frame
+
+        Returns:
+            Header and encoded frame
+        """
+        header = {'render': self.handle,
+                  'instance_id': self.instance_id,
+                  'format': self.format,
+                  'index': self.index,
+                  'dropped': self.dropped,
+                  'shape': frame.shape}
+
+        # Tagged like the responses to the subscription, see `protocol.Reply`
+        if getattr(self.ws, 'tagged', False):
+            header['id'] = self.ws.request_id
+
+        if self.format == 'png':
+            return header, encode_png(frame)
+        if self.format == 'jpeg':
+            return header, encode_jpeg(frame, self.quality)
+
+        header['key'] = self.previous is None or self.previous.shape != frame.shape
+        delta = frame if header['key'] else frame - self.previous
+        self.previous = frame
+        return header, zlib.compress(delta.tobytes(), 1)
+
+    def deliver(self, frame):
+        """Encodes a frame away from the step path and sends it
+
+        Args:
+            frame (np.array): uint8 frame
+        """
+        try:
+            header, data = offload(self.encode, frame)
+            if self.ws.send(binary.pack(header, data), droppable=True) is False:
+                # Dropped by a full send queue, see `gymie.outbox`. The next
+                # delta would be against a frame the client never got
+                self.previous = None
+                self.dropped += 1
+                frames.inc(self.format, 'dropped')
+                return
+            self.index += 1
+            frames.inc(self.format, 'sent')
+        except Exception as err:
+            print(f'Error sending frame of {self.instance_id}: {err}')
+            self.closed = True
+        finally:
+            self.busy = False
+
+
+def capture(instance_id, env):
+    """Captures frames for the subscriptions of an instance, if any.
+    Called after every step
+
+    Args:
+        instance_id (str): instance id
+        env (Env): environment of the instance
+    """
+    for subscription in subscriptions.get(instance_id, ()):
+        subscription.capture(env)
+
+def subscribe(ws, instance_id, **kwargs):
+    """Subscribes a connection to the frames of an instance
+
+    Args:
+        ws (WebSocket): socket where frames are sent
+        instance_id (str): instance id
+        **kwargs: extra arguments for `Subscription`
+
+    Returns:
+        Subscription
+    """
+    subscription = Subscription(ws, instance_id, **kwargs)
+    subscriptions.setdefault(instance_id, []).append(subscription)
+    return subscription
+
+def unsubscribe(ws=None, instance_id=None, handle=None):
+    """Cancels the subscriptions of a connection, of an instance,
+    or the one with a handle, whichever are given
+
+    Args:
+        ws (WebSocket): optional; socket of the subscriptions
+        instance_id (str): optional; instance of the subscriptions
+        handle (str): optional; handle of the subscription
+
+    Returns:
+        Number of subscriptions cancelled
+    """
+    cancelled = 0
+
+    for key in [instance_id] if instance_id is not None else list(subscriptions):
+        kept = []
+        for subscription in subscriptions.get(key, ()):
+            if (ws is None or subscription.ws == ws) and (handle is None or subscription.handle == handle):
+                subscription.closed = True
+                cancelled += 1
+            else:
+                kept.append(subscription)
+
+        if kept:
+            subscriptions[key] = kept
+        else:
+            subscriptions.pop(key, None)
+
+    return cancelled
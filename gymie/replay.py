@@ -0,0 +1,240 @@
+import os
+import json
+import uuid
+import numpy as np
+from gymie import recording
+from gymie.exceptions import RecordingNotFound, ReplayNotFound
+
+
+###############################
+# Replay of recorded episodes #
+###############################
+
+# How a replay picks its transitions: in the order they were recorded,
+# or uniformly at random, with replacement, across all the episodes
+SAMPLINGS = ['sequential', 'uniform']
+
+# Open replays and the connection they belong to, keyed by handle
+replays = {}
+
+
+def recording_path(name):
+    """Path of a recording, making sure the name can't escape the directory
+
+    Args:
+        name (str): name of the recording, the instance id that made it
+
+    Returns:
+        Path of the directory of the recording
+
+    Raises:
+        RecordingNotFound: the recording doesn't exist
+    """
+    name = str(name)
+    path = os.path.join(recording.directory, name)
+
+    if os.path.basename(name) != name or name.startswith('.') or \
+       not os.path.isfile(os.path.join(path, 'index.json')):
+        raise RecordingNotFound(name)
+
+    return path
+
+def recordings():
+    """Lists the recordings in the recording directory
+
+    Returns:
+        Names of the recordings, sorted
+    """
+    if not os.path.isdir(recording.directory):
+        return []
+
+    return sorted(name for name in os.listdir(recording.directory)
+                  if os.path.isfile(os.path.join(recording.directory, name, 'index.json')))
+
+
+class Recording():
+    """Read-only view of a recording. Shards are memory-mapped the first
+    time they're needed, so only the rows that are read leave the disk
+
+    Args:
+        path (str): directory of the recording
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, 'meta.json')) as file:
+            meta = json.load(file)
+        with open(os.path.join(path, 'index.json')) as file:
+            index = json.load(file)
+
+        self.chunk_size = meta['chunk_size']
+        self.columns = meta['columns']
+        self.shards = index['shards']
+        self.arrays = {}
+
+    def column(self, name, shard):
+        """Memory-maps a column of a shard
+
+        Args:
+            name (str): column name, see `gymie.recording.COLUMNS`
+            shard (int): index of the shard
+
+        Returns:
+            Read-only np.memmap with the rows of the shard
+        """
+        key = (name, shard)
+        if key not in self.arrays:
+            array = np.load(recording.shard_path(self.path, name, shard), mmap_mode='r')
+            self.arrays[key] = array[:self.shards[shard]]
+        return self.arrays[key]
+
+    def transitions(self):
+        """Finds the rows that make a transition with the row before them
+
+        Returns:
+            np.array with the global row numbers of the transitions
+        """
+        first = np.concatenate([self.column('first', shard) for shard in range(len(self.shards))] or [[]])
+        rows = np.flatnonzero(~first.astype(bool))
+        return rows[rows > 0]
+
+    def read(self, name, rows, out):
+        """Gathers rows of a column, shard by shard, into a buffer.
+        They are copied once, straight from the memory map
+
+        Args:
+            name (str): column name
+            rows (np.array): global row numbers
+            out (np.array): buffer with one entry per row
+        """
+        shards = rows // self.chunk_size
+
+        for shard in np.unique(shards):
+            selected = shards == shard
+            out[selected] = self.column(name, shard)[rows[selected] % self.chunk_size]
+
+
+class Replay():
+    """Streams minibatches of transitions out of one or more recordings.
+    A precomputed index of all the transitions makes uniform sampling
+    across episodes cheap, and shards are read through memory maps
+
+    Args:
+        names (list(str)): names of the recordings
+        batch_size (int): transitions per batch
+        sampling (str): `sequential` or `uniform`, see `SAMPLINGS`
+        seed (int): optional; seed of uniform sampling
+
+    Raises:
+        RecordingNotFound: one of the recordings doesn't exist
+        TypeError: wrong sampling, batch size or recordings of different environments
+    """
+
+    def __init__(self, names, batch_size=32, sampling='sequential', seed=None):
+        if sampling not in SAMPLINGS or batch_size < 1:
+            raise TypeError('Replay needs a positive batch size and a sampling in {}'.format(SAMPLINGS))
+
+        self.recordings = [Recording(recording_path(name)) for name in names]
+        self.batch_size = batch_size
+        self.sampling = sampling
+        self.random = np.random.default_rng(seed)
+        self.position = 0
+
+        if len({json.dumps(item.columns, sort_keys=True) for item in self.recordings}) > 1:
+            raise TypeError('Recordings of a replay must have the same columns')
+
+        transitions = [item.transitions() for item in self.recordings]
+        self.sources = np.concatenate([np.full(len(rows), source, dtype=np.int32)
+                                       for source, rows in enumerate(transitions)] or [[]]).astype(np.int32)
+        self.rows = np.concatenate(transitions or [[]]).astype(np.int64)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def next(self):
+        """Reads the next minibatch of transitions
+
+        Returns:
+            Tuple with observations and next observations stacked into a single
+            array, shaped `(2, batch, ...)`, actions, rewards and dones.
+            None if a sequential replay is exhausted or there are no transitions
+        """
+        if not len(self):
+            return None
+
+        if self.sampling == 'uniform':
+            entries = self.random.integers(len(self), size=self.batch_size)
+        else:
+            entries = np.arange(self.position, min(self.position + self.batch_size, len(self)))
+            self.position += len(entries)
+            if not len(entries):
+                return None
+
+        columns = self.recordings[0].columns
+        batch = {name: np.empty((len(entries),) + tuple(column['shape']), dtype=column['dtype'])
+                 for name, column in columns.items() if name != 'first'}
+        observations = np.empty((2,) + batch.pop('observation').shape, dtype=columns['observation']['dtype'])
+
+        # Sorted, entries of the same recording are contiguous,
+        # so rows are read in place and in the order they are on disk
+        entries = np.sort(entries)
+        sources = self.sources[entries]
+        rows = self.rows[entries]
+        bounds = list(np.flatnonzero(np.diff(sources)) + 1)
+
+        for start, stop in zip([0] + bounds, bounds + [len(entries)]):
+            item = self.recordings[sources[start]]
+            item.read('observation', rows[start:stop] - 1, observations[0][start:stop])
+            item.read('observation', rows[start:stop], observations[1][start:stop])
+
+            for name in batch:
+                item.read(name, rows[start:stop], batch[name][start:stop])
+
+        return observations, batch['action'], batch['reward'], batch['done']
+
+
+def open_replay(owner, names=None, **kwargs):
+    """Opens a replay over some recordings, all of them by default
+
+    Args:
+        owner: connection opening it
+        names (list(str)): optional; names of the recordings
+        **kwargs: extra arguments for `Replay`
+
+    Returns:
+        Handle of the replay and number of transitions in it
+    """
+    replay = Replay(recordings() if names is None else names, **kwargs)
+    handle = uuid.uuid4().hex
+    replays[handle] = (owner, replay)
+    return handle, len(replay)
+
+def lookup(owner, handle):
+    """Looks up a replay of a connection
+
+    Args:
+        owner: connection asking for it
+        handle (str): handle returned by `open_replay`
+
+    Returns:
+        Replay
+
+    Raises:
+        ReplayNotFound: the replay doesn't exist or belongs to another connection
+    """
+    replay_owner, replay = replays.get(handle, (None, None))
+
+    if replay is None or replay_owner != owner:
+        raise ReplayNotFound(handle)
+
+    return replay
+
+def discard(owner):
+    """Closes the replays of a connection
+
+    Args:
+        owner: connection that is gone
+    """
+    for handle in [handle for handle, (replay_owner, _) in replays.items() if replay_owner == owner]:
+        del replays[handle]
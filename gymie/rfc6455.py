@@ -0,0 +1,134 @@
+import os
+import base64
+import struct
+import hashlib
+
+
+################################
+# Minimal WebSocket (RFC 6455) #
+################################
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+# Largest message accepted from the other side
+MAX_MESSAGE_LENGTH = 16 * 1024 * 1024
+
+
+def accept_key(key):
+    """Computes the `Sec-WebSocket-Accept` header for a handshake
+
+    Args:
+        key (str): `Sec-WebSocket-Key` header sent by the client
+
+    Returns:
+        Base64 string
+    """
+    digest = hashlib.sha1((key + GUID).encode('ascii')).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+def new_key():
+    """Generates a random `Sec-WebSocket-Key` for a client handshake"""
+    return base64.b64encode(os.urandom(16)).decode('ascii')
+
+def mask(payload, key):
+    """Masks or unmasks a payload. XOR-ing the whole payload
+    as a big integer keeps it fast without extra dependencies
+
+    Args:
+        payload (bytes): data to (un)mask
+        key (bytes): 4 bytes masking key
+
+    Returns:
+        (Un)masked payload (bytes)
+    """
+    length = len(payload)
+    if not length:
+        return b''
+
+    key = (key * (length // 4 + 1))[:length]
+    masked = int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')
+    return masked.to_bytes(length, 'big')
+
+def pack_frame(payload, opcode=None, masked=False):
+    """Packs a whole message into a single frame
+
+    Args:
+        payload (str|bytes): message, text if it's a string
+        opcode (int): optional; frame opcode, guessed from the payload
+        masked (bool): optional; clients must mask their frames
+
+    Returns:
+        Frame (bytes)
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+        opcode = TEXT if opcode is None else opcode
+    elif opcode is None:
+        opcode = BINARY
+
+    length = len(payload)
+    mask_bit = 0x80 if masked else 0
+
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, mask_bit | length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, mask_bit | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, mask_bit | 127, length)
+
+    if masked:
+        key = os.urandom(4)
+        return b''.join((header, key, mask(payload, key)))
+
+    return b''.join((header, payload))
+
+def pack_close(close_data=None):
+    """Packs a close frame
+
+    Args:
+        close_data (tuple(int, str)): optional; status code and reason
+
+    Returns:
+        Payload of the close frame (bytes)
+    """
+    if close_data is None:
+        return b''
+
+    status, reason = close_data
+    # Control frames are limited to 125 bytes
+    return struct.pack('!H', status) + reason.encode('utf-8')[:123]
+
+def parse_header(data):
+    """Parses the first two bytes of a frame
+
+    Args:
+        data (bytes): first two bytes of the frame
+
+    Returns:
+        Tuple with fin, opcode, masked and length. Length is 126 or 127
+        when the real length follows in the next 2 or 8 bytes
+    """
+    first, second = data[0], data[1]
+    return bool(first & 0x80), first & 0x0F, bool(second & 0x80), second & 0x7F
+
+def parse_close(payload):
+    """Parses the payload of a close frame
+
+    Args:
+        payload (bytes): payload of the close frame
+
+    Returns:
+        Tuple with status code and reason, or None
+    """
+    if len(payload) < 2:
+        return None
+
+    (status,) = struct.unpack('!H', payload[:2])
+    return status, payload[2:].decode('utf-8', 'replace')
@@ -0,0 +1,321 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from gymie import metrics
+
+
+############################################
+# Weighted fair scheduling of the sessions #
+############################################
+
+# Highest priority a session can have. The lowest, and default, is 1
+MAX_PRIORITY = 100
+
+WAIT_BUCKETS = [0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+# Factory of the events threads wait on for their turn. Servers
+# replace it with a cooperative version when they're green threads
+event = threading.Event
+
+# Scheduler of the requests, None if every request runs as soon as its lane gets to it
+scheduler = None
+
+
+class Session():
+    """Scheduling state of a connection: its priority, its rate limit
+    as a token bucket, and its requests waiting for their turn
+
+    Args:
+        priority (int): weight of the session, from 1 to `MAX_PRIORITY`
+        rate (float): optional; requests per second the session can start
+        burst (int): optional; requests the session can start at once
+            within its rate limit, `rate` or 1 by default
+    """
+
+    def __init__(self, priority=1, rate=None, burst=None):
+        self.finish = 0.0
+        self.queue = deque()
+        self.configure(priority, rate, burst)
+
+    def configure(self, priority=1, rate=None, burst=None):
+        """Changes the priority and rate limit of the session, see `Session`.
+        The token bucket starts full
+
+        Raises:
+            TypeError: wrong priority, rate or burst
+        """
+        if priority not in range(1, MAX_PRIORITY + 1) or (rate is not None and rate <= 0) or \
+           (burst is not None and burst < 1):
+            raise TypeError('Priority must be between 1 and {}, rate and burst positive'.format(MAX_PRIORITY))
+
+        self.priority = priority
+        self.rate = rate
+        self.burst = burst or max(1, rate or 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        """Adds the tokens earned since the last refill"""
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def throttled(self):
+        """Checks whether the rate limit holds the session back"""
+        return self.rate is not None and self.tokens < 1
+
+
+class Ticket():
+    """Request waiting for its turn
+
+    Args:
+        session (Session): session of the request
+        finish (float): virtual finish time, requests are served in its order
+        wake (callable): function that wakes up the request when it's its turn
+    """
+
+    def __init__(self, session, finish, wake):
+        self.session = session
+        self.finish = finish
+        self.wake = wake
+        self.arrived = time.monotonic()
+        self.dispatched = False
+        self.throttled = False
+
+
+class Scheduler():
+    """Serves requests of several sessions, at most `slots` at a time, with
+    self-clocked weighted fair queuing: every request gets a virtual finish
+    time, that of the previous request of its session, or the current
+    virtual time if the session was idle, plus the inverse of its priority,
+    and the request with the smallest one goes first. A session with twice
+    the priority gets twice the turns while both are busy, and no session
+    can starve the others however fast it sends. Sessions with a rate limit
+    wait for a token before their turn
+
+    Args:
+        slots (int): requests served at the same time
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.running = 0
+        self.virtual = 0.0
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def session(self, owner):
+        """Scheduling state of a connection, created the first time"""
+        if owner not in self.sessions:
+            self.sessions[owner] = Session()
+        return self.sessions[owner]
+
+    def configure(self, owner, priority=1, rate=None, burst=None):
+        """Sets the priority and rate limit of a connection
+
+        Args:
+            owner: connection
+            priority (int): weight of the session, from 1 to `MAX_PRIORITY`
+            rate (float): optional; requests per second the session can start
+            burst (int): optional; requests the session can start at once
+
+        Raises:
+            TypeError: wrong priority, rate or burst
+        """
+        with self.lock:
+            self.session(owner).configure(priority, rate, burst)
+
+    def enqueue(self, owner, wake):
+        """Queues a request of a connection
+
+        Args:
+            owner: connection
+            wake (callable): function that wakes up the request when it's its turn
+
+        Returns:
+            Ticket, already `dispatched` if the request can go right away
+        """
+        with self.lock:
+            session = self.session(owner)
+            session.finish = max(session.finish, self.virtual) + 1 / session.priority
+            ticket = Ticket(session, session.finish, wake)
+            session.queue.append(ticket)
+            dispatched = self.dispatch()
+
+        for other in dispatched:
+            if other is not ticket:
+                other.wake()
+
+        return ticket
+
+    def dispatch(self):
+        """Gives the free slots to the waiting requests with the smallest
+        virtual finish times among the sessions their rate limit allows
+
+        Returns:
+            Tickets whose turn has come
+        """
+        dispatched = []
+        now = time.monotonic()
+
+        while self.running < self.slots:
+            chosen = None
+
+            for session in self.sessions.values():
+                if not session.queue:
+                    continue
+
+                session.refill(now)
+                head = session.queue[0]
+
+                if session.throttled():
+                    if not head.throttled:
+                        head.throttled = True
+                        throttled.inc(str(session.priority))
+                elif chosen is None or head.finish < chosen.finish:
+                    chosen = head
+
+            if chosen is None:
+                break
+
+            chosen.session.queue.popleft()
+            if chosen.session.rate is not None:
+                chosen.session.tokens -= 1
+            chosen.dispatched = True
+            self.running += 1
+            self.virtual = chosen.finish
+            wait.observe(now - chosen.arrived, str(chosen.session.priority))
+            dispatched.append(chosen)
+
+        return dispatched
+
+    def delay(self):
+        """Seconds until a session held back by its rate limit gets a token
+
+        Returns:
+            Seconds, or None if no session is held back
+        """
+        with self.lock:
+            delays = [(1 - session.tokens) / session.rate for session in self.sessions.values()
+                      if session.queue and session.throttled()]
+
+        return max(min(delays), 0.001) if delays else None
+
+    def poll(self):
+        """Dispatches whatever can go now, e.g. once a rate limit allows it"""
+        with self.lock:
+            dispatched = self.dispatch()
+
+        for ticket in dispatched:
+            ticket.wake()
+
+    def release(self):
+        """Frees the slot of a request that has been served"""
+        with self.lock:
+            self.running -= 1
+            dispatched = self.dispatch()
+
+        for ticket in dispatched:
+            ticket.wake()
+
+    def discard(self, owner):
+        """Forgets a connection that is gone"""
+        with self.lock:
+            self.sessions.pop(owner, None)
+
+    def queued(self):
+        """Counts the requests waiting for their turn, by priority"""
+        with self.lock:
+            depths = {}
+            for session in self.sessions.values():
+                key = (str(session.priority),)
+                depths[key] = depths.get(key, 0) + len(session.queue)
+            return depths
+
+
+wait = metrics.Histogram('gymie_scheduler_wait_seconds',
+                         'Time requests wait for their turn, by session priority',
+                         ('priority',),
+                         WAIT_BUCKETS)
+
+throttled = metrics.Counter('gymie_scheduler_throttled_total',
+                            'Requests held back by the rate limit of their session, by session priority',
+                            ('priority',))
+
+metrics.Gauge('gymie_scheduler_queued',
+              'Requests waiting for their turn, by session priority',
+              ('priority',),
+              lambda: scheduler.queued() if scheduler else {})
+
+metrics.Gauge('gymie_scheduler_running',
+              'Requests being served by the scheduler',
+              (),
+              lambda: {(): scheduler.running if scheduler else 0})
+
+
+def configure(slots=None):
+    """Turns the scheduler on, serving that many requests at a time, or off
+
+    Args:
+        slots (int): optional; requests served at the same time, None to turn it off
+    """
+    global scheduler
+    scheduler = Scheduler(slots) if slots else None
+
+@contextmanager
+def turn(owner):
+    """Waits for the turn of a request of a connection, and frees
+    its slot once it's served. For threads and green threads
+
+    Args:
+        owner: connection
+    """
+    current = scheduler
+
+    if current is None:
+        yield
+        return
+
+    ready = event()
+    ticket = current.enqueue(owner, ready.set)
+
+    while not ticket.dispatched and not ready.wait(current.delay()):
+        current.poll()
+
+    try:
+        yield
+    finally:
+        current.release()
+
+async def async_turn(owner):
+    """Waits for the turn of a request of a connection in the event loop.
+    The caller must call `release` once it's served
+
+    Args:
+        owner: connection
+
+    Returns:
+        Scheduler that gave the turn, or None
+    """
+    current = scheduler
+
+    if current is None:
+        return None
+
+    loop = asyncio.get_event_loop()
+    ready = loop.create_future()
+
+    def wake():
+        loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+
+    ticket = current.enqueue(owner, wake)
+
+    while not ticket.dispatched:
+        try:
+            await asyncio.wait_for(asyncio.shield(ready), current.delay())
+        except asyncio.TimeoutError:
+            current.poll()
+
+    return current
@@ -0,0 +1,139 @@
+import numpy as np
+from collections import OrderedDict
+from gym import spaces
+from gymie.exceptions import WrongAction
+
+
+#####################################
+# Space schemas and action decoders #
+#####################################
+
+def schema(space):
+    """Describes a space in a JSON serializable dictionary.
+    Composite spaces, `Tuple` and `Dict`, are described recursively
+
+    Args:
+        space (Space): space to describe
+
+    Returns:
+        Dictionary with the type of space, `name`, and its
+        parameters: `n`, `shape`, `low`, `high`, `nvec`, `spaces`, etc...
+    """
+    info = {'name': space.__class__.__name__}
+
+    if isinstance(space, spaces.Discrete):
+        info['n'] = int(space.n)
+    elif isinstance(space, spaces.Box):
+        info['shape'] = list(space.shape)
+        info['dtype'] = space.dtype.str
+
+        # numpy.float32 isn't JSON serializable but numpy.float64 is.
+        info['low'] = space.low.astype('float64').tolist()
+        info['high'] = space.high.astype('float64').tolist()
+    elif isinstance(space, spaces.MultiBinary):
+        info['n'] = space.n
+        info['shape'] = list(space.shape)
+    elif isinstance(space, spaces.MultiDiscrete):
+        info['nvec'] = space.nvec.tolist()
+        info['shape'] = list(space.shape)
+    elif isinstance(space, spaces.Tuple):
+        info['spaces'] = [schema(subspace) for subspace in space.spaces]
+    elif isinstance(space, spaces.Dict):
+        info['spaces'] = OrderedDict((key, schema(subspace)) for key, subspace in space.spaces.items())
+
+    return info
+
+def decoder(space):
+    """Compiles a function that converts an action coming from the client,
+    usually JSON, into what the space expects, e.g. a numpy array of the
+    right dtype and shape, and validates it. All the introspection of the
+    space happens here, once, so decoding an action is cheap
+
+    Args:
+        space (Space): action space
+
+    Returns:
+        Function taking an action and returning the decoded action.
+        It raises `WrongAction` if the action doesn't fit the space.
+        Actions of unknown spaces are passed through
+    """
+    if isinstance(space, spaces.Discrete):
+        return discrete_decoder(space)
+    elif isinstance(space, spaces.Box):
+        return array_decoder(space.shape, space.dtype)
+    elif isinstance(space, spaces.MultiBinary):
+        decode = array_decoder(space.shape, np.int8)
+        return bounded(decode, 0, 2)
+    elif isinstance(space, spaces.MultiDiscrete):
+        decode = array_decoder(space.shape, space.dtype)
+        return bounded(decode, 0, space.nvec)
+    elif isinstance(space, spaces.Tuple):
+        return tuple_decoder([decoder(subspace) for subspace in space.spaces])
+    elif isinstance(space, spaces.Dict):
+        return dict_decoder(OrderedDict((key, decoder(subspace)) for key, subspace in space.spaces.items()))
+
+    return lambda action: action
+
+def discrete_decoder(space):
+    """Compiles the decoder of a `Discrete` space"""
+    n = int(space.n)
+
+    def decode(action):
+        if isinstance(action, (int, np.integer)) and not isinstance(action, bool) and 0 <= action < n:
+            return int(action)
+        raise WrongAction(str(action))
+
+    return decode
+
+def array_decoder(shape, dtype):
+    """Compiles a decoder converting actions into arrays of a given shape and dtype.
+    Arrays with the right number of elements but a different shape are reshaped"""
+    size = int(np.prod(shape))
+
+    def decode(action):
+        try:
+            array = np.asarray(action, dtype=dtype)
+        except (TypeError, ValueError):
+            raise WrongAction(str(action))
+
+        if array.shape != shape:
+            if array.size != size:
+                raise WrongAction(str(action))
+            array = array.reshape(shape)
+
+        return array
+
+    return decode
+
+def bounded(decode, low, high):
+    """Wraps an array decoder to check that the values are in [low, high)"""
+
+    def decode_bounded(action):
+        array = decode(action)
+        if not ((array >= low) & (array < high)).all():
+            raise WrongAction(str(action))
+        return array
+
+    return decode_bounded
+
+def tuple_decoder(decoders):
+    """Compiles the decoder of a `Tuple` space out of the decoders of its spaces"""
+    length = len(decoders)
+
+    def decode(action):
+        if not isinstance(action, (list, tuple)) or len(action) != length:
+            raise WrongAction(str(action))
+        return tuple(decode_item(item) for decode_item, item in zip(decoders, action))
+
+    return decode
+
+def dict_decoder(decoders):
+    """Compiles the decoder of a `Dict` space out of the decoders of its spaces"""
+    keys = set(decoders)
+
+    def decode(action):
+        if not isinstance(action, dict) or action.keys() != keys:
+            raise WrongAction(str(action))
+        return OrderedDict((key, decode_item(action[key])) for key, decode_item in decoders.items())
+
+    return decode
@@ -1,65 +1,73 @@
-import json
 import eventlet
-from eventlet import wsgi, websocket
-from gymie.api import public
-from gymie.exceptions import *
+from collections import deque
+from eventlet import tpool, wsgi, websocket
+from eventlet.hubs import trampoline
+from eventlet.green import threading as green_threading
+from gymie import api, backends, codec, metrics, outbox, pool, profiler, recording, rendering, scheduler, snapshots, workers
+from gymie.api import disconnect, new_env
+from gymie.outbox import Outbox
+from gymie.protocol import Reply, lane_key, decode, call, message_handle
+
+
+# Transports the server can be started with
+BACKENDS = ['eventlet', 'asyncio']
+
+# Whether the listener shares its port with other worker processes
+reuse_port = False
 
 
 #####################################
 # WebSocket Server API and Handlers #
 #####################################
 
-def message_handle(ws, message):
-    """This function will process the message received by the client
-    
+class Lanes():
+    """Runs the requests of a connection concurrently, see `lane_key`.
+    Each lane is served in order by its own green thread, which
+    waits for its turn in `gymie.scheduler` before every request
+    and exits once the lane is empty
+
     Args:
         ws (WebSocket): socket for communication with the client
-        message (str): JSON string coming from the client
-    
-    Raises:
-        json.JSONDecodeError: 
-            there was a problem decoding the JSON string
-        KeyError: 
-            there was a problem with the parameters sent by the client
-        TypeError: 
-            there was a problem with the parameters sent by the client
-        InstanceNotFound: 
-            instance id is not in the dictionary of envs
-        EnvironmentMalformed:
-            wrong environment's id
-        EnvironmentNotFound:
-            environment's id is not registered
-        WrongAction:
-            there was a problem executing the action on the environment
-        Exception:
-            there was an unknonwn error
+        handler (callable): optional; function serving a request,
+            `call` unless the server is a gateway
     """
-    try:
-        data = json.loads(message)
-        method = data['method']
-        params = data['params']
-    except json.JSONDecodeError:
-        ws.close((1003, 'Message `{}` is invalid'.format(message)))
-    except KeyError:
-        keys = str(list(data.keys()))
-        ws.close((1003, 'Message keys {} are missing or invalid'.format(keys)))
-    else:
-        try:
-            public[method](ws, **params)
-        except KeyError:
-            ws.close((1007, 'Method `{}` not found'.format(method)))
-        except TypeError:
-            ws.close((1007, 'Parameters `{}` are wrong'.format(data['params'])))
-        except InstanceNotFound as instance_id:
-            ws.close((1007, 'Instance `{}` not found'.format(instance_id)))
-        except EnvironmentMalformed as env_id:
-            ws.close((1007, 'Environment `{}` is malformed'.format(env_id)))
-        except EnvironmentNotFound as env_id:
-            ws.close((1007, 'Environment `{}` not found'.format(env_id)))
-        except WrongAction as action:
-            ws.close((1007, 'Action `{}` is wrong'.format(action)))
-        except Exception as err:
-            ws.close((1007, 'Unknonwn error: {}'.format(err)))
+
+    def __init__(self, ws, handler=call):
+        self.ws = ws
+        self.handler = handler
+        self.queues = {}
+        self.pool = eventlet.GreenPool()
+
+    def submit(self, data):
+        """Queues a request in its lane
+
+        Args:
+            data (dict): decoded request
+        """
+        key = lane_key(data)
+
+        if key in self.queues:
+            self.queues[key].append(data)
+        else:
+            self.queues[key] = deque([data])
+            self.pool.spawn_n(self.drain, key)
+
+    def drain(self, key):
+        """Serves the requests of a lane until it's empty
+
+        Args:
+            key (str): lane key, the instance id or None
+        """
+        queue = self.queues[key]
+        while queue:
+            with scheduler.turn(self.ws):
+                self.handler(self.ws, queue.popleft())
+        del self.queues[key]
+
+    def wait(self):
+        """Waits until all the lanes are empty"""
+        self.pool.waitall()
+
 
 @websocket.WebSocketWSGI
 def gym_handle(ws):
@@ -68,11 +76,57 @@ def gym_handle(ws):
     Args:
         ws (WebSocket): socket for communication with the client
     """
+    outbox = Outbox(ws)
+    lanes = Lanes(outbox)
+
+    try:
+        while True:
+            message = ws.wait()
+            if message is None: 
+                break
+
+            data = decode(outbox, message)
+            if data is not None:
+                lanes.submit(data)
+    finally:
+        lanes.wait()
+        disconnect(outbox)
+        outbox.finish()
+
+def green_wait(conn):
+    """Waits for an environment worker without blocking the hub,
+    so other clients are served while the environment is busy
+
+    Args:
+        conn (Connection): pipe connected to the worker
+    """
+    trampoline(conn.fileno(), read=True)
+
+def reap(interval):
+    """Periodically closes the instances that have been idle for too long
+
+    Args:
+        interval (float): seconds between checks
+    """
     while True:
-        message = ws.wait()
-        if message is None: 
-            break
-        message_handle(ws, message)
+        eventlet.sleep(interval)
+        try:
+            api.evict_idle()
+        except Exception as err:
+            print(f'Error evicting idle instances: {err}')
+
+def report(interval):
+    """Periodically prints the profile of the requests, if any
+
+    Args:
+        interval (float): seconds between reports
+    """
+    while True:
+        eventlet.sleep(interval)
+        try:
+            profiler.report()
+        except Exception as err:
+            print(f'Error reporting profile: {err}')
 
 def dispatch(environ, start_response):
     """WSGI application function
@@ -85,19 +139,147 @@ def dispatch(environ, start_response):
     """
     if environ['PATH_INFO'] == '/gym':
         return gym_handle(environ, start_response)
+    elif environ['PATH_INFO'] == '/metrics':
+        start_response('200 OK', [('Content-Type', metrics.CONTENT_TYPE)])
+        return [metrics.render().encode('utf-8')]
     else:
         start_response('200 OK', [('Content-Type', 'text/plain')])
         return ['Gymie is running...']
 
-def start(host='0.0.0.0', port=5000):
+def start(host='0.0.0.0', 
+          port=5000, 
+          env_workers=False, 
+          pool_size=0, 
+          prewarm=None, 
+          max_instances=None, 
+          idle_ttl=None,
+          backend='eventlet',
+          profile=False,
+          profile_interval=10,
+          profile_trace=None,
+          json_codec='json',
+          shards=None,
+          shard_strategy='least-loaded',
+          server_workers=1,
+          snapshot_capacity=1024,
+          snapshot_spill=None,
+          record_dir='recordings',
+          record_chunk=1024,
+          send_queue=None,
+          send_policy='block',
+          env_backend='gym',
+          scheduler_slots=None,
+          max_rollout=10000):
     """Starts the server
 
     Args:
         host (str): default value '0.0.0.0'
         port (int): default value 5000
+        backend (str): transport, either `eventlet` (default) or `asyncio`.
+            Both serve the same API with identical message semantics
+        env_workers (bool): whether each environment runs in its own subprocess
+        pool_size (int): number of ready environments kept per env id and arguments
+        prewarm (list(str)): env ids whose pool is filled at startup
+        max_instances (int): maximum number of instances alive at the same time
+        idle_ttl (float): seconds an instance can stay unused before being closed
+        profile (bool): whether to profile the phases of every request from the start.
+            It can also be turned on and off at runtime with `set_profiling`
+        profile_interval (float): seconds between profile reports
+        profile_trace (str): file where the profile is written in Chrome trace-event format
+        json_codec (str): codec of JSON messages, `json` (default) or `orjson`, faster
+            with numpy arrays. See `gymie.codec`
+        shards (list(str)): `host:port` of Gymie servers. If given, this server is
+            a gateway that spreads instances across them. See `gymie.gateway`
+        shard_strategy (str): how the gateway chooses the shard of a new instance,
+            `least-loaded` (default) or `hash`, consistent hashing of the env id
+        server_workers (int): number of server processes sharing the port, each
+            with its own instances. Crashed workers are restarted. See `gymie.prefork`
+        snapshot_capacity (int): number of snapshots taken by `clone_state` kept in memory
+        snapshot_spill (str): directory where snapshots evicted from memory are written,
+            instead of being dropped. See `gymie.snapshots`
+        record_dir (str): directory where instances made with `record` are recorded
+        record_chunk (int): rows preallocated in each shard of a recording.
+            See `gymie.recording`
+        send_queue (int): bytes each connection can have waiting to be written
+            to the client. Unbounded by default
+        send_policy (str): what happens when a send queue is full, `block` the
+            sender (default), `drop` render frames or `disconnect` the client.
+            See `gymie.outbox`
+        env_backend (str): backend of the environments made without one, `gym`
+            (default), `retro`, `unity` or any other registered. See `gymie.backends`
+        scheduler_slots (int): requests of all the connections served at the same
+            time, shared fairly by priority. Unlimited by default. See `gymie.scheduler`
+        max_rollout (int): maximum number of steps of a single `rollout` request
     """
+    options = dict(locals())
+
+    assert backend in BACKENDS, \
+        'Backend `{}` not available. Backends: {}'.format(backend, BACKENDS)
+    assert send_policy in outbox.POLICIES, \
+        'Send policy `{}` not available. Policies: {}'.format(send_policy, outbox.POLICIES)
+    assert env_backend in backends.names(), \
+        'Env backend `{}` not available. Backends: {}'.format(env_backend, backends.names())
+
+    if server_workers > 1:
+        from gymie import prefork
+
+        def serve():
+            global reuse_port
+            reuse_port = True
+            start(**dict(options, server_workers=1))
+
+        prefork.supervise(server_workers, serve)
+        return
+
+    outbox.limit = send_queue
+    outbox.policy = send_policy
+
+    if shards:
+        from gymie import gateway
+        outbox.condition = green_threading.Condition
+        gateway.start(host, port, shards, shard_strategy, reuse_port)
+        return
+
+    codec.use(json_codec)
+    workers.enabled = env_workers
+    backends.default = env_backend
+    pool.size = pool_size
+    api.max_instances = max_instances
+    api.idle_ttl = idle_ttl
+    api.max_rollout = max_rollout
+    snapshots.configure(snapshot_capacity, snapshot_spill)
+    recording.directory = record_dir
+    recording.chunk_size = record_chunk
+    scheduler.configure(scheduler_slots)
+    reap_interval = idle_ttl / 2 if idle_ttl else None
+
+    if profile:
+        profiler.enable(profile_trace)
+
+    for env_id in prewarm or []:
+        pool.prewarm(env_id, new_env)
+
+    if backend == 'asyncio':
+        from gymie import aio
+        aio.start(host, port, reap_interval, profile_interval=profile_interval, reuse_port=reuse_port)
+        return
+
+    if env_workers:
+        workers.wait = green_wait
+
+    # Frames are sent from green threads and encoded in native ones
+    rendering.spawn = eventlet.spawn_n
+    rendering.offload = tpool.execute
+    outbox.condition = green_threading.Condition
+    scheduler.event = green_threading.Event
+
+    if reap_interval:
+        eventlet.spawn_n(reap, reap_interval)
+
+    eventlet.spawn_n(report, profile_interval)
+
     try:
-        listener = eventlet.listen((host, port), reuse_port=False)
+        listener = eventlet.listen((host, port), reuse_port=reuse_port)
     except OSError as err:
         print(f'Address http://{host}:{port} already in use')
     else:
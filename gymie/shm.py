@@ -0,0 +1,90 @@
+import gym
+import numpy as np
+
+
+class ObservationRing():
+    """Ring buffer of observations living in shared memory,
+    so clients on the same host can read them without going
+    through the socket
+
+    Args:
+        space (Space): observation space, used to size the slots
+        slots (int): number of observations the ring can hold
+
+    Raises:
+        TypeError: the space has no fixed shape and dtype
+    """
+
+    def __init__(self, space, slots):
+        from multiprocessing import shared_memory
+
+        if space.shape is None or space.dtype is None:
+            raise TypeError('Shared memory needs an observation space with shape and dtype')
+
+        self.slots = slots
+        self.next_slot = 0
+
+        shape = (slots,) + tuple(space.shape)
+        size = int(np.prod(shape)) * space.dtype.itemsize
+
+        self.memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.buffer = np.ndarray(shape, dtype=space.dtype, buffer=self.memory.buf)
+
+    def write(self, observation):
+        """Writes an observation into the next slot of the ring
+
+        Args:
+            observation (np.array): observation to write
+
+        Returns:
+            Index of the slot where the observation was written
+        """
+        slot = self.next_slot
+        self.buffer[slot] = observation
+        self.next_slot = (slot + 1) % self.slots
+        return slot
+
+    def info(self):
+        """Returns what a client needs to map the ring
+
+        Returns:
+            Dictionary with the name of the shared memory block,
+            number of slots, shape and dtype of each slot
+        """
+        return {
+            'name': self.memory.name,
+            'slots': self.slots,
+            'shape': self.buffer.shape[1:],
+            'dtype': self.buffer.dtype.str,
+        }
+
+    def close(self):
+        """Releases and destroys the shared memory block"""
+        del self.buffer
+        self.memory.close()
+        self.memory.unlink()
+
+
+class SharedMemoryObservation(gym.ObservationWrapper):
+    """Writes observations into a shared memory ring buffer and
+    returns the index of the slot instead of the observation.
+    The observation space stays the same, since it describes
+    what the client finds in the slot
+
+    Args:
+        env (Env): environment to wrap
+        slots (int): number of slots of the ring buffer
+    """
+
+    def __init__(self, env, slots):
+        super().__init__(env)
+        self.ring = ObservationRing(env.observation_space, slots)
+
+    def observation(self, observation):
+        return self.ring.write(observation)
+
+    def close(self):
+        try:
+            self.env.close()
+        finally:
+            self.ring.close()
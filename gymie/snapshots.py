@@ -0,0 +1,267 @@
+import os
+import gym
+import copy
+import uuid
+import pickle
+import threading
+from collections import OrderedDict
+from gymie.exceptions import SnapshotNotFound
+
+
+###############################
+# Environment state snapshots #
+###############################
+
+# Attributes that aren't part of the state of an environment:
+# renderers, emulator handles saved on their own, shared memory...
+SKIPPED = {'viewer', 'em', 'ale', 'data', 'movie', 'ring', 'recorder', 'spare', 'spec', 'metadata', 'reward_range'}
+
+
+def layers(env):
+    """Walks the wrapper stack of an environment, from the outermost wrapper
+    down to the unwrapped environment or the proxy of an env worker
+
+    Args:
+        env (Env): environment
+
+    Returns:
+        Generator of environments
+    """
+    while isinstance(env, gym.Wrapper):
+        yield env
+        env = env.env
+    yield env
+
+def is_state(name, value):
+    """Checks whether an attribute of an environment is part of its state"""
+    return name not in SKIPPED and \
+           not isinstance(value, (gym.Env, gym.Space)) and \
+           not callable(value)
+
+def emulator_state(env):
+    """Saves the state of the emulator of an environment, if it has one:
+    Gym Retro's `em` or the Atari Learning Environment
+
+    Args:
+        env (Env): unwrapped environment
+
+    Returns:
+        Emulator state or None
+    """
+    if hasattr(env, 'em'):
+        return env.em.get_state()
+    if hasattr(env, 'clone_full_state'):
+        return env.clone_full_state()
+    return None
+
+def set_emulator_state(env, state):
+    """Loads a state saved by `emulator_state`
+
+    Args:
+        env (Env): unwrapped environment
+        state: emulator state
+    """
+    if hasattr(env, 'em'):
+        env.em.set_state(state)
+        if hasattr(env, 'data'):
+            env.data.update_ram()
+    elif hasattr(env, 'clone_full_state'):
+        env.restore_full_state(state)
+
+def capture(env):
+    """Saves the state of an environment and of every wrapper around it,
+    so it can be restored as many times as needed. Emulators save their own
+    state. Otherwise, the attributes of the unwrapped environment, such as
+    the physics state and the random generator, are deep copied
+
+    Args:
+        env (Env): environment
+
+    Returns:
+        List with the state of each layer of the wrapper stack
+
+    Raises:
+        Whatever deep copying raises if the state can't be copied,
+        e.g. Box2D worlds
+    """
+    from gymie import workers
+
+    state = []
+
+    for layer in layers(env):
+        if isinstance(layer, workers.WorkerEnv):
+            state.append((type(layer).__name__, layer.call('clone_state'), None))
+            continue
+
+        attributes = {name: value for name, value in vars(layer).items() if is_state(name, value)}
+        emulator = None if isinstance(layer, gym.Wrapper) else emulator_state(layer)
+        state.append((type(layer).__name__, emulator, copy.deepcopy(attributes)))
+
+    return state
+
+def restore(env, state):
+    """Restores a state saved by `capture` into an environment built the
+    same way, which is left untouched if the state doesn't fit it
+
+    Args:
+        env (Env): environment
+        state (list): state returned by `capture`
+
+    Raises:
+        ValueError: the state was saved from a different wrapper stack
+    """
+    from gymie import workers
+
+    stack = list(layers(env))
+    if [type(layer).__name__ for layer in stack] != [name for name, _, _ in state]:
+        raise ValueError('Snapshot was taken from a different wrapper stack')
+
+    # Copied again, so the same snapshot can be restored several times
+    attributes = [copy.deepcopy(layer_attributes) for _, _, layer_attributes in state]
+
+    for layer, (_, emulator, _), layer_attributes in zip(stack, state, attributes):
+        if isinstance(layer, workers.WorkerEnv):
+            layer.call('restore_state', emulator)
+            continue
+
+        vars(layer).update(layer_attributes)
+        if emulator is not None:
+            set_emulator_state(layer, emulator)
+
+        # Wrappers that need to know, e.g. `gymie.recording.RecordingEnv`
+        if callable(getattr(type(layer), 'restored', None)):
+            layer.restored()
+
+
+class Store():
+    """Bounded store of snapshots, keyed by an opaque handle. When it's
+    full, the least recently used snapshots are evicted or, if a spill
+    directory is given, pickled into it and loaded back when needed.
+    Snapshots belong to the connection that took them
+
+    Args:
+        capacity (int): maximum number of snapshots kept in memory
+        spill (str): optional; directory where evicted snapshots are written
+    """
+
+    def __init__(self, capacity=1024, spill=None):
+        self.capacity = capacity
+        self.spill = spill
+        self.snapshots = OrderedDict()
+        self.spilled = {}
+        self.lock = threading.Lock()
+
+        if spill:
+            os.makedirs(spill, exist_ok=True)
+
+    def path(self, handle):
+        return os.path.join(self.spill, handle + '.snapshot')
+
+    def put(self, owner, env_id, state):
+        """Stores a snapshot
+
+        Args:
+            owner: connection that took it
+            env_id (str): environment id of the instance
+            state: state returned by `capture`
+
+        Returns:
+            Handle of the snapshot
+        """
+        handle = uuid.uuid4().hex
+
+        with self.lock:
+            self.snapshots[handle] = (owner, env_id, state)
+            self.evict()
+
+        return handle
+
+    def get(self, owner, handle):
+        """Looks up a snapshot, loading it from disk if it was spilled
+
+        Args:
+            owner: connection asking for it
+            handle (str): handle returned by `put`
+
+        Returns:
+            Environment id and state of the snapshot
+
+        Raises:
+            SnapshotNotFound: the snapshot doesn't exist, was evicted
+                or belongs to another connection
+        """
+        with self.lock:
+            if handle in self.snapshots:
+                self.snapshots.move_to_end(handle)
+            elif self.spilled.get(handle, None) == owner:
+                del self.spilled[handle]
+
+                with open(self.path(handle), 'rb') as file:
+                    env_id, state = pickle.load(file)
+
+                os.remove(self.path(handle))
+                self.snapshots[handle] = (owner, env_id, state)
+                self.evict()
+            else:
+                raise SnapshotNotFound(handle)
+
+            snapshot_owner, env_id, state = self.snapshots[handle]
+
+        if snapshot_owner != owner:
+            raise SnapshotNotFound(handle)
+
+        return env_id, state
+
+    def evict(self):
+        """Evicts the least recently used snapshots until the store fits its capacity"""
+        while len(self.snapshots) > self.capacity:
+            handle, (owner, env_id, state) = self.snapshots.popitem(last=False)
+
+            if self.spill:
+                with open(self.path(handle), 'wb') as file:
+                    pickle.dump((env_id, state), file, protocol=pickle.HIGHEST_PROTOCOL)
+                self.spilled[handle] = owner
+
+    def discard(self, owner):
+        """Forgets the snapshots of a connection, in memory and on disk
+
+        Args:
+            owner: connection that is gone
+        """
+        with self.lock:
+            for handle in [handle for handle, snapshot in self.snapshots.items() if snapshot[0] == owner]:
+                del self.snapshots[handle]
+
+            for handle in [handle for handle, spilled_owner in self.spilled.items() if spilled_owner == owner]:
+                del self.spilled[handle]
+                try:
+                    os.remove(self.path(handle))
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Forgets every snapshot"""
+        with self.lock:
+            for handle in self.spilled:
+                try:
+                    os.remove(self.path(handle))
+                except OSError:
+                    pass
+
+            self.snapshots.clear()
+            self.spilled.clear()
+
+
+# Snapshots taken by `clone_state`
+store = Store()
+
+def configure(capacity=1024, spill=None):
+    """Replaces the store of snapshots
+
+    Args:
+        capacity (int): maximum number of snapshots kept in memory
+        spill (str): optional; directory where evicted snapshots are written
+    """
+    global store
+    store.clear()
+    store = Store(capacity, spill)
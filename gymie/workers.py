@@ -0,0 +1,171 @@
+import gym
+import multiprocessing
+
+
+# Whether `make` instantiates environments in their own subprocess
+enabled = False
+
+# Forking keeps any `@override` applied in the parent process
+try:
+    context = multiprocessing.get_context('fork')
+except ValueError:
+    context = multiprocessing.get_context()
+
+
+def wait(conn):
+    """Waits until the worker has something to say.
+    Servers replace it with a cooperative version
+    so other clients are served in the meantime
+
+    Args:
+        conn (Connection): pipe connected to the worker
+    """
+    conn.poll(None)
+
+def work(conn, env_id, kwargs):
+    """Main loop of the worker process. It instantiates the environment
+    and executes the methods requested through the pipe
+
+    Args:
+        conn (Connection): pipe connected to the server
+        env_id (str): environment id
+        kwargs (dict): extra arguments for `build_env`
+    """
+    from gymie import api, snapshots
+
+    # Methods the worker executes on behalf of the environment
+    helpers = {'clone_state': snapshots.capture, 'restore_state': snapshots.restore}
+
+    try:
+        env = api.build_env(env_id, **kwargs)
+    except Exception as err:
+        conn.send((False, err))
+        return
+
+    info = env.observation_space, env.action_space, env.metadata, env.reward_range
+    conn.send((True, info + (getattr(env, 'spec', None),)))
+
+    while True:
+        try:
+            method, args, kwargs = conn.recv()
+        except EOFError:
+            env.close()
+            break
+
+        try:
+            if method in helpers:
+                result = helpers[method](env, *args, **kwargs)
+            else:
+                result = getattr(env, method)(*args, **kwargs)
+        except Exception as err:
+            try:
+                conn.send((False, err))
+            except Exception:
+                conn.send((False, RuntimeError(repr(err))))
+        else:
+            conn.send((True, result))
+
+        if method == 'close':
+            break
+
+
+class WorkerEnv(gym.Env):
+    """Proxy to an environment living in its own subprocess.
+    This way a slow step doesn't block the rest of the clients,
+    steps of different instances run in parallel, and emulators
+    limited to one instance per process, like Gym Retro, can be
+    served several times.
+
+    Args:
+        env_id (str): environment id
+        **kwargs: extra arguments for `build_env`
+
+    Raises:
+        Whatever `build_env` raises in the worker
+    """
+
+    def __init__(self, env_id, **kwargs):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=work,
+                                       args=(child_conn, env_id, kwargs),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        try:
+            info = self.receive()
+        except Exception:
+            self.process.join()
+            raise
+
+        (self.observation_space,
+         self.action_space,
+         self.metadata,
+         self.reward_range,
+         self.spec) = info
+
+    def receive(self):
+        """Receives the result of the last call sent to the worker
+
+        Returns:
+            Whatever the environment returned
+
+        Raises:
+            Whatever the environment raised
+        """
+        wait(self.conn)
+
+        try:
+            success, result = self.conn.recv()
+        except EOFError:
+            raise RuntimeError('Environment worker {} died'.format(self.process.pid))
+
+        if not success:
+            raise result
+
+        return result
+
+    def call(self, method, *args, **kwargs):
+        """Executes a method of the environment in the worker
+
+        Args:
+            method (str): name of the method
+            *args, **kwargs: arguments of the method
+
+        Returns:
+            Whatever the method returned
+        """
+        self.conn.send((method, args, kwargs))
+        return self.receive()
+
+    def get_attr(self, name):
+        """Gets an attribute of the environment in the worker
+
+        Args:
+            name (str): name of the attribute
+        """
+        return self.call('__getattribute__', name)
+
+    def step(self, action):
+        return self.call('step', action)
+
+    def reset(self, **kwargs):
+        return self.call('reset', **kwargs)
+
+    def render(self, mode='human'):
+        return self.call('render', mode=mode)
+
+    def seed(self, seed=None):
+        return self.call('seed', seed)
+
+    def close(self):
+        if not self.conn.closed:
+            try:
+                if self.process.is_alive():
+                    self.call('close')
+            finally:
+                self.conn.close()
+                self.process.join(timeout=1)
+
+        if self.process.is_alive():
+            self.process.terminate()
@@ -2,3 +2,12 @@
 
 echo "Testing OpenAI Gym..."
 python tests/test_gymie.py
+
+echo "Testing asyncio backend..."
+python tests/test_gymie_asyncio.py
+
+echo "Testing gateway..."
+python tests/test_gymie_gateway.py
+
+echo "Testing prefork workers..."
+python tests/test_gymie_prefork.py
@@ -23,6 +23,8 @@ setuptools.setup(
         'box2d': ['box2d-py==2.3.8'],
         'retro': ['gym-retro==0.8.0'],
         'unity': ['mlagents-envs==0.20.0', 'gym-unity==0.20.0'],
+        'fast': ['orjson>=3.0'],
+        'jpeg': ['Pillow>=7.0'],
     },
     classifiers=[
         "Programming Language :: Python :: 3.6",
@@ -1,11 +1,12 @@
 import unittest
 from unittest import TestCase
 from unittest.mock import MagicMock
-from gymie.api import envs, make
+from gymie import rendering, replay, snapshots
+from gymie.api import envs, owners, last_used, env_ids, schemas, decoders, connections, make
 
 
 class WebsocketMock():
-    def send(self, message):
+    def send(self, message, droppable=False):
         pass
 
     def close(self, close_data=None):
@@ -25,7 +26,16 @@ class TestBase(TestCase):
         keys = list(envs.keys())
         for instance_id in keys:
             del envs[instance_id]
+        owners.clear()
+        last_used.clear()
+        env_ids.clear()
+        schemas.clear()
+        decoders.clear()
+        connections.clear()
+        snapshots.store.clear()
+        replay.replays.clear()
+        rendering.subscriptions.clear()
     
-    def make_env(self, env_id):
-        make(self.ws, env_id)
+    def make_env(self, env_id, **params):
+        make(self.ws, env_id, **params)
         return self.ws.send.call_args[0][0]
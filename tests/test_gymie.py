@@ -1,16 +1,47 @@
 #!/usr/bin/env python3
 
+import os
+import time
+import asyncio
 import uuid
+import zlib
+import importlib.util
+import tempfile
 import json
 import unittest
+import threading
 import gymie.server as server
 import gymie.api as api
 import numpy as np
+import gym
 from functools import reduce
 from test_base import TestBase
+from gymie import autoreset, backends, binary, codec, metrics, outbox, pool, preprocessing, profiler, recording, rendering, scheduler, schema, snapshots, workers
+from gymie.rendering import spawn
+from unittest.mock import MagicMock
+from gymie.protocol import Reply
 from gymie.exceptions import *
 
 
+class ImageEnv(gym.Env):
+    """Environment with random RGB frames, like Atari or Gym Retro"""
+
+    observation_space = gym.spaces.Box(low=0, high=255, shape=(210, 160, 3), dtype=np.uint8)
+    action_space = gym.spaces.Discrete(2)
+
+    def reset(self):
+        return self.observation_space.sample()
+
+    def step(self, action):
+        self.frame = self.observation_space.sample()
+        return self.frame, 1.0, False, {}
+
+    def render(self, mode='human'):
+        return self.frame
+
+gym.envs.registration.register(id='ImageTest-v0', entry_point=ImageEnv)
+
+
 class TestGymie(TestBase):
 
     def __init__(self, *args, **kwargs):
@@ -42,6 +73,9 @@ class TestGymie(TestBase):
         server.message_handle(self.ws, '{"method": "make", "params": {"env_id": "NotFound-v1" }}')
         self.ws.close.assert_called_with((1007, 'Environment `NotFound-v1` not found'))
 
+        server.message_handle(self.ws, '{"method": "set_encoding", "params": {"encoding": "xml" }}')
+        self.ws.close.assert_called_with((1007, 'Encoding `xml` not supported'))
+
         # TODO: test more exceptions
     
     def test_get_env(self):
@@ -67,6 +101,49 @@ class TestGymie(TestBase):
         self.assertTrue(type(instance_id) == str)
         self.assertTrue(len(instance_id) == len(uuid.uuid4().hex))
     
+    def test_backends(self):
+        registry = dict(backends.registry)
+        get_env = api.get_env
+        entry_points = backends.entry_points
+
+        def double_reward(step):
+            observation, reward, done, info = step
+            return observation, reward * 2, done, info
+
+        try:
+            backends.register('custom', lambda env_id, seed=None: gym.make('CartPole-v1'), double_reward)
+            instance_id = self.make_env('ignored', backend='custom')
+            api.reset(self.ws, instance_id)
+            api.step(self.ws, instance_id, 0)
+            self.assertEqual(json.loads(self.ws.send.call_args[0][0])[1], 2.0)
+
+            with self.assertRaises(BackendNotFound):
+                api.make(self.ws, 'CartPole-v1', backend='not_found')
+
+            # Backends whose package isn't installed
+            if importlib.util.find_spec('retro') is None:
+                with self.assertRaises(BackendNotFound):
+                    api.make(self.ws, 'Airstriker-Genesis', backend='retro')
+
+            # Entry points are discovered the first time an unknown backend is asked for
+            point = MagicMock()
+            point.load.return_value = backends.Backend(backends.gym_env)
+            backends.discovered = False
+            backends.entry_points = lambda: {'plugin': point}
+            env = backends.make('plugin', 'CartPole-v1')
+            self.assertEqual(env.spec.id, 'CartPole-v1')
+            self.assertIn('plugin', backends.names())
+
+            # `@override` replaces the backend of instances made without one
+            api.override('get_env')(lambda env_id, seed=None: gym.make('MountainCar-v0'))
+            self.assertEqual(api.lookup_env(self.make_env('CartPole-v1')).spec.id, 'MountainCar-v0')
+            self.assertEqual(api.lookup_env(self.make_env('CartPole-v1', backend='gym')).spec.id, 'CartPole-v1')
+        finally:
+            api.get_env = get_env
+            backends.registry = registry
+            backends.discovered = False
+            backends.entry_points = entry_points
+
     def test_lookup_env(self):
         instance_id = self.make_env('CartPole-v1')
 
@@ -156,6 +233,1095 @@ class TestGymie(TestBase):
 
         self.assertEqual(np.array(action).shape, env.action_space.shape)
 
+    def test_binary_encoding(self):
+        instance_id = self.make_env('CartPole-v1')
+        env = api.lookup_env(instance_id)
+
+        api.set_encoding(self.ws, 'binary')
+        self.assertTrue(json.loads(self.ws.send.call_args[0][0]))
+
+        api.reset(self.ws, instance_id)
+        header, state = binary.decode(self.ws.send.call_args[0][0])
+
+        self.assertEqual(state.shape, env.observation_space.shape)
+
+        api.step(self.ws, instance_id, env.action_space.sample())
+        header, observation = binary.decode(self.ws.send.call_args[0][0])
+
+        self.assertEqual(header['shape'], list(env.observation_space.shape))
+        self.assertTrue(type(header['reward']) == float)
+        self.assertTrue(type(header['done']) == bool)
+        self.assertTrue(type(header['info']) == dict)
+
+        api.action_sample(self.ws, instance_id)
+        header, action = binary.decode(self.ws.send.call_args[0][0])
+
+        self.assertTrue(int(action) in range(env.action_space.n))
+
+        api.set_encoding(self.ws, 'json')
+        api.reset(self.ws, instance_id)
+        self.assert_valid_state(json.loads(self.ws.send.call_args[0][0]))
+
+    def test_step_batch(self):
+        instance_ids = [self.make_env('CartPole-v1') for _ in range(3)]
+        api.reset_batch(self.ws, instance_ids)
+
+        states = json.loads(self.ws.send.call_args[0][0])
+        self.assertEqual(len(states), 3)
+        for state in states:
+            self.assert_valid_state(state)
+
+        with self.assertRaises(TypeError):
+            api.step_batch(self.ws, instance_ids, [0, 1])
+
+        with self.assertRaises(WrongAction):
+            api.step_batch(self.ws, instance_ids, [0, 1, 'invalid_action'])
+
+        api.step_batch(self.ws, instance_ids, [0, 1, 0])
+        observations, rewards, dones, infos = json.loads(self.ws.send.call_args[0][0])
+
+        self.assertEqual(len(observations), 3)
+        for observation in observations:
+            self.assert_valid_state(observation)
+        self.assertTrue(all(type(reward) == float for reward in rewards))
+        self.assertTrue(all(type(done) == bool for done in dones))
+
+        api.set_encoding(self.ws, 'binary')
+        api.step_batch(self.ws, instance_ids, [1, 1, 1])
+        header, observations = binary.decode(self.ws.send.call_args[0][0])
+
+        self.assertEqual(observations.shape, (3, 4))
+        self.assertEqual(len(header['rewards']), 3)
+
+        with self.assertRaises(InstanceNotFound):
+            api.reset_batch(self.ws, instance_ids + ['not_found'])
+
+    def test_step_batch_mixed_spaces(self):
+        instance_ids = [self.make_env('CartPole-v1'), self.make_env('MountainCar-v0')]
+        api.set_encoding(self.ws, 'binary')
+        api.reset_batch(self.ws, instance_ids)
+
+        # Observations can't be stacked, so they're sent as JSON
+        cartpole_state, mountaincar_state = json.loads(self.ws.send.call_args[0][0])
+        self.assert_valid_state(cartpole_state)
+        self.assert_valid_state(mountaincar_state, size=2)
+
+    def test_env_workers(self):
+        workers.enabled = True
+        try:
+            with self.assertRaises(EnvironmentNotFound):
+                api.make(self.ws, 'NotFound-v1')
+
+            instance_id = self.make_env('CartPole-v1')
+        finally:
+            workers.enabled = False
+
+        env = api.lookup_env(instance_id)
+        self.assertTrue(isinstance(env, workers.WorkerEnv))
+        self.assertTrue(env.spec.id == 'CartPole-v1')
+
+        api.reset(self.ws, instance_id)
+        self.assert_valid_state(json.loads(self.ws.send.call_args[0][0]))
+
+        with self.assertRaises(WrongAction):
+            api.step(self.ws, instance_id, 'invalid_action')
+
+        api.step(self.ws, instance_id, env.action_space.sample())
+        observation, reward, done, info = json.loads(self.ws.send.call_args[0][0])
+        self.assert_valid_state(observation)
+
+        api.close(self.ws, instance_id)
+        self.assertFalse(env.process.is_alive())
+
+    def test_shared_memory(self):
+        from multiprocessing import shared_memory
+
+        api.make(self.ws, 'CartPole-v1', shared_memory=2)
+        instance_id = self.ws.send.call_args[0][0]
+        env = api.lookup_env(instance_id)
+
+        api.shared_memory_info(self.ws, instance_id)
+        info = json.loads(self.ws.send.call_args[0][0])
+
+        self.assertEqual(info['slots'], 2)
+        self.assertEqual(info['shape'], list(env.observation_space.shape))
+
+        memory = shared_memory.SharedMemory(info['name'])
+        ring = np.ndarray([info['slots']] + info['shape'], 
+                          dtype=info['dtype'], 
+                          buffer=memory.buf)
+
+        api.reset(self.ws, instance_id)
+        slot = json.loads(self.ws.send.call_args[0][0])
+        self.assertEqual(slot, 0)
+        self.assert_valid_state(ring[slot].tolist())
+
+        api.step(self.ws, instance_id, env.action_space.sample())
+        slot, reward, done, info = json.loads(self.ws.send.call_args[0][0])
+        self.assertEqual(slot, 1)
+        self.assertTrue(np.allclose(ring[slot], env.unwrapped.state))
+
+        del ring
+        memory.close()
+        api.close(self.ws, instance_id)
+
+        other_id = self.make_env('CartPole-v1')
+        with self.assertRaises(TypeError):
+            api.shared_memory_info(self.ws, other_id)
+
+    def step_until_done(self, instance_id):
+        for _ in range(500):
+            api.step(self.ws, instance_id, 0)
+            observation, reward, done, info = json.loads(self.ws.send.call_args[0][0])
+            if done:
+                return observation, info
+
+    def test_auto_reset(self):
+        instance_id = self.make_env('CartPole-v1', auto_reset=True, pre_reset=False)
+        api.reset(self.ws, instance_id)
+
+        observation, info = self.step_until_done(instance_id)
+        env = api.lookup_env(instance_id)
+        self.assertEqual(list(env.unwrapped.state), info[autoreset.RESET_KEY])
+        self.assertNotEqual(observation, info[autoreset.RESET_KEY])
+
+        # The next episode is already going
+        api.step(self.ws, instance_id, 1)
+        observation, reward, done, info = json.loads(self.ws.send.call_args[0][0])
+        self.assertFalse(done)
+        self.assertNotIn(autoreset.RESET_KEY, info)
+
+        # Binary frames carry it in the header
+        api.set_encoding(self.ws, 'binary')
+        for _ in range(500):
+            api.step(self.ws, instance_id, 0)
+            header, observation = binary.decode(self.ws.send.call_args[0][0])
+            if header['done']:
+                break
+        self.assertEqual(len(header['info'][autoreset.RESET_KEY]), 4)
+
+        # Seeded instances don't get a spare
+        instance_id = self.make_env('CartPole-v1', auto_reset=True, seed=1)
+        self.assertNotIsInstance(api.lookup_env(instance_id).env, autoreset.PreResetEnv)
+
+    def test_pre_reset(self):
+        instance_id = self.make_env('CartPole-v1', auto_reset=True)
+        pre_reset = api.lookup_env(instance_id).env
+        spare = pre_reset.spare
+        self.assertIsInstance(pre_reset, autoreset.PreResetEnv)
+
+        for _ in range(500):
+            if spare.env is not None:
+                break
+            time.sleep(0.01)
+
+        # The first reset swaps the spare in, and the other environment becomes the spare
+        first, initial = spare.env, spare.observation
+        api.reset(self.ws, instance_id)
+        self.assertEqual(json.loads(self.ws.send.call_args[0][0]), initial.tolist())
+        self.assertIs(pre_reset.env, first)
+
+        for _ in range(500):
+            if spare.env is not None:
+                break
+            time.sleep(0.01)
+
+        second, initial = spare.env, spare.observation
+        observation, info = self.step_until_done(instance_id)
+        self.assertEqual(info[autoreset.RESET_KEY], initial.tolist())
+        self.assertIs(pre_reset.env, second)
+        self.assertIn('gymie_pre_resets_total{outcome="ready"}', metrics.render())
+
+        api.remove_instance(instance_id)
+        self.assertTrue(spare.closed)
+
+    def test_rollout(self):
+        instance_id = self.make_env('CartPole-v1')
+        api.reset(self.ws, instance_id)
+
+        with self.assertRaises(TypeError):
+            api.rollout(self.ws, instance_id, policy='sample')
+
+        with self.assertRaises(TypeError):
+            api.rollout(self.ws, instance_id, policy='repeat', max_steps=5)
+
+        with self.assertRaises(WrongAction):
+            api.rollout(self.ws, instance_id, actions=[0, 'invalid_action'])
+
+        with self.assertRaises(TypeError):
+            api.rollout(self.ws, instance_id, max_steps=api.max_rollout + 1)
+
+        with self.assertRaises(TypeError):
+            api.rollout(self.ws, instance_id, actions=[0] * (api.max_rollout + 1))
+
+        api.rollout(self.ws, instance_id, actions=[0, 1, 0])
+        observations, actions, rewards, done, infos = json.loads(self.ws.send.call_args[0][0])
+
+        self.assertEqual(len(observations), 3)
+        for observation in observations:
+            self.assert_valid_state(observation)
+        self.assertEqual(actions, [0, 1, 0])
+        self.assertEqual(len(rewards), 3)
+        self.assertFalse(done)
+
+        # Pushing to the same side ends the episode quickly
+        api.rollout(self.ws, instance_id, policy='repeat', action=1, max_steps=500)
+        observations, actions, rewards, done, infos = json.loads(self.ws.send.call_args[0][0])
+
+        self.assertTrue(done)
+        self.assertTrue(len(observations) < 500)
+        self.assertTrue(all(action == 1 for action in actions))
+
+        api.reset(self.ws, instance_id)
+        api.set_encoding(self.ws, 'binary')
+        api.rollout(self.ws, instance_id, policy='sample', max_steps=2)
+        header, observations = binary.decode(self.ws.send.call_args[0][0])
+
+        self.assertEqual(observations.shape, (2, 4))
+        self.assertEqual(len(header['actions']), 2)
+
+    def test_preprocessing(self):
+        preprocess = [
+            {'name': 'frame_skip', 'skip': 4},
+            {'name': 'grayscale'},
+            {'name': 'resize', 'width': 84, 'height': 84},
+            {'name': 'frame_stack', 'n': 4},
+        ]
+
+        with self.assertRaises(TypeError):
+            api.make(self.ws, 'ImageTest-v0', preprocess=[{'name': 'not_found'}])
+
+        api.make(self.ws, 'ImageTest-v0', preprocess=preprocess)
+        instance_id = self.ws.send.call_args[0][0]
+
+        api.observation_space(self.ws, instance_id)
+        info = json.loads(self.ws.send.call_args[0][0])
+
+        self.assertEqual(info['shape'], [4, 84, 84])
+        self.assertEqual(np.max(info['high']), 255)
+
+        api.reset(self.ws, instance_id)
+        state = np.array(json.loads(self.ws.send.call_args[0][0]))
+        self.assertEqual(state.shape, (4, 84, 84))
+        self.assertTrue(np.array_equal(state[0], state[3]))
+
+        api.step(self.ws, instance_id, 0)
+        observation, reward, done, info = json.loads(self.ws.send.call_args[0][0])
+        self.assertEqual(np.array(observation).shape, (4, 84, 84))
+        self.assertEqual(reward, 4.0)
+
+    def test_resize(self):
+        env = ImageEnv()
+        env.observation_space = gym.spaces.Box(low=0, high=255, shape=(4, 6, 3), dtype=np.uint8)
+        frame = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+
+        nearest = preprocessing.resize(env, width=3, height=2, interpolation_method='nearest')
+        self.assertEqual(nearest.observation(frame).shape, (2, 3, 3))
+
+        # Halving the size with bilinear interpolation averages pairs of pixels
+        bilinear = preprocessing.resize(env, width=3, height=2)
+        expected = frame.reshape(2, 2, 3, 2, 3).mean(axis=(1, 3))
+        self.assertTrue(np.array_equal(bilinear.observation(frame), np.rint(expected)))
+
+    def test_pool(self):
+        spawn = pool.spawn
+        pool.spawn = lambda fn, *args: fn(*args) # refills synchronously
+        pool.size = 2
+
+        try:
+            instance_id = self.make_env('CartPole-v1')
+            ready = pool.pools[pool.pool_key('CartPole-v1', {})]
+            self.assertEqual(len(ready), 2)
+
+            pooled_env = ready[0]
+            other_id = self.make_env('CartPole-v1')
+            self.assertTrue(api.lookup_env(other_id).env is pooled_env)
+
+            ready.clear()
+            api.close(self.ws, other_id)
+            self.assertTrue(ready[0] is pooled_env)
+
+            env = api.lookup_env(instance_id)
+            api.reset(self.ws, instance_id)
+            api.step(self.ws, instance_id, 0)
+            self.assertTrue(env.spec.id == 'CartPole-v1')
+        finally:
+            pool.spawn = spawn
+            pool.size = 0
+            pool.clear()
+
+    def test_disconnect(self):
+        instance_id = self.make_env('CartPole-v1')
+        other_ws = type(self.ws)()
+        other_ws.send = lambda message: None
+        api.make(other_ws, 'CartPole-v1')
+
+        api.disconnect(self.ws)
+
+        with self.assertRaises(InstanceNotFound):
+            api.lookup_env(instance_id)
+        self.assertEqual(len(api.envs), 1)
+
+    def test_max_instances(self):
+        api.max_instances = 1
+        try:
+            self.make_env('CartPole-v1')
+            with self.assertRaises(CapacityReached):
+                api.make(self.ws, 'CartPole-v1')
+
+            server.message_handle(self.ws, '{"method": "make", "params": {"env_id": "CartPole-v1" }}')
+            self.ws.close.assert_called_with((1013, 'Maximum number of instances (1) reached'))
+        finally:
+            api.max_instances = None
+
+    def test_idle_ttl(self):
+        first_id = self.make_env('CartPole-v1')
+        second_id = self.make_env('CartPole-v1')
+        api.lookup_env(first_id) # first one becomes the most recently used
+
+        api.idle_ttl = 60
+        try:
+            api.last_used[second_id] -= 120
+            api.evict_idle()
+        finally:
+            api.idle_ttl = None
+
+        api.lookup_env(first_id)
+        with self.assertRaises(InstanceNotFound):
+            api.lookup_env(second_id)
+
+    def test_request_id(self):
+        instance_id = self.make_env('CartPole-v1')
+
+        server.message_handle(self.ws, json.dumps({
+            'id': 7, 
+            'method': 'reset', 
+            'params': {'instance_id': instance_id},
+        }))
+
+        tag, state = self.ws.send.call_args[0][0].split('\n', 1)
+        self.assertEqual(json.loads(tag), {'id': 7})
+        self.assert_valid_state(json.loads(state))
+
+        api.set_encoding(self.ws, 'binary')
+        server.message_handle(self.ws, json.dumps({
+            'id': 'step-1', 
+            'method': 'step', 
+            'params': {'instance_id': instance_id, 'action': 0},
+        }))
+
+        header, observation = binary.decode(self.ws.send.call_args[0][0])
+        self.assertEqual(header['id'], 'step-1')
+        self.assertEqual(observation.shape, (4,))
+
+    def test_lanes(self):
+        first_id = self.make_env('CartPole-v1')
+        second_id = self.make_env('CartPole-v1')
+        lanes = server.Lanes(self.ws)
+
+        for i, instance_id in enumerate([first_id, second_id, first_id, second_id]):
+            lanes.submit({'id': i, 'method': 'reset', 'params': {'instance_id': instance_id}})
+        lanes.submit({'method': 'action_sample', 'params': {'instance_id': first_id}})
+        lanes.wait()
+
+        tags = [call[0][0].split('\n', 1)[0] for call in self.ws.send.call_args_list[2:]]
+        ids = [json.loads(tag)['id'] for tag in tags if tag.startswith('{')]
+
+        self.assertEqual(len(tags), 5)
+        self.assertTrue(ids.index(0) < ids.index(2))
+        self.assertTrue(ids.index(1) < ids.index(3))
+        self.assertEqual(lanes.queues, {})
+
+    def test_metrics(self):
+        def sample(name, **labels):
+            line = '{}{} '.format(name, metrics.format_labels(labels.keys(), labels.values()))
+            for row in metrics.render().splitlines():
+                if row.startswith(line):
+                    return float(row[len(line):])
+            return 0.0
+
+        steps = sample('gymie_steps_total', env_id='CartPole-v1')
+        requests = sample('gymie_requests_total', method='step', env_id='CartPole-v1')
+        errors = sample('gymie_errors_total', code=1007)
+
+        instance_id = self.make_env('CartPole-v1')
+        self.assertEqual(sample('gymie_instances', env_id='CartPole-v1'), 1)
+
+        server.message_handle(self.ws, json.dumps({'method': 'reset', 'params': {'instance_id': instance_id}}))
+        for _ in range(3):
+            server.message_handle(self.ws, json.dumps({
+                'method': 'step', 
+                'params': {'instance_id': instance_id, 'action': 0},
+            }))
+        api.rollout(self.ws, instance_id, actions=[0, 1])
+        server.message_handle(self.ws, json.dumps({'method': 'step', 'params': {'instance_id': 'wrong'}}))
+
+        self.assertEqual(sample('gymie_steps_total', env_id='CartPole-v1'), steps + 5)
+        self.assertEqual(sample('gymie_requests_total', method='step', env_id='CartPole-v1'), requests + 3)
+        self.assertEqual(sample('gymie_errors_total', code=1007), errors + 1)
+        self.assertTrue(sample('gymie_sent_bytes_total', method='step') > 0)
+        self.assertTrue(sample('gymie_request_duration_seconds_count', method='step', env_id='CartPole-v1') >= 3)
+
+        api.close(self.ws, instance_id)
+        self.assertEqual(sample('gymie_instances', env_id='CartPole-v1'), 0)
+
+    def test_metrics_endpoint(self):
+        body = b''.join(server.dispatch({'PATH_INFO': '/metrics'}, lambda status, headers: None))
+        self.assertTrue(b'# TYPE gymie_requests_total counter' in body)
+        self.assertTrue(b'# TYPE gymie_request_duration_seconds histogram' in body)
+
+    def test_profiler(self):
+        instance_id = self.make_env('CartPole-v1')
+        trace_path = os.path.join(tempfile.mkdtemp(), 'trace.json')
+        profiler.snapshot(reset=True)
+
+        server.message_handle(self.ws, json.dumps({'method': 'reset', 'params': {'instance_id': instance_id}}))
+        self.assertEqual(profiler.snapshot(), {})
+
+        profiler.enable(trace_path)
+        try:
+            for _ in range(2):
+                server.message_handle(self.ws, json.dumps({
+                    'id': 1,
+                    'method': 'step', 
+                    'params': {'instance_id': instance_id, 'action': 0},
+                }))
+            server.message_handle(self.ws, json.dumps({'method': 'set_profiling', 'params': {'enabled': False}}))
+            self.assertFalse(profiler.enabled)
+            server.message_handle(self.ws, json.dumps({'method': 'reset', 'params': {'instance_id': instance_id}}))
+        finally:
+            profiler.disable()
+            profiler.close()
+
+        window = profiler.snapshot(reset=True)
+        entry = window[('step', 'CartPole-v1')]
+        self.assertEqual(entry['count'], 2)
+        for name in profiler.PHASES:
+            self.assertTrue(entry[name] >= 0)
+        self.assertTrue(entry['total'] >= entry['env'] + entry['serialize'])
+        self.assertFalse(('reset', 'CartPole-v1') in window)
+        self.assertTrue('step' in profiler.format_report(window))
+
+        with open(trace_path) as trace_file:
+            events = json.load(trace_file)
+
+        requests = [event for event in events if event['cat'] == 'request']
+        self.assertEqual([event['name'] for event in requests], ['step', 'step', 'set_profiling'])
+        self.assertEqual(requests[0]['args']['lane'], instance_id)
+        self.assertEqual({event['name'] for event in events if event['cat'] == 'phase'}, set(profiler.PHASES))
+
+    def test_schema(self):
+        space = gym.spaces.Dict({
+            'move': gym.spaces.MultiDiscrete([3, 2]),
+            'aim': gym.spaces.Tuple((gym.spaces.Discrete(4), gym.spaces.Box(-1, 1, (2,), dtype=np.float32))),
+            'buttons': gym.spaces.MultiBinary(3),
+        })
+
+        info = json.loads(json.dumps(schema.schema(space)))
+        self.assertEqual(info['name'], 'Dict')
+        self.assertEqual(info['spaces']['move'], {'name': 'MultiDiscrete', 'nvec': [3, 2], 'shape': [2]})
+        self.assertEqual(info['spaces']['aim']['spaces'][0], {'name': 'Discrete', 'n': 4})
+        self.assertEqual(info['spaces']['aim']['spaces'][1]['dtype'], '<f4')
+        self.assertEqual(info['spaces']['buttons']['n'], 3)
+
+        decode = schema.decoder(space)
+        action = decode({'move': [2, 1], 'aim': [3, [0.5, -0.5]], 'buttons': [1, 0, 1]})
+        self.assertTrue(space.contains(action))
+        self.assertEqual(action['aim'][1].dtype, np.float32)
+        self.assertEqual(action['buttons'].dtype, np.int8)
+
+        wrong_actions = [
+            {'move': [3, 1], 'aim': [3, [0.5, -0.5]], 'buttons': [1, 0, 1]},
+            {'move': [2, 1], 'aim': [4, [0.5, -0.5]], 'buttons': [1, 0, 1]},
+            {'move': [2, 1], 'aim': [3, [0.5]], 'buttons': [1, 0, 1]},
+            {'move': [2, 1], 'aim': [3, [0.5, -0.5]], 'buttons': [1, 0, 2]},
+            {'move': [2, 1], 'aim': [3, [0.5, -0.5]]},
+            'invalid_action',
+        ]
+        for wrong_action in wrong_actions:
+            with self.assertRaises(WrongAction):
+                decode(wrong_action)
+
+        decode = schema.decoder(gym.spaces.Discrete(2))
+        self.assertEqual(decode(np.int64(1)), 1)
+        for wrong_action in [2, -1, True, 1.0, '1']:
+            with self.assertRaises(WrongAction):
+                decode(wrong_action)
+
+    def test_cached_schemas(self):
+        instance_id = self.make_env('Pendulum-v0')
+        env = api.lookup_env(instance_id)
+
+        api.action_space(self.ws, instance_id)
+        self.assertTrue(self.ws.send.call_args[0][0] is api.schemas[instance_id]['action_space'])
+        info = json.loads(self.ws.send.call_args[0][0])
+        self.assertEqual(info['shape'], [1])
+
+        api.reset(self.ws, instance_id)
+        api.step(self.ws, instance_id, 0.5)
+        api.step(self.ws, instance_id, [0.5])
+        with self.assertRaises(WrongAction):
+            api.step(self.ws, instance_id, [0.5, 0.5])
+
+        api.close(self.ws, instance_id)
+        self.assertFalse(instance_id in api.schemas)
+        self.assertFalse(instance_id in api.decoders)
+
+    def test_json_codec(self):
+        observation = np.random.rand(3, 4).astype(np.float32)
+        step = (observation, 1.0, False, {'lives': 3})
+
+        # Same bytes as serializing `tolist()` with the standard library
+        json_codec = codec.JsonCodec()
+        self.assertEqual(json_codec.dumps(step), json.dumps((observation.tolist(), 1.0, False, {'lives': 3})))
+        self.assertEqual(json_codec.literal(observation), str(observation.tolist()))
+        self.assertEqual(json_codec.literal(np.int64(2)), '2')
+        self.assertEqual(json_codec.dumps({'reward': np.float32(0.5), 'done': np.bool_(True)}),
+                         '{"reward": 0.5, "done": true}')
+
+        with self.assertRaises(TypeError):
+            json_codec.dumps(object())
+
+    @unittest.skipUnless(importlib.util.find_spec('orjson'), 'orjson is not installed')
+    def test_orjson_codec(self):
+        codec.use('orjson')
+        try:
+            observation = np.random.rand(3, 4).astype(np.float32)
+            transposed = observation.T
+            encoded = codec.dumps((observation, transposed, np.float32(0.5), {'lives': np.int64(3)}))
+            decoded = json.loads(encoded)
+
+            self.assertTrue(np.allclose(decoded[0], observation))
+            self.assertTrue(np.allclose(decoded[1], transposed))
+            self.assertEqual(decoded[2:], [0.5, {'lives': 3}])
+
+            instance_id = self.make_env('CartPole-v1')
+            api.reset(self.ws, instance_id)
+            self.assert_valid_state(json.loads(self.ws.send.call_args[0][0]))
+
+            api.step(self.ws, instance_id, 0)
+            observation, reward, done, info = json.loads(self.ws.send.call_args[0][0])
+            self.assertEqual(len(observation), 4)
+            self.assertEqual(reward, 1.0)
+        finally:
+            codec.use('json')
+
+    def rollout_from(self, instance_id, handle, actions):
+        api.restore_state(self.ws, instance_id, handle)
+        self.assertTrue(json.loads(self.ws.send.call_args[0][0]))
+        api.rollout(self.ws, instance_id, actions=actions)
+        return json.loads(self.ws.send.call_args[0][0])
+
+    def test_snapshots(self):
+        instance_id = self.make_env('CartPole-v1')
+        api.reset(self.ws, instance_id)
+        api.step(self.ws, instance_id, 0)
+
+        api.clone_state(self.ws, instance_id)
+        handle = self.ws.send.call_args[0][0]
+
+        # Branching twice from the same state gives the same trajectory
+        actions = [1, 0, 1, 1]
+        first = self.rollout_from(instance_id, handle, actions)
+        second = self.rollout_from(instance_id, handle, actions)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first[0], self.rollout_from(instance_id, handle, [0, 0, 0, 0])[0])
+
+        # Also into another instance of the same environment, wrappers included
+        other_id = self.make_env('CartPole-v1')
+        api.reset(self.ws, other_id)
+        self.assertEqual(self.rollout_from(other_id, handle, actions), first)
+        self.assertEqual(api.lookup_env(other_id)._elapsed_steps, 5)
+
+        with self.assertRaises(SnapshotNotFound):
+            api.restore_state(self.ws, instance_id, 'wrong')
+
+        with self.assertRaises(SnapshotNotFound):
+            api.restore_state(type(self.ws)(), instance_id, handle)
+
+        pendulum_id = self.make_env('Pendulum-v0')
+        with self.assertRaises(SnapshotNotFound):
+            api.restore_state(self.ws, pendulum_id, handle)
+
+        server.message_handle(self.ws, json.dumps({'method': 'restore_state',
+                                                   'params': {'instance_id': instance_id, 'handle': 'wrong'}}))
+        self.ws.close.assert_called_with((1007, 'Snapshot `wrong` not found'))
+
+        # Every request has its own proxy of the socket, see `protocol.Reply`
+        server.message_handle(self.ws, json.dumps({'method': 'clone_state', 'params': {'instance_id': instance_id}}))
+        proxied = self.ws.send.call_args[0][0]
+        server.message_handle(self.ws, json.dumps({'method': 'restore_state',
+                                                   'params': {'instance_id': instance_id, 'handle': proxied}}))
+        self.assertTrue(json.loads(self.ws.send.call_args[0][0]))
+
+        api.disconnect(self.ws)
+        with self.assertRaises(SnapshotNotFound):
+            snapshots.store.get(self.ws, handle)
+        self.assertEqual(len(snapshots.store.snapshots), 0)
+
+    def test_snapshots_env_workers(self):
+        workers.enabled = True
+        try:
+            instance_id = self.make_env('CartPole-v1')
+        finally:
+            workers.enabled = False
+
+        api.reset(self.ws, instance_id)
+        api.clone_state(self.ws, instance_id)
+        handle = self.ws.send.call_args[0][0]
+
+        first = self.rollout_from(instance_id, handle, [1, 1, 0])
+        self.assertEqual(self.rollout_from(instance_id, handle, [1, 1, 0]), first)
+
+    def test_snapshot_store(self):
+        with tempfile.TemporaryDirectory() as spill:
+            snapshots.configure(capacity=2, spill=spill)
+            try:
+                handles = [snapshots.store.put(self.ws, 'CartPole-v1', [index]) for index in range(4)]
+                self.assertEqual(list(snapshots.store.snapshots), handles[2:])
+                self.assertEqual(len(os.listdir(spill)), 2)
+
+                # Spilled snapshots are loaded back, evicting the least recently used
+                self.assertEqual(snapshots.store.get(self.ws, handles[0]), ('CartPole-v1', [0]))
+                self.assertEqual(list(snapshots.store.snapshots), [handles[3], handles[0]])
+
+                with self.assertRaises(SnapshotNotFound):
+                    snapshots.store.get(type(self.ws)(), handles[1])
+
+                snapshots.store.discard(self.ws)
+                self.assertEqual(os.listdir(spill), [])
+                with self.assertRaises(SnapshotNotFound):
+                    snapshots.store.get(self.ws, handles[1])
+            finally:
+                snapshots.configure()
+
+        snapshots.configure(capacity=1)
+        try:
+            first = snapshots.store.put(self.ws, 'CartPole-v1', [])
+            snapshots.store.put(self.ws, 'CartPole-v1', [])
+            with self.assertRaises(SnapshotNotFound):
+                snapshots.store.get(self.ws, first)
+        finally:
+            snapshots.configure()
+
+    def test_recording(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recording.directory, recording.chunk_size = directory, 4
+            try:
+                instance_id = self.make_env('CartPole-v1', record=True)
+                api.reset(self.ws, instance_id)
+                observations = [json.loads(self.ws.send.call_args[0][0])]
+
+                for action in [0, 1, 1, 0, 1, 0]:
+                    api.step(self.ws, instance_id, action)
+                    observations.append(json.loads(self.ws.send.call_args[0][0])[0])
+
+                api.close(self.ws, instance_id)
+                self.assertTrue(recording.flush(timeout=10))
+            finally:
+                recording.directory, recording.chunk_size = 'recordings', 1024
+
+            path = os.path.join(directory, instance_id)
+            with open(os.path.join(path, 'index.json')) as file:
+                self.assertEqual(json.load(file), {'shards': [4, 3], 'complete': True})
+            with open(os.path.join(path, 'meta.json')) as file:
+                meta = json.load(file)
+            self.assertEqual(meta['env_id'], 'CartPole-v1')
+            self.assertEqual(meta['columns']['observation'], {'shape': [4], 'dtype': '<f4'})
+
+            def column(name):
+                shards = [np.load(recording.shard_path(path, name, shard))[:rows] for shard, rows in enumerate([4, 3])]
+                return np.concatenate(shards)
+
+            self.assertTrue(np.allclose(column('observation'), observations))
+            self.assertEqual(column('action').tolist(), [0, 0, 1, 1, 0, 1, 0])
+            self.assertEqual(column('reward').tolist(), [0.0] + [1.0] * 6)
+            self.assertEqual(column('first').tolist(), [True] + [False] * 6)
+
+            with open(recording.shard_path(path, 'info', 1)) as file:
+                self.assertEqual([json.loads(line) for line in file], [{}, {}, {}])
+
+    def test_recording_snapshots(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recording.directory = directory
+            try:
+                instance_id = self.make_env('Pendulum-v0', record=True)
+                api.reset(self.ws, instance_id)
+                api.clone_state(self.ws, instance_id)
+                handle = self.ws.send.call_args[0][0]
+
+                api.step(self.ws, instance_id, [0.5])
+                api.restore_state(self.ws, instance_id, handle)
+                api.step(self.ws, instance_id, [-0.5])
+                api.close(self.ws, instance_id)
+                self.assertTrue(recording.flush(timeout=10))
+            finally:
+                recording.directory = 'recordings'
+
+            path = os.path.join(directory, instance_id)
+            self.assertEqual(np.load(recording.shard_path(path, 'first', 0))[:3].tolist(), [True, False, True])
+            self.assertEqual(np.load(recording.shard_path(path, 'action', 0))[:3].tolist(), [[0.0], [0.5], [-0.5]])
+
+        with self.assertRaises(TypeError):
+            recording.columns(gym.spaces.Tuple([gym.spaces.Discrete(2)]), gym.spaces.Discrete(2))
+
+    def test_replay(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recording.directory, recording.chunk_size = directory, 4
+            try:
+                trajectories = {}
+                for episodes in [1, 2]:
+                    instance_id = self.make_env('CartPole-v1', record=True)
+                    trajectory = trajectories[instance_id] = []
+
+                    for _ in range(episodes):
+                        api.reset(self.ws, instance_id)
+                        observation = json.loads(self.ws.send.call_args[0][0])
+
+                        for action in [0, 1, 0]:
+                            api.step(self.ws, instance_id, action)
+                            next_observation, reward, done, info = json.loads(self.ws.send.call_args[0][0])
+                            trajectory.append((observation, action, reward, next_observation, done))
+                            observation = next_observation
+
+                    api.close(self.ws, instance_id)
+
+                self.assertTrue(recording.flush(timeout=10))
+
+                # Sequential replays go through every transition in order, across shards
+                names = sorted(trajectories)
+                api.replay_open(self.ws, names, batch_size=4)
+                opened = json.loads(self.ws.send.call_args[0][0])
+                self.assertEqual(opened['transitions'], 9)
+
+                transitions = []
+                while True:
+                    api.replay_next(self.ws, opened['handle'])
+                    batch = json.loads(self.ws.send.call_args[0][0])
+                    if batch is None:
+                        break
+                    self.assertLessEqual(len(batch[0]), 4)
+                    transitions.extend(zip(*batch))
+
+                expected = [transition for name in names for transition in trajectories[name]]
+                self.assertEqual(len(transitions), len(expected))
+                for transition, (observation, action, reward, next_observation, done) in zip(transitions, expected):
+                    self.assertTrue(np.allclose(transition[0], observation))
+                    self.assertEqual(list(transition[1:3]), [action, reward])
+                    self.assertTrue(np.allclose(transition[3], next_observation))
+                    self.assertEqual(transition[4], done)
+
+                # Uniform replays sample across all the recordings, forever
+                api.set_encoding(self.ws, 'binary')
+                api.replay_open(self.ws, batch_size=64, sampling='uniform', seed=0)
+                handle = json.loads(self.ws.send.call_args[0][0])['handle']
+                api.replay_next(self.ws, handle)
+                header, observations = binary.decode(self.ws.send.call_args[0][0])
+
+                self.assertEqual(observations.shape, (2, 64, 4))
+                self.assertEqual(len(header['actions']), 64)
+                sampled = {tuple(np.round(observation, 5)) for observation in observations[1]}
+                recorded = {tuple(np.round(np.array(transition[3], dtype=np.float32), 5)) for transition in expected}
+                self.assertTrue(sampled <= recorded)
+                self.assertGreater(len(sampled), 4)
+
+                # Every request has its own proxy of the socket, see `protocol.Reply`
+                server.message_handle(self.ws, json.dumps({'method': 'replay_open',
+                                                           'params': {'batch_size': 8, 'sampling': 'uniform'}}))
+                handle = json.loads(self.ws.send.call_args[0][0])['handle']
+                server.message_handle(self.ws, json.dumps({'method': 'replay_next', 'params': {'handle': handle}}))
+                header, observations = binary.decode(self.ws.send.call_args[0][0])
+                self.assertEqual(observations.shape, (2, 8, 4))
+
+                with self.assertRaises(RecordingNotFound):
+                    api.replay_open(self.ws, ['../' + names[0]])
+                with self.assertRaises(ReplayNotFound):
+                    api.replay_next(type(self.ws)(), handle)
+
+                api.disconnect(self.ws)
+                with self.assertRaises(ReplayNotFound):
+                    api.replay_next(self.ws, handle)
+            finally:
+                recording.directory, recording.chunk_size = 'recordings', 1024
+
+    def decode_png(self, data):
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        chunks, offset = {}, 8
+        while offset < len(data):
+            length, tag = int.from_bytes(data[offset:offset + 4], 'big'), data[offset + 4:offset + 8]
+            chunks[tag] = data[offset + 8:offset + 8 + length]
+            offset += 12 + length
+
+        width, height = int.from_bytes(chunks[b'IHDR'][:4], 'big'), int.from_bytes(chunks[b'IHDR'][4:8], 'big')
+        rows = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype=np.uint8).reshape(height, -1)
+        return rows[:, 1:].reshape(height, width, -1)
+
+    def wait_for_frame(self, viewer, count=1):
+        for _ in range(100):
+            if viewer.send.call_count >= count:
+                break
+            time.sleep(0.01)
+        return binary.split(viewer.send.call_args[0][0])
+
+    def test_render_subscribe(self):
+        instance_id = self.make_env('ImageTest-v0')
+        api.reset(self.ws, instance_id)
+
+        # Viewers subscribe from their own connection
+        viewer = type(self.ws)()
+        viewer.send = MagicMock()
+        api.render_subscribe(viewer, instance_id, fps=1)
+        handle = viewer.send.call_args[0][0]
+
+        api.set_encoding(self.ws, 'binary')
+        api.step(self.ws, instance_id, 0)
+        header, observation = binary.decode(self.ws.send.call_args[0][0])
+
+        header, data = self.wait_for_frame(viewer, 2)
+        self.assertEqual((header['render'], header['instance_id'], header['format']), (handle, instance_id, 'png'))
+        self.assertEqual(header['shape'], [210, 160, 3])
+        self.assertTrue(np.array_equal(self.decode_png(bytes(data)), observation))
+
+        # Capped frame rate: the next step comes too soon for a new frame
+        api.step(self.ws, instance_id, 0)
+        time.sleep(0.05)
+        self.assertEqual(viewer.send.call_count, 2)
+
+        api.render_unsubscribe(viewer, handle)
+        self.assertTrue(json.loads(viewer.send.call_args[0][0]))
+        self.assertEqual(rendering.subscriptions, {})
+
+        with self.assertRaises(EncodingNotSupported):
+            api.render_subscribe(viewer, instance_id, format='gif')
+        with self.assertRaises(TypeError):
+            api.render_subscribe(viewer, instance_id, fps=0)
+
+    def test_render_delta(self):
+        instance_id = self.make_env('ImageTest-v0')
+        api.reset(self.ws, instance_id)
+        viewer = type(self.ws)()
+        viewer.send = MagicMock()
+        api.render_subscribe(viewer, instance_id, fps=60, format='delta')
+
+        frames = []
+        for count in [2, 3]:
+            rendering.subscriptions[instance_id][0].next_capture = 0
+            api.step(self.ws, instance_id, 0)
+            frames.append(api.lookup_env(instance_id).unwrapped.frame)
+            header, data = self.wait_for_frame(viewer, count)
+            self.assertEqual(header['key'], count == 2)
+            delta = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(header['shape'])
+            frame = delta if header['key'] else frame + delta
+
+        self.assertTrue(np.array_equal(frame, frames[-1]))
+
+        # Closing the instance ends its subscriptions
+        api.close(self.ws, instance_id)
+        self.assertEqual(rendering.subscriptions, {})
+
+    def test_render_drop(self):
+        instance_id = self.make_env('ImageTest-v0')
+        api.reset(self.ws, instance_id)
+        viewer = type(self.ws)()
+        viewer.send = MagicMock()
+        api.render_subscribe(viewer, instance_id, fps=60)
+        subscription = rendering.subscriptions[instance_id][0]
+
+        # Frames still on their way make the next ones drop, without rendering them
+        pending = []
+        rendering.spawn = lambda fn, *args: pending.append((fn, args))
+        try:
+            for _ in range(3):
+                subscription.next_capture = 0
+                api.step(self.ws, instance_id, 0)
+        finally:
+            rendering.spawn = spawn
+
+        self.assertEqual((len(pending), subscription.dropped), (1, 2))
+        fn, args = pending[0]
+        fn(*args)
+        header, data = binary.split(viewer.send.call_args[0][0])
+        self.assertEqual(header['dropped'], 2)
+        self.assertFalse(subscription.busy)
+
+        api.render_subscribe(Reply(viewer, {}), instance_id)
+        api.disconnect(viewer)
+        self.assertEqual(rendering.subscriptions, {})
+
+    def stalled_outbox(self, policy):
+        """Outbox of 10 bytes whose socket holds a first message until released"""
+        ws = type(self.ws)()
+        ws.close = MagicMock()
+        release = threading.Event()
+        sent = []
+
+        def send(message):
+            release.wait(5)
+            sent.append(message)
+
+        ws.send = send
+        box = outbox.Outbox(ws)
+        box.limit = 10
+        box.policy = policy
+
+        first = threading.Thread(target=box.send, args=(b'x' * 8,))
+        first.start()
+        while not box.queued:
+            time.sleep(0.001)
+
+        return box, release, sent, first
+
+    def test_outbox_block(self):
+        box, release, sent, first = self.stalled_outbox('block')
+        self.assertEqual(box, box.ws)
+        self.assertEqual(hash(box), hash(box.ws))
+
+        second = threading.Thread(target=box.send, args=(b'y' * 8,))
+        second.start()
+        time.sleep(0.05)
+        self.assertEqual((sent, box.queued), ([], 8))
+
+        release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual(sent, [b'x' * 8, b'y' * 8])
+        self.assertEqual((box.queued, box.high_water), (0, 8))
+
+        # Messages bigger than the queue go through when it's empty
+        self.assertTrue(box.send(b'z' * 20))
+        self.assertEqual(box.high_water, 20)
+        box.finish()
+        self.assertNotIn(box, list(outbox.outboxes))
+
+    def test_outbox_drop(self):
+        box, release, sent, first = self.stalled_outbox('drop')
+
+        # Render frames are dropped, responses wait
+        self.assertFalse(box.send(b'y' * 8, droppable=True))
+        second = threading.Thread(target=box.send, args=(b'z' * 8,))
+        second.start()
+
+        release.set()
+        first.join(5)
+        second.join(5)
+        self.assertEqual(sent, [b'x' * 8, b'z' * 8])
+
+        frames = metrics.render()
+        self.assertIn('gymie_send_queue_overflows_total{outcome="dropped"}', frames)
+        self.assertIn('gymie_send_queue_high_water_bytes', frames)
+
+    def test_outbox_disconnect(self):
+        box, release, sent, first = self.stalled_outbox('disconnect')
+
+        self.assertFalse(box.send(b'y' * 8))
+        box.ws.close.assert_called_once_with((1008, 'Send queue full'))
+        self.assertTrue(box.closed)
+
+        release.set()
+        first.join(5)
+        self.assertEqual(sent, [b'x' * 8])
+        self.assertFalse(box.send(b'z'))
+
+    def test_outbox_render(self):
+        instance_id = self.make_env('ImageTest-v0')
+        api.reset(self.ws, instance_id)
+        box, release, sent, first = self.stalled_outbox('drop')
+        subscription = rendering.subscribe(Reply(box, {}), instance_id, format='delta')
+        subscription.previous = np.zeros((210, 160, 3), dtype=np.uint8)
+
+        # A frame dropped by the send queue makes the next delta a key frame
+        subscription.deliver(np.zeros((210, 160, 3), dtype=np.uint8))
+        self.assertEqual((subscription.index, subscription.dropped), (0, 1))
+        self.assertIsNone(subscription.previous)
+        self.assertFalse(subscription.busy)
+
+        release.set()
+        first.join(5)
+
+    def test_scheduler_priority(self):
+        scheduler.configure(1)
+        self.addCleanup(scheduler.configure, None)
+        current = scheduler.scheduler
+        current.configure('high', priority=3)
+        order = []
+
+        # The only slot is taken while both connections queue their requests
+        blocker = current.enqueue('blocker', lambda: None)
+        self.assertTrue(blocker.dispatched)
+
+        def serve(owner):
+            with scheduler.turn(owner):
+                order.append(owner)
+
+        threads = [threading.Thread(target=serve, args=(owner,)) for owner in ['low'] * 4 + ['high'] * 8]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        self.assertEqual(current.queued(), {('1',): 4, ('3',): 8})
+
+        current.release()
+        for thread in threads:
+            thread.join(5)
+
+        # Three turns of the high priority connection for every one of the other
+        self.assertEqual(''.join(owner[0] for owner in order), 'hhhlhhhlhhll')
+        self.assertEqual((current.queued(), current.running), ({('1',): 0, ('3',): 0}, 0))
+        self.assertIn('gymie_scheduler_wait_seconds_count{priority="3"} 8', metrics.render())
+
+        current.discard('low')
+        self.assertEqual(set(current.sessions), {'blocker', 'high'})
+
+    def test_scheduler_rate(self):
+        scheduler.configure(4)
+        self.addCleanup(scheduler.configure, None)
+        scheduler.scheduler.configure('client', rate=50, burst=2)
+
+        started = time.monotonic()
+        for _ in range(7):
+            with scheduler.turn('client'):
+                pass
+
+        # A burst of two, then one every 20 ms
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        self.assertIn('gymie_scheduler_throttled_total{priority="1"}', metrics.render())
+
+    def test_scheduler_async(self):
+        scheduler.configure(1)
+        self.addCleanup(scheduler.configure, None)
+        scheduler.scheduler.configure('b', priority=2)
+        order = []
+
+        async def serve(owner):
+            current = await scheduler.async_turn(owner)
+            try:
+                order.append(owner)
+                await asyncio.sleep(0.001)
+            finally:
+                current.release()
+
+        async def run():
+            await asyncio.gather(*[serve(owner) for owner in ['a', 'a', 'a', 'b']])
+
+        asyncio.run(run())
+        self.assertEqual(order, ['a', 'b', 'a', 'a'])
+        self.assertEqual(scheduler.scheduler.running, 0)
+
+    def test_set_priority(self):
+        api.set_priority(self.ws, 2)
+        self.ws.send.assert_called_with('false')
+
+        scheduler.configure(2)
+        self.addCleanup(scheduler.configure, None)
+        api.set_priority(self.ws, 5, rate=10)
+        self.ws.send.assert_called_with('true')
+        self.assertEqual(scheduler.scheduler.session(self.ws).priority, 5)
+
+        server.message_handle(self.ws, '{"method": "set_priority", "params": {"priority": 0}}')
+        self.ws.close.assert_called_with((1007, 'Parameters `{\'priority\': 0}` are wrong'))
+
+        api.disconnect(self.ws)
+        self.assertEqual(scheduler.scheduler.sessions, {})
+
 
 if __name__ == '__main__':
     unittest.main()
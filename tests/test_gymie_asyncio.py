@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+import json
+import time
+import socket
+import struct
+import unittest
+import threading
+import gymie.api as api
+import gymie.aio as aio
+from gymie import bench, binary, client, rfc6455
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+port = free_port()
+threading.Thread(target=aio.start, args=('127.0.0.1', port), daemon=True).start()
+
+
+class Client():
+    """Minimal blocking WebSocket client"""
+
+    def __init__(self, path='/gym'):
+        for _ in range(50):
+            try:
+                self.sock = socket.create_connection(('127.0.0.1', port))
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.1)
+
+        self.sock.sendall(('GET {} HTTP/1.1\r\n'
+                           'Host: localhost\r\n'
+                           'Upgrade: websocket\r\n'
+                           'Connection: Upgrade\r\n'
+                           'Sec-WebSocket-Key: {}\r\n'
+                           'Sec-WebSocket-Version: 13\r\n\r\n').format(path, rfc6455.new_key()).encode())
+        self.file = self.sock.makefile('rb')
+        self.status = self.file.readline().decode()
+        while self.file.readline().strip():
+            pass
+
+    def request(self, method, **params):
+        message = json.dumps({'method': method, 'params': params})
+        self.sock.sendall(rfc6455.pack_frame(message, masked=True))
+        return self.receive()
+
+    def receive(self):
+        fin, opcode, masked, length = rfc6455.parse_header(self.file.read(2))
+        if length == 126:
+            (length,) = struct.unpack('!H', self.file.read(2))
+        elif length == 127:
+            (length,) = struct.unpack('!Q', self.file.read(8))
+        payload = self.file.read(length)
+
+        if opcode == rfc6455.CLOSE:
+            return rfc6455.parse_close(payload)
+        return payload.decode() if opcode == rfc6455.TEXT else payload
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class TestGymieAsyncio(unittest.TestCase):
+
+    def test_handshake(self):
+        client = Client()
+        self.assertTrue('101' in client.status)
+        client.close()
+
+    def test_plain_http(self):
+        client = Client('/')
+        self.assertTrue('200' in client.status)
+        self.assertEqual(client.file.read(), b'Gymie is running...')
+        client.close()
+
+        client = Client('/metrics')
+        self.assertTrue(b'# TYPE gymie_requests_total counter' in client.file.read())
+        client.close()
+
+    def test_step(self):
+        client = Client()
+        instance_id = client.request('make', env_id='CartPole-v1')
+        self.assertTrue(instance_id in api.envs)
+
+        state = json.loads(client.request('reset', instance_id=instance_id))
+        self.assertEqual(len(state), 4)
+
+        observation, reward, done, info = json.loads(client.request('step', instance_id=instance_id, action=0))
+        self.assertEqual(len(observation), 4)
+        self.assertEqual(reward, 1.0)
+
+        self.assertTrue(json.loads(client.request('set_encoding', encoding='binary')))
+        header, observation = binary.decode(client.request('step', instance_id=instance_id, action=1))
+        self.assertEqual(observation.shape, (4,))
+
+        self.assertTrue(json.loads(client.request('close', instance_id=instance_id)))
+        client.close()
+
+    def test_request_id(self):
+        client = Client()
+        message = json.dumps({'id': 3, 'method': 'make', 'params': {'env_id': 'CartPole-v1'}})
+        client.sock.sendall(rfc6455.pack_frame(message, masked=True))
+
+        tag, instance_id = client.receive().split('\n', 1)
+        self.assertEqual(json.loads(tag), {'id': 3})
+        self.assertTrue(instance_id in api.envs)
+        client.close()
+
+    def test_errors(self):
+        client = Client()
+        self.assertEqual(client.request('make', env_id='NotFound-v1'),
+                         (1007, 'Environment `NotFound-v1` not found'))
+        client.close()
+
+        client = Client()
+        client.sock.sendall(rfc6455.pack_frame('Wrong JSON', masked=True))
+        self.assertEqual(client.receive(), (1003, 'Message `Wrong JSON` is invalid'))
+        client.close()
+
+    def test_disconnect(self):
+        client = Client()
+        instance_id = client.request('make', env_id='CartPole-v1')
+        client.close()
+
+        for _ in range(50):
+            if instance_id not in api.envs:
+                break
+            time.sleep(0.1)
+
+        self.assertFalse(instance_id in api.envs)
+
+    def test_client(self):
+        gymie_client = client.Client('127.0.0.1', port)
+        instance_id = gymie_client.request('make', env_id='GymieBenchImage-v0')
+        self.assertEqual(len(json.loads(gymie_client.request('reset', instance_id=instance_id))), 210)
+        self.assertTrue(gymie_client.received > 210 * 160 * 3)
+
+        with self.assertRaises(client.ConnectionClosed):
+            gymie_client.request('step', instance_id='wrong', action=0)
+        gymie_client.close()
+
+    def test_bench(self):
+        result = bench.run('127.0.0.1', port, 'CartPole-v1', 2, 3, duration=0.3, warmup=0.1, encoding='binary')
+
+        self.assertEqual((result['clients'], result['instances']), (2, 3))
+        self.assertTrue(result['steps'] > 0)
+        self.assertTrue(result['steps_per_sec'] > 0)
+        self.assertTrue(result['latency_ms']['p50'] <= result['latency_ms']['p99'])
+        self.assertTrue(result['bytes_received'] > 0)
+        self.assertTrue(result['server_cpu_seconds'] is not None)
+        self.assertTrue('CartPole-v1' in bench.format_results([result]))
+
+
+if __name__ == '__main__':
+    unittest.main()
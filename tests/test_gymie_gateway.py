@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import unittest
+import subprocess
+import numpy as np
+import gymie.gateway as gateway
+from gymie import binary
+from gymie.bench import free_port, wait_for_server
+from gymie.client import Client, http_get
+from gymie.exceptions import ConnectionClosed
+
+
+def launch(*args):
+    return subprocess.Popen([sys.executable, '-m', 'gymie', '-l', '127.0.0.1'] + list(args),
+                            stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+def scrape(port, name):
+    lines = http_get('127.0.0.1', port, '/metrics').splitlines()
+    return sum(float(line.split()[-1]) for line in lines if line.startswith(name + '{'))
+
+
+class TestGymieGateway(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_ports = [free_port(), free_port()]
+        cls.port = free_port()
+        cls.processes = [launch('-p', str(port)) for port in cls.shard_ports]
+        shards = ['--shard=127.0.0.1:{}'.format(port) for port in cls.shard_ports]
+        cls.processes.append(launch('-p', str(cls.port), *shards))
+
+        for port in cls.shard_ports + [cls.port]:
+            wait_for_server('127.0.0.1', port)
+
+    @classmethod
+    def tearDownClass(cls):
+        for process in cls.processes:
+            process.terminate()
+            process.wait()
+
+    def test_make(self):
+        client = Client('127.0.0.1', self.port)
+        instance_ids = [client.request('make', env_id='CartPole-v1') for _ in range(4)]
+
+        # Least loaded shard first, so instances alternate
+        self.assertEqual(sorted(instance_id.split('-')[0] for instance_id in instance_ids), ['0', '0', '1', '1'])
+
+        for instance_id in instance_ids:
+            self.assertEqual(len(json.loads(client.request('reset', instance_id=instance_id))), 4)
+            observation, reward, done, info = json.loads(client.request('step', instance_id=instance_id, action=0))
+            self.assertEqual(reward, 1.0)
+
+        info = json.loads(client.request('action_space', instance_id=instance_ids[0]))
+        self.assertEqual(info, {'name': 'Discrete', 'n': 2})
+
+        self.assertTrue(json.loads(client.request('close', instance_id=instance_ids[0])))
+        with self.assertRaises(ConnectionClosed) as context:
+            client.request('reset', instance_id=instance_ids[0])
+        self.assertEqual(context.exception.args[0], 1007)
+        client.close()
+
+    def test_batch(self):
+        client = Client('127.0.0.1', self.port)
+        instance_ids = [client.request('make', env_id='CartPole-v1') for _ in range(3)]
+        self.assertEqual(len({instance_id.split('-')[0] for instance_id in instance_ids}), 2)
+
+        states = json.loads(client.request('reset_batch', instance_ids=instance_ids))
+        self.assertEqual(np.array(states).shape, (3, 4))
+
+        observations, rewards, dones, infos = json.loads(
+            client.request('step_batch', instance_ids=instance_ids, actions=[0, 1, 0]))
+        self.assertEqual(np.array(observations).shape, (3, 4))
+        self.assertEqual(rewards, [1.0, 1.0, 1.0])
+
+        self.assertTrue(json.loads(client.request('set_encoding', encoding='binary')))
+        header, observations = binary.decode(client.request('step_batch', instance_ids=instance_ids, actions=[1, 0, 1]))
+        self.assertEqual(observations.shape, (3, 4))
+        self.assertEqual(header['rewards'], [1.0, 1.0, 1.0])
+
+        header, observation = binary.decode(client.request('step', instance_id=instance_ids[0], action=0))
+        self.assertEqual(observation.shape, (4,))
+        client.close()
+
+    def test_request_id(self):
+        client = Client('127.0.0.1', self.port)
+        client.send(json.dumps({'id': 'a', 'method': 'make', 'params': {'env_id': 'CartPole-v1'}}))
+        tag, instance_id = client.receive().split('\n', 1)
+        self.assertEqual(json.loads(tag), {'id': 'a'})
+        self.assertTrue(instance_id[0] in '01')
+        client.close()
+
+    def test_errors(self):
+        client = Client('127.0.0.1', self.port)
+        with self.assertRaises(ConnectionClosed) as context:
+            client.request('make', env_id='NotFound-v1')
+        self.assertEqual(context.exception.args, (1007, 'Environment `NotFound-v1` not found'))
+
+        client = Client('127.0.0.1', self.port)
+        with self.assertRaises(ConnectionClosed) as context:
+            client.request('step', instance_id='7-wrong', action=0)
+        self.assertEqual(context.exception.args, (1007, 'Instance `7-wrong` not found'))
+
+        client = Client('127.0.0.1', self.port)
+        instance_id = client.request('make', env_id='CartPole-v1')
+        with self.assertRaises(ConnectionClosed) as context:
+            client.request('step', instance_id=instance_id, action='invalid_action')
+        self.assertEqual(context.exception.args, (1007, 'Action `invalid_action` is wrong'))
+
+    def test_disconnect(self):
+        client = Client('127.0.0.1', self.port)
+        for _ in range(2):
+            client.request('make', env_id='CartPole-v1')
+        client.close()
+
+        for _ in range(50):
+            if not sum(scrape(port, 'gymie_instances') for port in self.shard_ports):
+                break
+            time.sleep(0.1)
+
+        self.assertEqual(sum(scrape(port, 'gymie_instances') for port in self.shard_ports), 0)
+        self.assertEqual(scrape(self.port, 'gymie_gateway_instances'), 0)
+
+
+class TestSharding(unittest.TestCase):
+
+    def tearDown(self):
+        gateway.shards.clear()
+
+    def test_hash(self):
+        gateway.configure(['a:1', 'b:2', 'c:3'], 'hash')
+        chosen = {env_id: gateway.choose(env_id).address for env_id in ['CartPole-v1', 'Pong-v0', 'Ant-v2']}
+        self.assertEqual(chosen, {env_id: gateway.choose(env_id).address for env_id in chosen})
+
+        # Removing a shard only moves the keys it had
+        kept = {env_id: address for env_id, address in chosen.items() if address != 'c:3'}
+        gateway.configure(['a:1', 'b:2'], 'hash')
+        for env_id, address in kept.items():
+            self.assertEqual(gateway.choose(env_id).address, address)
+
+    def test_locate(self):
+        gateway.configure(['a:1', 'b:2'])
+        shard, instance_id = gateway.locate('1-abc')
+        self.assertEqual((shard.address, instance_id), ('b:2', 'abc'))
+
+        for wrong in ['abc', '2-abc', '1-', 'x-abc']:
+            with self.assertRaises(gateway.InstanceNotFound):
+                gateway.locate(wrong)
+
+    def test_merge(self):
+        first = json.dumps(([[1, 1], [3, 3]], [1.0, 3.0], [False, True], [{}, {'a': 3}]))
+        second = binary.encode(np.array([[2, 2]]), rewards=[2.0], dones=[False], infos=[{'a': 2}])
+        merged = gateway.merge(gateway.BATCH_FIELDS['step_batch'], [first, second], [[0, 2], [1]], 3)
+
+        self.assertEqual(json.loads(merged), [[[1, 1], [2, 2], [3, 3]],
+                                              [1.0, 2.0, 3.0],
+                                              [False, False, True],
+                                              [{}, {'a': 2}, {'a': 3}]])
+
+        first = binary.encode(np.array([[1, 1], [3, 3]]))
+        second = binary.encode(np.array([[2, 2]]))
+        header, states = binary.decode(gateway.merge((), [first, second], [[0, 2], [1]], 3))
+        self.assertEqual(states.tolist(), [[1, 1], [2, 2], [3, 3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
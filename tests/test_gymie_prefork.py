@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import signal
+import unittest
+import subprocess
+from gymie.bench import free_port, wait_for_server
+from gymie.client import Client
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as file:
+        return sorted(int(child) for child in file.read().split())
+
+
+@unittest.skipUnless(hasattr(os, 'fork') and os.path.exists(f'/proc/{os.getpid()}/task'), 'needs fork and /proc')
+class TestGymiePrefork(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.port = free_port()
+        cls.process = subprocess.Popen([sys.executable, '-m', 'gymie', '-l', '127.0.0.1',
+                                        '-p', str(cls.port), '--workers', '2'],
+                                       stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL)
+        wait_for_server('127.0.0.1', cls.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.process.terminate()
+        cls.process.wait()
+
+    def wait_for_workers(self, count):
+        for _ in range(100):
+            if len(children(self.process.pid)) == count:
+                break
+            time.sleep(0.1)
+        return children(self.process.pid)
+
+    def test_workers(self):
+        clients = [Client('127.0.0.1', self.port) for _ in range(8)]
+
+        for client in clients:
+            instance_id = client.request('make', env_id='CartPole-v1')
+            self.assertEqual(len(json.loads(client.request('reset', instance_id=instance_id))), 4)
+            observation, reward, done, info = json.loads(client.request('step', instance_id=instance_id, action=0))
+            self.assertEqual(reward, 1.0)
+
+        for client in clients:
+            client.close()
+
+    def test_restart(self):
+        workers = self.wait_for_workers(2)
+        self.assertEqual(len(workers), 2)
+
+        os.kill(workers[0], signal.SIGKILL)
+        for _ in range(100):
+            restarted = children(self.process.pid)
+            if len(restarted) == 2 and workers[0] not in restarted:
+                break
+            time.sleep(0.1)
+
+        self.assertEqual(len(restarted), 2)
+        self.assertNotIn(workers[0], restarted)
+        self.assertIn(workers[1], restarted)
+
+        # Clients still get served, by either worker
+        wait_for_server('127.0.0.1', self.port)
+        client = Client('127.0.0.1', self.port)
+        self.assertTrue(client.request('make', env_id='CartPole-v1'))
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
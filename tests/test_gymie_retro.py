@@ -50,6 +50,13 @@ class TestGymieRetro(TestBase):
         self.assertTrue(type(instance_id) == str)
         self.assertTrue(len(instance_id) == len(uuid.uuid4().hex))
     
+    def test_backend(self):
+        with self.assertRaises(EnvironmentNotFound):
+            api.make(self.ws, 'not_found', backend='retro')
+
+        instance_id = self.make_env('Airstriker-Genesis', backend='retro')
+        self.assertTrue(api.lookup_env(instance_id).gamename == 'Airstriker-Genesis')
+
     def test_lookup_env(self):
         instance_id = self.make_env('Airstriker-Genesis')
 
@@ -131,6 +138,25 @@ class TestGymieRetro(TestBase):
 
         self.assertEqual(np.array(action).shape, env.action_space.shape)
 
+    def test_clone_state(self):
+        instance_id = self.make_env('Airstriker-Genesis')
+        env = api.lookup_env(instance_id)
+        api.reset(self.ws, instance_id)
+
+        api.clone_state(self.ws, instance_id)
+        handle = self.ws.send.call_args[0][0]
+        actions = [env.action_space.sample().tolist() for _ in range(10)]
+
+        trajectories = []
+        for _ in range(2):
+            api.restore_state(self.ws, instance_id, handle)
+            self.assertTrue(json.loads(self.ws.send.call_args[0][0]))
+
+            api.rollout(self.ws, instance_id, actions=actions)
+            trajectories.append(json.loads(self.ws.send.call_args[0][0]))
+
+        self.assertEqual(trajectories[0], trajectories[1])
+
 
 if __name__ == '__main__':
     unittest.main()